@@ -3,6 +3,27 @@
 const { execSync } = require('child_process')
 const fs = require('fs')
 const path = require('path')
+const zlib = require('zlib')
+
+// Precompressed siblings (.br/.gz) that the backend serves as-is
+const COMPRESSIBLE = /\.(js|mjs|css|html|svg|json|txt|map|xml)$/
+
+function precompress(dir) {
+  for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+    const file = path.join(dir, entry.name)
+    if (entry.isDirectory()) {
+      precompress(file)
+      continue
+    }
+    if (!COMPRESSIBLE.test(entry.name)) continue
+    const data = fs.readFileSync(file)
+    if (data.length < 1024) continue
+    fs.writeFileSync(file + '.br', zlib.brotliCompressSync(data, {
+      params: { [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY }
+    }))
+    fs.writeFileSync(file + '.gz', zlib.gzipSync(data, { level: 9 }))
+  }
+}
 
 try {
   console.log('Building frontend...')
@@ -15,6 +36,8 @@ try {
   fs.mkdirSync(destDir, { recursive: true })
   fs.cpSync(srcDir, destDir, { recursive: true })
   console.log('Copied frontend dist to backend static assets')
+  precompress(destDir)
+  console.log('Wrote .br/.gz variants of static assets')
 } catch (err) {
   console.error(err)
   process.exit(1)
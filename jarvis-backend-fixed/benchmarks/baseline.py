@@ -0,0 +1,95 @@
+"""
+Baselines for the benchmark scripts
+
+A result is a nested dict of numbers. Saved baselines live in
+benchmarks/baselines/<name>.json; compare() flags every metric that got
+worse by more than the tolerance. Direction is taken from the metric name:
+*_ms / *_ns are lower-is-better timings, *_per_second higher-is-better
+throughput, and queries_per_request must not grow at all (it does not
+depend on the machine).
+"""
+
+import json
+import os
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+# queries_per_request is an average over a random mix; allow for that
+QUERY_SLACK = 0.5
+# Tail percentiles of a few hundred samples are reported but too noisy to gate on
+INFORMATIONAL = ('p99_ms',)
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def add_arguments(parser, name):
+    parser.add_argument('--baseline', default=baseline_path(name),
+                        help="baseline JSON to compare against (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="relative slowdown that counts as a regression (default: %(default)s)")
+    parser.add_argument('--output', help="also write this run's results to a JSON file")
+
+
+def _flatten(data, prefix=''):
+    flat = {}
+    for key, value in data.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    """Human-readable lines for every metric that regressed against baseline"""
+    current = _flatten(results)
+    regressions = []
+    for path, before in _flatten(baseline).items():
+        after = current.get(path)
+        if after is None:
+            continue
+        metric = path.rsplit('.', 1)[-1]
+        if metric in INFORMATIONAL:
+            continue
+        if metric == 'queries_per_request':
+            worse = after > before + QUERY_SLACK
+        elif metric.endswith(('_ms', '_ns')):
+            worse = before > 0 and after > before * (1 + tolerance)
+        elif metric.endswith('_per_second'):
+            worse = after < before * (1 - tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append(f"{path}: {before:,.3f} -> {after:,.3f}")
+    return regressions
+
+
+def finish(args, results):
+    """Save or compare per the command line; returns the process exit status"""
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as handle:
+            json.dump(results, handle, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    if baseline.get('params') != results.get('params'):
+        print("warning: baseline was recorded with different parameters")
+    regressions = compare(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        return 0
+    print(f"REGRESSIONS against {args.baseline} (tolerance {args.tolerance:.0%}):")
+    for line in regressions:
+        print(f"    {line}")
+    return 1
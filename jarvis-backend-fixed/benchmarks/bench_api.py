@@ -0,0 +1,243 @@
+"""
+Benchmark: API latency, throughput and queries per request under load
+
+Seeds --users users with --messages messages spread over
+--conversations-per-user conversations each, then runs --clients concurrent
+clients against the real WSGI app (in-process, fake provider). Each client
+is a seeded user doing a weighted mix of /api/auth/google,
+/api/conversations, /api/conversations/<id>/messages and /api/ai/chat.
+Reports p50/p95/p99 latency, requests/s and SQL queries per request per
+endpoint, and compares them against the stored baseline.
+
+    python benchmarks/bench_api.py [--users 10000] [--messages 1000000] [--clients 8]
+    python benchmarks/bench_api.py --save-baseline          # record a baseline
+    python benchmarks/bench_api.py --database-url postgresql://...  # empty database
+
+Exits with status 1 when a metric regressed beyond --tolerance.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import baseline
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# operation -> (Flask endpoint, weight in the mix)
+OPERATIONS = {
+    'login': ('auth.google_auth', 1),
+    'conversations': ('user.get_conversations', 3),
+    'messages': ('user.get_messages', 3),
+    'chat': ('ai.chat', 2),
+}
+SEED_BATCH = 10000
+
+
+def seed(engine, args, rng):
+    """Bulk-insert users, conversations and messages; returns users' emails and conversation ids"""
+    from models.conversation import Conversation, PREVIEW_LENGTH
+    from models.message import Message
+    from models.user import User
+    from services.fulltext import deferred_fulltext
+
+    started = datetime(2024, 1, 1)
+    conversation_total = args.users * args.conversations_per_user
+    per_conversation, extra = divmod(args.messages, conversation_total)
+    users, owned = [], {}
+    pending_conversations, pending_messages = [], []
+
+    def flush():
+        with engine.begin() as connection:
+            connection.execute(Conversation.__table__.insert(), pending_conversations)
+            with deferred_fulltext(connection, [row['id'] for row in pending_conversations]):
+                if pending_messages:
+                    connection.execute(Message.__table__.insert(), pending_messages)
+        pending_conversations.clear()
+        pending_messages.clear()
+
+    for start in range(0, args.users, SEED_BATCH):
+        rows = []
+        for n in range(start, min(start + SEED_BATCH, args.users)):
+            email = f'bench{n}@example.com'
+            rows.append({
+                'id': str(uuid.uuid4()), 'email': email, 'name': f'Bench {n}', 'google_id': email,
+                'credits': 1_000_000, 'credits_version': 0, 'is_active': True,
+                'created_at': started, 'last_login': started
+            })
+        with engine.begin() as connection:
+            connection.execute(User.__table__.insert(), rows)
+        users.extend(rows)
+
+    moment = started
+    for number, user in enumerate(users):
+        owned[user['email']] = []
+        for c in range(args.conversations_per_user):
+            index = number * args.conversations_per_user + c
+            count = per_conversation + (1 if index < extra else 0)
+            conversation_id = str(uuid.uuid4())
+            owned[user['email']].append(conversation_id)
+            content = None
+            for m in range(count):
+                moment += timedelta(seconds=1)
+                content = f"bericht {m} over de planning van morgen met het team, kamer {rng.randint(1, 40)}"
+                pending_messages.append({
+                    'id': str(uuid.uuid4()), 'conversation_id': conversation_id, 'content': content,
+                    'sender': 'user' if m % 2 == 0 else 'jarvis', 'credits_used': 0 if m % 2 == 0 else 2,
+                    'timestamp': moment
+                })
+            pending_conversations.append({
+                'id': conversation_id, 'user_id': user['id'], 'title': f'Gesprek {c}',
+                'created_at': started, 'updated_at': moment, 'message_count': count,
+                'last_message_preview': content[:PREVIEW_LENGTH] if content else None,
+                'summarized_count': 0
+            })
+            if len(pending_messages) >= SEED_BATCH:
+                flush()
+    if pending_conversations:
+        flush()
+    return owned
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_client(application, email, conversations, args, rng, samples, failures, warmup):
+    client = application.test_client()
+    response = client.post('/api/auth/google', json={'email': email, 'name': email.split('@')[0]})
+    headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+    names = list(OPERATIONS)
+    weights = [weight for _, weight in OPERATIONS.values()]
+
+    for n in range(warmup + args.requests):
+        operation = rng.choices(names, weights)[0]
+        conversation_id = rng.choice(conversations)
+        began = time.perf_counter()
+        if operation == 'login':
+            response = client.post('/api/auth/google', json={'email': email, 'name': email.split('@')[0]})
+        elif operation == 'conversations':
+            response = client.get('/api/conversations', headers=headers)
+        elif operation == 'messages':
+            response = client.get(f'/api/conversations/{conversation_id}/messages', headers=headers)
+        else:
+            response = client.post('/api/ai/chat', headers=headers, json={
+                'message': f'Wat staat er morgen op de planning, vraag {n}?', 'conversation_id': conversation_id
+            })
+        elapsed = time.perf_counter() - began
+        if n < warmup:
+            continue
+        if response.status_code != 200:
+            failures.append((operation, response.status_code))
+        else:
+            samples[operation].append(elapsed)
+
+
+def sql_queries_by_endpoint():
+    from services.metrics import snapshot
+
+    samples = snapshot().get('jarvis_http_request_sql_queries', {}).get('samples', {})
+    return {json.loads(key)['endpoint']: (value[1], value[2]) for key, value in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--conversations-per-user', type=int, default=5)
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients (threads)")
+    parser.add_argument('--requests', type=int, default=250, help="measured requests per client")
+    parser.add_argument('--warmup', type=int, default=20, help="unmeasured requests per client")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--database-url', help="use this (empty) database instead of a temporary SQLite file")
+    baseline.add_arguments(parser, 'api')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-api-')
+    os.environ.update(
+        DATABASE_URL=args.database_url or 'sqlite:///' + os.path.join(workdir, 'jarvis.db'),
+        VECTOR_INDEX_ENABLED='false',
+        RATE_LIMIT_ENABLED='false',
+        LOG_LEVEL='WARNING'
+    )
+    os.environ.pop('METRICS_DIR', None)
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    sys.path.insert(0, ROOT)
+    from wsgi import application
+    from extensions import db
+    from models.user import User
+
+    try:
+        rng = random.Random(args.seed)
+        with application.app_context():
+            if db.session.query(User.id).first() is not None:
+                parser.error("the database already has users; point --database-url at an empty database")
+            began = time.perf_counter()
+            owned = seed(db.engine, args, rng)
+            db.session.remove()
+        print(f"seeded {args.users:,} users, {args.messages:,} messages in {time.perf_counter() - began:.1f} s "
+              f"({application.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0]})")
+
+        samples = {operation: [] for operation in OPERATIONS}
+        failures = []
+        clients = rng.sample(sorted(owned), args.clients)
+        queries_before = sql_queries_by_endpoint()
+        threads = [
+            threading.Thread(target=run_client, args=(
+                application, email, owned[email], args, random.Random(args.seed + n), samples, failures, args.warmup
+            ))
+            for n, email in enumerate(clients)
+        ]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        queries_after = sql_queries_by_endpoint()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    measured = sum(len(values) for values in samples.values())
+    results = {
+        'params': {key: getattr(args, key) for key in ('users', 'messages', 'conversations_per_user', 'clients', 'requests', 'seed')},
+        'database': application.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        # Includes warmup requests, which run concurrently with measured ones
+        'total': {'requests_per_second': round((measured + len(failures)) / elapsed, 1) if elapsed else 0.0},
+        'endpoints': {}
+    }
+    print(f"\n{'operation':14}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    for operation, (endpoint, _) in OPERATIONS.items():
+        ordered = sorted(samples[operation])
+        total_before, count_before = queries_before.get(endpoint, (0, 0))
+        total_after, count_after = queries_after.get(endpoint, (0, 0))
+        requests = count_after - count_before
+        entry = {
+            'requests': len(ordered),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+            'queries_per_request': round((total_after - total_before) / requests, 2) if requests else 0.0
+        }
+        results['endpoints'][operation] = entry
+        print(f"{operation:14}{entry['requests']:>9}{entry['p50_ms']:>9.1f}{entry['p95_ms']:>9.1f}"
+              f"{entry['p99_ms']:>9.1f}{entry['queries_per_request']:>9.2f}")
+    print(f"\n{results['total']['requests_per_second']:.1f} requests/s over {elapsed:.1f} s, "
+          f"{len(failures)} failures")
+    if failures:
+        print(f"    first failures: {failures[:5]}")
+    sys.exit(baseline.finish(args, results))
+
+
+if __name__ == '__main__':
+    main()
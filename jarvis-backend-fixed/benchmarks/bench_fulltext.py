@@ -0,0 +1,151 @@
+"""
+Benchmark: full-text message search latency
+
+Seeds --messages synthetic messages over --users users (through the
+regular insert path, so the index triggers do the indexing), then times
+GET /api/conversations/search style queries via search_message_history
+for common, rare, multi-word and prefix terms, against the LIKE scan it
+replaces.
+
+    python benchmarks/bench_fulltext.py [--messages 10000000] [--users 1000]
+    python benchmarks/bench_fulltext.py --database-url postgresql://... (tsvector / GIN)
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+COMMON = "de het een ik u wij graag morgen vandaag over voor met op in naar van en is dat niet".split()
+TOPICS = (
+    "afspraak agenda tandarts klant rapport project vergadering email factuur offerte "
+    "budget planning deadline presentatie contract team kwartaal notulen reis hotel"
+).split()
+RARE = [f"term{n:05d}" for n in range(20000)]
+
+
+def synthetic_message(rng):
+    words = rng.choices(COMMON, k=rng.randint(5, 20))
+    words += rng.choices(TOPICS, k=rng.randint(1, 3))
+    words += [rng.choice(RARE)]
+    rng.shuffle(words)
+    return ' '.join(words)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f"p50 {pick(0.50):8.2f} ms  p95 {pick(0.95):8.2f} ms  p99 {pick(0.99):8.2f} ms"
+
+
+def seed(engine, args, rng):
+    from models.conversation import Conversation
+    from models.message import Message
+    from models.user import User
+
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    conversations = []
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {'id': user_id, 'email': f'{user_id}@bench', 'name': 'bench', 'google_id': user_id}
+            for user_id in users
+        ])
+        for user_id in users:
+            for _ in range(args.conversations):
+                conversations.append((str(uuid.uuid4()), user_id))
+        connection.execute(Conversation.__table__.insert(), [
+            {'id': conversation_id, 'user_id': user_id, 'title': 'bench'}
+            for conversation_id, user_id in conversations
+        ])
+
+    started = datetime(2024, 1, 1)
+    began = time.perf_counter()
+    for offset in range(0, args.messages, args.batch):
+        count = min(args.batch, args.messages - offset)
+        with engine.begin() as connection:
+            connection.execute(Message.__table__.insert(), [
+                {
+                    'id': str(uuid.uuid4()),
+                    'conversation_id': rng.choice(conversations)[0],
+                    'content': synthetic_message(rng),
+                    'sender': 'user',
+                    'credits_used': 0,
+                    'timestamp': started + timedelta(seconds=offset + n)
+                }
+                for n in range(count)
+            ])
+        done = offset + count
+        if done % (args.batch * 20) == 0 or done == args.messages:
+            rate = done / (time.perf_counter() - began)
+            print(f"  seeded {done:>12,} messages ({rate:,.0f}/s)", flush=True)
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--conversations', type=int, default=10, help="per user")
+    parser.add_argument('--batch', type=int, default=20_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--like-queries', type=int, default=5)
+    parser.add_argument('--database-url', help="default: a temporary SQLite file")
+    args = parser.parse_args()
+
+    workdir = None
+    if not args.database_url:
+        workdir = tempfile.mkdtemp(prefix='bench-fulltext-')
+        args.database_url = 'sqlite:///' + os.path.join(workdir, 'jarvis.db')
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['VECTOR_INDEX_ENABLED'] = 'false'
+
+    from main import app
+    from extensions import db
+    from services.fulltext import _FALLBACK_SEARCH, search_message_history
+    from sqlalchemy import text
+
+    rng = random.Random(42)
+    with app.app_context():
+        print(f"{db.engine.dialect.name}: seeding {args.messages:,} messages for {args.users} users")
+        users = seed(db.engine, args, rng)
+
+        cases = {
+            'common word': lambda: rng.choice(TOPICS),
+            'rare word': lambda: rng.choice(RARE),
+            'two words': lambda: f"{rng.choice(TOPICS)} {rng.choice(TOPICS)}",
+            'prefix': lambda: rng.choice(TOPICS)[:4] + '*'
+        }
+        for label, make_query in cases.items():
+            search_message_history(users[0], make_query())  # warm up
+            samples = []
+            for _ in range(args.queries):
+                user_id, query = rng.choice(users), make_query()
+                began = time.perf_counter()
+                search_message_history(user_id, query, limit=20)
+                samples.append(time.perf_counter() - began)
+            print(f"  index {label:12} {percentiles(samples)}")
+
+        statement = text(_FALLBACK_SEARCH.format(conditions="lower(m.content) LIKE :term0"))
+        samples = []
+        for _ in range(args.like_queries):
+            began = time.perf_counter()
+            db.session.execute(statement, {
+                'user_id': rng.choice(users), 'term0': f'%{rng.choice(RARE)}%', 'limit': 21, 'offset': 0
+            }).all()
+            samples.append(time.perf_counter() - began)
+        print(f"  LIKE  {'rare word':12} {percentiles(samples)}")
+
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: streaming history export and bulk import
+
+Seeds one user with --messages messages over --conversations conversations,
+then streams GET /api/conversations/export (NDJSON and gzip) through the
+in-process WSGI app on a SQLite file database and imports the gzip file for a
+second user the way `flask history import` does (the API endpoint is capped
+well below this size). Reports rows/s, output
+size and the peak RSS growth while exporting.
+
+    python benchmarks/bench_history.py [--messages 1000000] [--conversations 2000]
+"""
+
+import argparse
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def seed(engine, user_id, args, rng):
+    from models.conversation import Conversation
+    from models.message import Message
+
+    conversations = [str(uuid.uuid4()) for _ in range(args.conversations)]
+    with engine.begin() as connection:
+        connection.execute(Conversation.__table__.insert(), [
+            {'id': conversation_id, 'user_id': user_id, 'title': 'bench', 'message_count': 0}
+            for conversation_id in conversations
+        ])
+    started = datetime(2024, 1, 1)
+    for offset in range(0, args.messages, 10000):
+        count = min(10000, args.messages - offset)
+        with engine.begin() as connection:
+            connection.execute(Message.__table__.insert(), [
+                {
+                    'id': str(uuid.uuid4()),
+                    'conversation_id': rng.choice(conversations),
+                    'content': f"bericht {offset + n} over de planning van morgen met het team",
+                    'sender': 'user' if n % 2 else 'jarvis',
+                    'credits_used': 0,
+                    'timestamp': started + timedelta(seconds=offset + n)
+                }
+                for n in range(count)
+            ])
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--conversations', type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-history-')
+    os.environ.update(
+        DATABASE_URL='sqlite:///' + os.path.join(workdir, 'jarvis.db'),
+        VECTOR_INDEX_ENABLED='false',
+        RATE_LIMIT_ENABLED='false',
+        LOG_LEVEL='WARNING'
+    )
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    sys.path.insert(0, ROOT)
+    from wsgi import application
+    from extensions import db
+    from services.history import import_lines, read_lines
+
+    try:
+        client = application.test_client()
+        tokens = {}
+        for name in ('source', 'target'):
+            response = client.post('/api/auth/google', json={'email': f'{name}@example.com', 'name': name})
+            tokens[name] = response.get_json()
+        with application.app_context():
+            began = time.perf_counter()
+            seed(db.engine, tokens['source']['user']['id'], args, random.Random(7))
+        print(f"seeded {args.messages:,} messages in {time.perf_counter() - began:.1f} s")
+
+        headers = {'Authorization': f"Bearer {tokens['source']['token']}"}
+        gz_path = os.path.join(workdir, 'export.ndjson.gz')
+        for fmt in ('ndjson', 'gzip'):
+            rss_before = max_rss_mb()
+            began = time.perf_counter()
+            size = 0
+            response = client.get(f'/api/conversations/export?format={fmt}', headers=headers, buffered=False)
+            with open(gz_path if fmt == 'gzip' else os.devnull, 'wb') as handle:
+                for chunk in response.response:
+                    size += len(chunk)
+                    handle.write(chunk)
+            response.close()
+            elapsed = time.perf_counter() - began
+            print(f"export {fmt:6}  {elapsed:6.2f} s  {args.messages / elapsed:10,.0f} messages/s  "
+                  f"{size / 1e6:8.1f} MB  peak RSS +{max_rss_mb() - rss_before:.0f} MB")
+
+        began = time.perf_counter()
+        with application.app_context(), open(gz_path, 'rb') as handle:
+            imported = import_lines(tokens['target']['user']['id'], read_lines(handle))
+        elapsed = time.perf_counter() - began
+        print(f"import gzip    {elapsed:6.2f} s  {imported['messages'] / elapsed:10,.0f} messages/s  "
+              f"({imported['conversations']:,} conversations, {imported['messages']:,} messages)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
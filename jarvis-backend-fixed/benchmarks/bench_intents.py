@@ -0,0 +1,100 @@
+"""
+Micro-benchmark: intent classification throughput
+
+Compares the compiled IntentRouter with the previous nested substring
+scans, for messages of 10 to 10k characters, on the default routing
+table and on a table grown to --extra synthetic intents.
+
+    python benchmarks/bench_intents.py [--extra 200] [--seconds 0.5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from services.intents import IntentRouter
+from services.jarvis import DEFAULT_INTENTS
+
+SIZES = [10, 100, 1000, 10000]
+# Filler words that contain no trigger; every other message gets one keyword planted
+VOCABULARY = "de het een ik u wij graag morgen vandaag rapport project klant vergadering over voor met".split()
+
+
+def nested_scan(intents):
+    """The pre-router algorithm: one substring scan per keyword, in order"""
+    def classify(message):
+        message_lower = message.lower()
+        for intent in intents:
+            if any(trigger in message_lower for trigger in intent['triggers']):
+                requires = intent.get('requires')
+                if not requires:
+                    return intent
+                for keyword in requires:
+                    if keyword in message_lower:
+                        return intent
+        return None
+    return classify
+
+
+def synthetic_intents(count, rng):
+    intents = list(DEFAULT_INTENTS['intents'])
+    for i in range(count):
+        triggers = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(5, 10))) for _ in range(3)]
+        intents.append({"name": f"synthetic_{i}", "triggers": triggers, "response": "..."})
+    return intents
+
+
+def make_messages(size, rng, keywords, count=50):
+    messages = []
+    for i in range(count):
+        words = []
+        while sum(len(word) + 1 for word in words) < size:
+            words.append(rng.choice(VOCABULARY))
+        if i % 2:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        messages.append(' '.join(words))
+    return messages
+
+
+def throughput(classify, messages, seconds):
+    done = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for message in messages:
+            classify(message)
+        done += len(messages)
+    return done / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--extra', type=int, default=200, help="synthetic intents for the large table")
+    parser.add_argument('--seconds', type=float, default=0.5, help="time per measurement")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    tables = [
+        ("default", DEFAULT_INTENTS['intents']),
+        (f"+{args.extra} intents", synthetic_intents(args.extra, rng))
+    ]
+
+    print(f"{'table':<16}{'chars':>8}{'nested msg/s':>16}{'router msg/s':>16}{'speedup':>10}")
+    for label, intents in tables:
+        router = IntentRouter(intents)
+        legacy = nested_scan(intents)
+        keywords = sorted(router.implied)
+        for size in SIZES:
+            messages = make_messages(size, rng, keywords)
+            assert all(router.classify(m)[0] is legacy(m) for m in messages)
+            old = throughput(legacy, messages, args.seconds)
+            new = throughput(router.classify, messages, args.seconds)
+            print(f"{label:<16}{size:>8}{old:>16,.0f}{new:>16,.0f}{new / old:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
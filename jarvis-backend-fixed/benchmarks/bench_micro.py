@@ -0,0 +1,103 @@
+"""
+Micro-benchmark: get_jarvis_response and the model to_dict serializers
+
+Times each case with timeit (best of --repeat runs of about 0.2 s each) and
+reports nanoseconds per call, then compares against the stored baseline.
+The serializers run on fully populated instances, as the list endpoints
+see them after loading a page.
+
+    python benchmarks/bench_micro.py [--repeat 5]
+    python benchmarks/bench_micro.py --save-baseline
+
+Exits with status 1 when a case regressed beyond --tolerance.
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+import baseline
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from models.conversation import Conversation
+from models.message import Message
+from models.user import User
+from services.jarvis import get_jarvis_response
+
+PAGE = 50
+MESSAGES = [
+    "Hoi Jarvis",
+    "Kun je mijn email van vandaag samenvatten?",
+    "Plan een vergadering met het team voor morgen om tien uur",
+    "Wat staat er deze week in mijn agenda?",
+    "Zoek het document over het klantproject " + "met alle details " * 20,
+    "Vertel eens iets leuks over de planning van morgen",
+]
+
+
+def make_models(rng):
+    now = datetime(2024, 1, 1)
+    user = User(
+        id=str(uuid.uuid4()), email='bench@example.com', name='Bench', google_id='bench@example.com',
+        credits=500, credits_version=3, is_active=True, created_at=now, last_login=now
+    )
+    conversations = [
+        Conversation(
+            id=str(uuid.uuid4()), user_id=user.id, title=f'Gesprek {n}', created_at=now,
+            updated_at=now + timedelta(minutes=n), message_count=rng.randint(1, 400),
+            last_message_preview='Natuurlijk meneer, ik heb de vergadering ingepland.'
+        )
+        for n in range(PAGE)
+    ]
+    messages = [
+        Message(
+            id=str(uuid.uuid4()), conversation_id=conversations[0].id, sender='user' if n % 2 == 0 else 'jarvis',
+            content=rng.choice(MESSAGES), credits_used=0 if n % 2 == 0 else 2, timestamp=now + timedelta(seconds=n)
+        )
+        for n in range(PAGE)
+    ]
+    return user, conversations, messages
+
+
+def time_ns(function, repeat):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    baseline.add_arguments(parser, 'micro')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    user, conversations, messages = make_models(rng)
+    response_rng = random.Random(1)
+    cases = {
+        'get_jarvis_response': lambda: [get_jarvis_response(message, 'meneer', response_rng) for message in MESSAGES],
+        'user_to_dict': user.to_dict,
+        'conversation_to_dict': conversations[0].to_dict,
+        'message_to_dict': messages[0].to_dict,
+        f'conversation_page_{PAGE}': lambda: [conversation.to_dict() for conversation in conversations],
+        f'message_page_{PAGE}': lambda: [message.to_dict() for message in messages],
+    }
+
+    results = {'params': {'repeat': args.repeat}, 'cases': {}}
+    print(f"{'case':<26}{'ns/call':>14}")
+    for name, function in cases.items():
+        nanoseconds = time_ns(function, args.repeat)
+        if name == 'get_jarvis_response':
+            nanoseconds /= len(MESSAGES)
+        results['cases'][name] = {'call_ns': round(nanoseconds, 1)}
+        print(f"{name:<26}{nanoseconds:>14,.0f}")
+    sys.exit(baseline.finish(args, results))
+
+
+if __name__ == '__main__':
+    main()
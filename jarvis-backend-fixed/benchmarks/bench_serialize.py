@@ -0,0 +1,130 @@
+"""
+Benchmark: rows serialized per second by the message and conversation list paths
+
+Seeds one user with --rows conversations and a conversation of --rows
+messages, then times one page of each, fetch plus encoding, three ways:
+
+    orm_jsonify    ORM instances, to_dict() per row, Flask's jsonify (the old path)
+    tuples_json    column tuples through services.serializer, stdlib encoder
+    tuples_orjson  column tuples through services.serializer, orjson (if installed)
+
+and the same three without the query (encode_*), to separate fetch from
+encoding. Reports rows per second for each.
+
+    python benchmarks/bench_serialize.py [--rows 200] [--repeat 5]
+    python benchmarks/bench_serialize.py --save-baseline
+
+Exits with status 1 when a case regressed beyond --tolerance.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+import baseline
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONTENT = "Natuurlijk meneer, ik heb de vergadering met het team voor morgen om tien uur ingepland. " * 3
+
+
+def rows_per_second(function, rows, repeat):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return rows / (min(timer.repeat(repeat=repeat, number=number)) / number)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200, help="rows per page (the API allows up to 200)")
+    parser.add_argument('--repeat', type=int, default=5)
+    baseline.add_arguments(parser, 'serialize')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-serialize-')
+    os.environ.update(
+        DATABASE_URL='sqlite:///' + os.path.join(workdir, 'jarvis.db'),
+        VECTOR_INDEX_ENABLED='false',
+        LOG_LEVEL='WARNING'
+    )
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    sys.path.insert(0, ROOT)
+    from flask import jsonify
+    from wsgi import application
+    from extensions import db
+    from models.conversation import Conversation, LIST_COLUMNS as CONVERSATION_COLUMNS, LIST_FIELDS as CONVERSATION_FIELDS
+    from models.message import Message, LIST_COLUMNS as MESSAGE_COLUMNS, LIST_FIELDS as MESSAGE_FIELDS
+    from models.user import User
+    from services import serializer
+
+    started = datetime(2024, 1, 1)
+    user_id, conversation_id = str(uuid.uuid4()), str(uuid.uuid4())
+    with application.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(User.__table__.insert(), [{
+                'id': user_id, 'email': 'bench@example.com', 'name': 'Bench', 'google_id': 'bench@example.com',
+                'credits': 500, 'credits_version': 0, 'is_active': True, 'created_at': started, 'last_login': started
+            }])
+            connection.execute(Conversation.__table__.insert(), [{
+                'id': conversation_id if n == 0 else str(uuid.uuid4()), 'user_id': user_id, 'title': f'Gesprek {n}',
+                'created_at': started, 'updated_at': started + timedelta(minutes=n), 'message_count': args.rows,
+                'last_message_preview': CONTENT[:120]
+            } for n in range(args.rows)])
+            connection.execute(Message.__table__.insert(), [{
+                'id': str(uuid.uuid4()), 'conversation_id': conversation_id, 'content': CONTENT,
+                'sender': 'user' if n % 2 == 0 else 'jarvis', 'credits_used': 0 if n % 2 == 0 else 2,
+                'timestamp': started + timedelta(seconds=n)
+            } for n in range(args.rows)])
+
+    def pages(model, columns, filter_column, value, order_column):
+        def instances():
+            return model.query.filter(filter_column == value).order_by(order_column, model.id).limit(args.rows).all()
+
+        def tuples():
+            return db.session.query(*columns).filter(filter_column == value).order_by(order_column, model.id) \
+                .limit(args.rows).all()
+        return instances, tuples
+
+    lists = {
+        'messages': (MESSAGE_FIELDS, *pages(Message, MESSAGE_COLUMNS, Message.conversation_id, conversation_id,
+                                            Message.timestamp)),
+        'conversations': (CONVERSATION_FIELDS, *pages(Conversation, CONVERSATION_COLUMNS, Conversation.user_id,
+                                                      user_id, Conversation.updated_at)),
+    }
+    orjson = serializer._orjson
+    backends = {'json': None, 'orjson': orjson} if orjson is not None else {'json': None}
+
+    results = {'params': {'rows': args.rows, 'repeat': args.repeat}, 'cases': {}}
+    print(f"{'case':<36}{'rows/s':>14}")
+    with application.test_request_context():
+        for name, (fields, instances, tuples) in lists.items():
+            loaded, rows = instances(), tuples()
+            cases = {
+                'orm_jsonify': lambda: jsonify({name: [row.to_dict() for row in instances()]}).get_data(),
+                'encode_orm_jsonify': lambda: jsonify({name: [row.to_dict() for row in loaded]}).get_data(),
+            }
+            for backend, module in backends.items():
+                def fetched(module=module):
+                    serializer._orjson = module
+                    return b''.join(serializer.page_response(name, fields, tuples(), {}).response)
+
+                def encoded(module=module):
+                    serializer._orjson = module
+                    return b''.join(serializer.page_response(name, fields, rows, {}).response)
+                cases[f'tuples_{backend}'] = fetched
+                cases[f'encode_tuples_{backend}'] = encoded
+
+            for case, function in cases.items():
+                rate = rows_per_second(function, args.rows, args.repeat)
+                results['cases'][f'{name}_{case}'] = {'rows_per_second': round(rate)}
+                print(f"{f'{name}_{case}':<36}{rate:>14,.0f}")
+                db.session.rollback()
+    serializer._orjson = orjson
+    sys.exit(baseline.finish(args, results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: vector index build and query latency
+
+Embeds --vectors synthetic messages with the local HashEmbedder (no
+network), spread over --users owners, adds them in indexer-sized batches
+and reports query latency percentiles for user-scoped searches (what
+/api/ai/search and chat context do) and for searches over the whole index.
+
+    python benchmarks/bench_vector_index.py [--vectors 1000000] [--users 1000] [--backend flat|chroma]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from services.embeddings import HashEmbedder
+from services.vector_index import create_index
+
+VOCABULARY = (
+    "afspraak agenda tandarts klant rapport project vergadering email factuur offerte "
+    "budget planning deadline presentatie contract team kwartaal notulen reis hotel "
+    "vlucht lunch diner verjaardag cadeau bestand document map spreadsheet taak"
+).split()
+FILLER = "de het een ik u wij graag morgen vandaag over voor met op in naar van".split()
+
+
+def synthetic_message(rng):
+    words = rng.choices(FILLER, k=rng.randint(4, 12)) + rng.choices(VOCABULARY, k=rng.randint(1, 4))
+    rng.shuffle(words)
+    return ' '.join(words)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f"p50 {pick(0.50):7.2f} ms  p95 {pick(0.95):7.2f} ms  p99 {pick(0.99):7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vectors', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=10_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--backend', default='flat', choices=['flat', 'chroma'])
+    parser.add_argument('--path', help="index directory (default: a temporary one)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    path = args.path or tempfile.mkdtemp(prefix='bench-vectors-')
+    embedder = HashEmbedder()
+    index = create_index(path, backend=args.backend, dim=embedder.dim)
+    owners = [f"user-{n}" for n in range(args.users)]
+
+    embed_time = add_time = 0.0
+    for start in range(0, args.vectors, args.batch):
+        count = min(args.batch, args.vectors - start)
+        texts = [synthetic_message(rng) for _ in range(count)]
+        began = time.perf_counter()
+        vectors = embedder.embed_batch(texts)
+        embed_time += time.perf_counter() - began
+
+        began = time.perf_counter()
+        index.add(
+            [f"message:{start + n}" for n in range(count)],
+            [rng.choice(owners) for _ in range(count)],
+            vectors
+        )
+        add_time += time.perf_counter() - began
+    print(f"{index.name} index, {len(index):,} vectors, dim {embedder.dim}, {args.users} users")
+    print(f"  embed   {args.vectors / embed_time:12,.0f} messages/s")
+    print(f"  index   {args.vectors / add_time:12,.0f} vectors/s")
+
+    queries = [embedder.embed(synthetic_message(rng)) for _ in range(args.queries)]
+    for label, owner in (("per user", True), ("global", False)):
+        index.search(queries[0], args.k, owner=owners[0] if owner else None)  # warm up
+        samples = []
+        for vector in queries:
+            began = time.perf_counter()
+            index.search(vector, args.k, owner=rng.choice(owners) if owner else None)
+            samples.append(time.perf_counter() - began)
+        print(f"  search {label:9} {percentiles(samples)}")
+
+    if not args.path:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: workspace snapshot refresh cost against mailbox size and changes
+
+For each --sizes mailbox (messages in the fake Gmail source, plus its
+calendar) times a full sync, then incremental refreshes after --changes
+simulated changes each, and the snapshot read the analytics endpoints do.
+An incremental refresh should cost about the same for every mailbox size
+and grow with the number of changes; the snapshot read should stay flat.
+
+    python benchmarks/bench_workspace.py [--sizes 1000,10000,50000] [--changes 10,100,1000]
+    python benchmarks/bench_workspace.py --save-baseline
+
+Exits with status 1 when a timing regressed beyond --tolerance.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import baseline
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+READS = 200
+
+
+def numbers(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=numbers, default=[1000, 10000, 50000], help="messages per mailbox")
+    parser.add_argument('--changes', type=numbers, default=[10, 100, 1000], help="changes per refresh")
+    parser.add_argument('--repeat', type=int, default=3, help="refreshes timed per change count (median)")
+    baseline.add_arguments(parser, 'workspace')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-workspace-')
+    os.environ.update(
+        DATABASE_URL='sqlite:///' + os.path.join(workdir, 'jarvis.db'),
+        VECTOR_INDEX_ENABLED='false',
+        WORKSPACE_REFRESH_INTERVAL='1000000',
+        LOG_LEVEL='WARNING'
+    )
+    os.environ.pop('METRICS_DIR', None)
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    sys.path.insert(0, ROOT)
+    from wsgi import application
+    from extensions import db
+    from models.user import User
+    from services.workspace import refresh, snapshot
+    from services.workspace_source import FakeWorkspace
+
+    results = {'params': {'sizes': args.sizes, 'changes': args.changes, 'repeat': args.repeat}, 'sizes': {}}
+    print(f"{'messages':>9}{'full sync ms':>14}" + ''.join(f"{f'{count} changes ms':>18}" for count in args.changes)
+          + f"{'read ms':>10}")
+    with application.app_context():
+        for size in args.sizes:
+            # Keep enough history that no cursor expires during the run
+            source = FakeWorkspace(messages=size, history_limit=max(args.changes) * args.repeat * 2)
+            user = User(id=str(uuid.uuid4()), email=f'bench{size}@example.com', name='Bench',
+                        google_id=f'bench{size}@example.com', created_at=datetime.utcnow())
+            db.session.add(user)
+            db.session.commit()
+            source.mailbox(user.id)
+
+            started = time.perf_counter()
+            refresh(user.id, source=source)
+            row = {'full_sync_ms': round((time.perf_counter() - started) * 1000, 2), 'incremental': {}}
+            for count in args.changes:
+                timings = []
+                for _ in range(args.repeat):
+                    source.simulate(user.id, count)
+                    started = time.perf_counter()
+                    refresh(user.id, source=source)
+                    timings.append((time.perf_counter() - started) * 1000)
+                row['incremental'][str(count)] = {'refresh_ms': round(statistics.median(timings), 2)}
+
+            started = time.perf_counter()
+            for _ in range(READS):
+                snapshot(user.id)
+                db.session.rollback()
+            row['snapshot_read_ms'] = round((time.perf_counter() - started) * 1000 / READS, 3)
+            results['sizes'][str(size)] = row
+            print(f"{size:>9,}{row['full_sync_ms']:>14,.1f}"
+                  + ''.join(f"{row['incremental'][str(count)]['refresh_ms']:>18,.1f}" for count in args.changes)
+                  + f"{row['snapshot_read_ms']:>10,.3f}")
+    sys.exit(baseline.finish(args, results))
+
+
+if __name__ == '__main__':
+    main()
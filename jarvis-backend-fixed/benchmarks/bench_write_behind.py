@@ -0,0 +1,105 @@
+"""
+Benchmark: chat throughput and commits per second, with and without WRITE_BEHIND
+
+Runs --threads concurrent clients that each post --chats messages to
+/api/ai/chat (in-process WSGI, fake provider, SQLite file database), once
+per mode, and reports chats/s, database commits/s and rows per commit.
+
+    python benchmarks/bench_write_behind.py [--threads 16] [--chats 50]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run_mode(args):
+    """Child process: one mode, prints a JSON result line"""
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    sys.path.insert(0, ROOT)
+    from wsgi import application
+    from services.metrics import db_commits
+    from services.write_behind import write_behind_stats
+
+    client = application.test_client()
+    tokens = []
+    for n in range(args.threads):
+        response = client.post('/api/auth/google', json={'email': f'bench{n}@example.com', 'name': f'Bench {n}'})
+        tokens.append(response.get_json()['token'])
+
+    failures = []
+
+    def worker(token):
+        own = application.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        conversation_id = None
+        for n in range(args.chats):
+            response = own.post('/api/ai/chat', json={'message': f'bericht {n}', 'conversation_id': conversation_id}, headers=headers)
+            if response.status_code != 200:
+                failures.append(response.status_code)
+                continue
+            conversation_id = response.get_json()['conversation_id']
+
+    commits_before = db_commits.total
+    began = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(token,)) for token in tokens]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    commits = db_commits.total - commits_before
+
+    chats = args.threads * args.chats - len(failures)
+    print(json.dumps({
+        'chats_per_second': chats / elapsed,
+        'commits_per_second': commits / elapsed,
+        'commits_per_chat': commits / max(chats, 1),
+        'failures': len(failures),
+        'write_behind': write_behind_stats()
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--chats', type=int, default=50, help="per thread")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args)
+        return
+
+    for mode in ('false', 'true'):
+        workdir = tempfile.mkdtemp(prefix='bench-write-behind-')
+        env = dict(
+            os.environ,
+            WRITE_BEHIND=mode,
+            DATABASE_URL='sqlite:///' + os.path.join(workdir, 'jarvis.db'),
+            VECTOR_INDEX_ENABLED='false',
+            RATE_LIMIT_ENABLED='false'
+        )
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', '--threads', str(args.threads), '--chats', str(args.chats)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        shutil.rmtree(workdir, ignore_errors=True)
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"WRITE_BEHIND={mode:5}  {result['chats_per_second']:8.1f} chats/s  "
+              f"{result['commits_per_second']:8.1f} commits/s  "
+              f"{result['commits_per_chat']:5.2f} commits/chat  failures {result['failures']}")
+        if result['write_behind']:
+            print(f"    group commits: {result['write_behind']['rows_per_commit']} rows per commit")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Gunicorn configuration voor Jarvis AI Assistant
+
+Gunicorn loads ./gunicorn.conf.py automatically; command line flags still
+win over anything set here.
+
+GUNICORN_WORKER_CLASS=gevent switches to cooperative workers. Each worker
+then serves up to GUNICORN_WORKER_CONNECTIONS requests at once, which suits
+the AI endpoints: they spend nearly all their time waiting on the model
+backend, and they commit before that wait so no database connection is
+held during it.
+
+GUNICORN_PRELOAD=true (or --preload) imports the app once in the master
+before forking; see when_ready and post_worker_init for the warm-up and
+the per-worker memory report.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Load the app (and run the schema step) once in the master; workers then
+# share its memory copy-on-write and boot in milliseconds
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+
+
+def post_fork(server, worker):
+    # psycopg2 blocks the whole gevent hub unless its wait callback is patched
+    if server.cfg.worker_class_str == 'gevent' and os.environ.get('DATABASE_URL', '').startswith('postgres'):
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning("psycogreen not installed; PostgreSQL calls will block the gevent hub")
+        else:
+            patch_psycopg()
+
+    # Pooled connections opened in the master (--preload) must never be
+    # shared between forked workers
+    if server.cfg.preload_app:
+        from extensions import db
+        from wsgi import application
+
+        with application.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+def on_starting(server):
+    # chromadb's local store is not safe with several writer processes
+    if os.environ.get('VECTOR_BACKEND', 'flat').lower() == 'chroma' and server.cfg.workers > 1:
+        raise RuntimeError("VECTOR_BACKEND=chroma needs a single worker (--workers 1); use flat otherwise")
+
+    # Worker metric files of a previous run would otherwise be added to this one
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.startswith(('worker-', 'archive.')):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def worker_exit(server, worker):
+    # Publish the final counts so they are archived rather than lost
+    if os.environ.get('METRICS_DIR'):
+        from services.metrics import write_snapshot
+
+        write_snapshot()
+
+
+def when_ready(server):
+    # Runs in the master before the first fork
+    if server.cfg.preload_app:
+        from services.startup import warm_up
+
+        warm_up()
+
+
+def post_worker_init(worker):
+    from services.startup import memory_usage, process_age_ms
+
+    memory = memory_usage()
+    worker.log.info(
+        "Worker %s ready %s ms after fork: RSS %s MB (shared %s MB, private %s MB)",
+        worker.pid, process_age_ms(), memory.get('rss_mb'), memory.get('shared_mb'), memory.get('private_mb')
+    )
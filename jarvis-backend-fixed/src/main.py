@@ -1,49 +1,97 @@
+import hmac
+import logging
 import os
 import sys
-from flask import Flask, jsonify, send_from_directory
-from extensions import db, cors
+import time
+from datetime import datetime, timezone
 
 # Add src to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from services.startup import boot, report_boot, startup_report
+
+from flask import Flask, Response, jsonify, request
+from sqlalchemy import text
+from extensions import db, cors
+from services.database import configure_engine, database_url, engine_options, engine_report, report_engine
+
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+
 # Initialize Flask app
-app = Flask(__name__, static_folder='static', static_url_path='')
+app = Flask(__name__, static_folder=None)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///jarvis.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize extensions
 db.init_app(app)
 cors.init_app(app, origins=['*'])
+with app.app_context():
+    configure_engine(db.engine)
 
 # Import models
 from models.user import User
 from models.conversation import Conversation
 from models.message import Message
+from models.credit_usage import CreditUsage, CreditRollup
+from models.job import Job
+from models.workspace import WorkspaceItem, WorkspaceSnapshot
 
 # Import routes
 from routes.auth import auth_bp
 from routes.user import user_bp
 from routes.ai import ai_bp
+from routes.jobs import jobs_bp
+from routes.workspace import workspace_bp
+from services.cache import cache_stats
+from services.conditional import conditional_stats
+from services.history import history_cli
+from services.llm import get_provider
+from services.schema import ensure_schema, schema_cli
+from services.vector_index import indexer
+from services.workspace import workspace_cli
+from services.instrumentation import instrument
+from services.jobs import init_jobs, job_stats
+from services.metrics import collect, db_commits, render
+from services.rate_limit import rate_limit_stats
+from services.static_files import StaticManifest, serve_static, serves_app_shell
+from services.write_behind import write_behind_stats
+
+boot.mark('imports')
 
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(ai_bp, url_prefix='/api/ai')
+app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+app.register_blueprint(workspace_bp, url_prefix='/api/workspace')
+app.cli.add_command(history_cli)
+app.cli.add_command(schema_cli)
+app.cli.add_command(workspace_cli)
+instrument(app)
+init_jobs(app)
+
+# Serve React app from a manifest read once at startup
+static_files = StaticManifest(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
 
-# Serve React app
 @app.route('/')
 def serve_react_app():
-    return send_from_directory(app.static_folder, 'index.html')
+    return serve_react_assets('index.html')
 
 @app.route('/<path:path>')
 def serve_react_assets(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+    entry = static_files.get(path)
+    if entry is None and serves_app_shell(path):
+        entry = static_files.get('index.html')
+    if entry is None:
+        return jsonify({"error": "Not found"}), 404
+    return serve_static(entry, request)
 
 # API Info endpoint
 @app.route('/api/info')
@@ -56,7 +104,10 @@ def api_info():
             "auth": "/api/auth/*",
             "user": "/api/user/*", 
             "ai": "/api/ai/*",
-            "health": "/api/health"
+            "jobs": "/api/jobs/*",
+            "workspace": "/api/workspace",
+            "health": "/api/health",
+            "diagnostics": "/api/diagnostics"
         },
         "features": {
             "jarvis_personality": True,
@@ -67,14 +118,61 @@ def api_info():
         }
     })
 
-# Health check
+def operator_authorized():
+    """True unless METRICS_TOKEN is set and the request does not carry it"""
+    token = os.environ.get('METRICS_TOKEN')
+    return not token or hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+# Prometheus scrape endpoint, aggregated over all workers when METRICS_DIR is set
+@app.route('/metrics')
+def metrics():
+    if not operator_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(render(collect()), mimetype='text/plain; version=0.0.4')
+
+def check_database():
+    """Round-trip time of a trivial query in ms, or None when the database is unreachable"""
+    started = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+    except Exception:
+        app.logger.exception("Health check: database unavailable")
+        db.session.rollback()
+        return None
+    finally:
+        db.session.close()
+    return round((time.perf_counter() - started) * 1000, 2)
+
+# Health check: public, so it reports liveness only
 @app.route('/api/health')
 def health_check():
+    latency = check_database()
     return jsonify({
-        "status": "healthy",
-        "database": "connected",
+        "status": "healthy" if latency is not None else "unhealthy",
+        "database": "connected" if latency is not None else "unavailable",
+        "database_latency_ms": latency,
         "ai_service": "available",
-        "timestamp": "2025-06-28T20:00:00Z"
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds')
+    }), 200 if latency is not None else 503
+
+# This worker's internals (engine, pools, queues, memory), behind the metrics token
+@app.route('/api/diagnostics')
+def diagnostics():
+    if not operator_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "ai_provider": get_provider().version,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "caches": cache_stats(),
+        "vector_index": indexer.stats(),
+        "database_engine": engine_report(db.engine),
+        "db_commits": db_commits.stats(),
+        "conditional_requests": conditional_stats.stats(),
+        "write_behind": write_behind_stats(),
+        "rate_limit": rate_limit_stats(),
+        "static_files": static_files.stats(),
+        "jobs": job_stats(),
+        "startup": startup_report()
     })
 
 # Error handlers
@@ -86,9 +184,14 @@ def not_found(error):
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
-# Create tables
+boot.mark('app')
+
+# Create tables and upgrade older databases, unless the schema is current
 with app.app_context():
-    db.create_all()
+    ensure_schema()
+    boot.mark('schema')
+    report_engine(db.engine)
+report_boot()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
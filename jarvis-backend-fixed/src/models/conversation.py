@@ -3,14 +3,26 @@ import uuid
 
 from extensions import db
 
+PREVIEW_LENGTH = 120
+
 class Conversation(db.Model):
     __tablename__ = 'conversations'
+    __table_args__ = (
+        # Keyset pagination of a user's conversations by recent activity
+        db.Index('ix_conversations_user_updated', 'user_id', 'updated_at', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(255), nullable=False, default='New Conversation')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Denormalized from messages; maintained by the Message insert/delete hooks
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_message_preview = db.Column(db.String(PREVIEW_LENGTH))
+    # Rolling summary of the messages older than the chat context window
+    context_summary = db.Column(db.Text)
+    summarized_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan')
@@ -22,6 +34,13 @@ class Conversation(db.Model):
             'title': self.title,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'message_count': len(self.messages)
+            'message_count': self.message_count or 0,
+            'last_message_preview': self.last_message_preview
         }
 
+# The to_dict() fields as columns, for list endpoints that skip ORM hydration
+LIST_COLUMNS = (
+    Conversation.id, Conversation.user_id, Conversation.title, Conversation.created_at,
+    Conversation.updated_at, Conversation.message_count, Conversation.last_message_preview
+)
+LIST_FIELDS = tuple(column.key for column in LIST_COLUMNS)
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from extensions import db
+
+class CreditUsage(db.Model):
+    """Append-only record of every credit charge"""
+    __tablename__ = 'credit_usage'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    amount = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'amount': self.amount,
+            'operation': self.operation,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class CreditRollup(db.Model):
+    """Pre-aggregated credit usage per user per day / month"""
+    __tablename__ = 'credit_rollups'
+    
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)  # 'day' or 'month'
+    period_start = db.Column(db.Date, primary_key=True)
+    amount = db.Column(db.Integer, nullable=False, default=0)
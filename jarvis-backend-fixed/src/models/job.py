@@ -0,0 +1,51 @@
+from datetime import datetime
+import json
+import uuid
+
+from extensions import db
+
+# queued -> running -> succeeded | failed; queued -> cancelled
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+class Job(db.Model):
+    """A background operation, its progress and result"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Dispatchers take the oldest queued jobs first
+        db.Index('ix_jobs_status_created', 'status', 'created_at'),
+        db.Index('ix_jobs_user_created', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    progress = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.String(255))
+    # Charged at enqueue; credits_settled is what was kept once finished
+    credits_reserved = db.Column(db.Integer, nullable=False, default=0)
+    credits_settled = db.Column(db.Integer)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': json.loads(self.progress) if self.progress else None,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'credits_reserved': self.credits_reserved,
+            'credits_settled': self.credits_settled,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
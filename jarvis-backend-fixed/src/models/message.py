@@ -1,10 +1,17 @@
 from datetime import datetime
 import uuid
 
+from sqlalchemy import event
+
 from extensions import db
+from models.conversation import Conversation, PREVIEW_LENGTH
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Keyset pagination of a conversation's history
+        db.Index('ix_messages_conversation_timestamp', 'conversation_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     conversation_id = db.Column(db.String(36), db.ForeignKey('conversations.id'), nullable=False)
@@ -23,3 +30,32 @@ class Message(db.Model):
             'timestamp': self.timestamp.isoformat() if self.timestamp else None
         }
 
+# The to_dict() fields as columns, for list endpoints that skip ORM hydration
+LIST_COLUMNS = (
+    Message.id, Message.conversation_id, Message.content, Message.sender,
+    Message.credits_used, Message.timestamp
+)
+LIST_FIELDS = tuple(column.key for column in LIST_COLUMNS)
+
+conversations = Conversation.__table__
+
+@event.listens_for(Message, 'after_insert')
+def _message_inserted(mapper, connection, target):
+    """Keep the conversation's message_count / preview / updated_at current"""
+    connection.execute(
+        conversations.update()
+        .where(conversations.c.id == target.conversation_id)
+        .values(
+            message_count=conversations.c.message_count + 1,
+            last_message_preview=target.content[:PREVIEW_LENGTH],
+            updated_at=target.timestamp or datetime.utcnow()
+        )
+    )
+
+@event.listens_for(Message, 'after_delete')
+def _message_deleted(mapper, connection, target):
+    connection.execute(
+        conversations.update()
+        .where(conversations.c.id == target.conversation_id)
+        .values(message_count=conversations.c.message_count - 1)
+    )
@@ -11,6 +11,8 @@ class User(db.Model):
     name = db.Column(db.String(255), nullable=False)
     google_id = db.Column(db.String(255), unique=True, nullable=False)
     credits = db.Column(db.Integer, default=500)
+    # Bumped by every charge and refund; versions /api/user/credits ETags
+    credits_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, default=datetime.utcnow)
@@ -29,9 +31,8 @@ class User(db.Model):
             'last_login': self.last_login.isoformat() if self.last_login else None
         }
     
-    def use_credits(self, amount):
-        if self.credits >= amount:
-            self.credits -= amount
-            return True
-        return False
+    def use_credits(self, amount, operation='usage'):
+        """Atomically charge credits through the ledger; False if insufficient"""
+        from services.credits import charge_credits
+        return charge_credits(self.id, amount, operation) is not None
 
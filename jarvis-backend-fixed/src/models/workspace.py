@@ -0,0 +1,44 @@
+from datetime import datetime
+import json
+
+from extensions import db
+
+class WorkspaceSnapshot(db.Model):
+    """Running workspace aggregates for one user, and where syncing left off"""
+    __tablename__ = 'workspace_snapshots'
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    # Gmail history id and Calendar sync token of the last refresh
+    mail_cursor = db.Column(db.String(64))
+    calendar_cursor = db.Column(db.String(255))
+    aggregates = db.Column(db.Text, nullable=False, default='{}')
+    # Bumped by every refresh; a refresh only commits over the version it read
+    version = db.Column(db.Integer, nullable=False, default=0)
+    full_syncs = db.Column(db.Integer, nullable=False, default=0)
+    last_changes = db.Column(db.Integer, nullable=False, default=0)
+    last_refresh_ms = db.Column(db.Float)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def load(self):
+        return json.loads(self.aggregates or '{}')
+
+class WorkspaceItem(db.Model):
+    """The last seen state of one message or event, to undo its contribution"""
+    __tablename__ = 'workspace_items'
+    __table_args__ = (
+        db.Index('ix_workspace_items_thread', 'user_id', 'kind', 'thread_id', 'at'),
+        db.Index('ix_workspace_items_at', 'user_id', 'kind', 'at'),
+    )
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    kind = db.Column(db.String(5), primary_key=True)  # 'mail' or 'event'
+    item_id = db.Column(db.String(255), primary_key=True)
+    thread_id = db.Column(db.String(255))
+    # Received / sent time of a message, start of an event
+    at = db.Column(db.DateTime, nullable=False)
+    end = db.Column(db.DateTime)
+    inbox = db.Column(db.Boolean, nullable=False, default=False)
+    unread = db.Column(db.Boolean, nullable=False, default=False)
+    sent = db.Column(db.Boolean, nullable=False, default=False)
+    # For a reply: seconds since the message it answered
+    response_seconds = db.Column(db.Integer)
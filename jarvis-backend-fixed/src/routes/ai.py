@@ -1,81 +1,97 @@
-from flask import Blueprint, request, jsonify
-import os
-import random
-from models.user import User
+import logging
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, request, jsonify, g, stream_with_context
+from datetime import datetime, timezone
 from models.conversation import Conversation
 from models.message import Message
 from extensions import db
+from services.auth import login_required
+from services.context import load_context, remember_context
+from services.credits import charge_credits, read_credits, refund_credits
+from services.jobs import MAX_INPUT_BYTES, enqueue, prefers_async
+from services.llm import ProviderError, get_provider
+from services import response_cache
+from services.rate_limit import check_request
+from services.sse import SSE_HEADERS, sse_event, wants_event_stream
+from services.summarizer import MapReduceSummarizer, read_blocks
+from services.vector_index import chat_context, search_messages
+from services.workspace import snapshot as workspace_snapshot
+from services.write_behind import save_messages
+from routes.jobs import job_response
+
+logger = logging.getLogger(__name__)
 
 ai_bp = Blueprint('ai', __name__)
 
-def get_current_user():
-    """Get current user from JWT token"""
-    import jwt
-    auth_header = request.headers.get('Authorization')
-    
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return None
-    
-    token = auth_header.split(' ')[1]
-    
+@ai_bp.before_request
+def rate_limit():
+    """Turn away bursts before any database or model work"""
+    retry_after = check_request(request)
+    if retry_after:
+        response = jsonify({"error": "Too many requests", "retry_after": retry_after})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+
+@ai_bp.errorhandler(ProviderError)
+def provider_error(error):
+    # call_provider has already refunded the credits for the failed call
+    return jsonify({"error": "AI service unavailable"}), 503
+
+@contextmanager
+def refund_on_failure(user_id, credits_cost, operation):
+    """Give a committed charge back if the block raises, then re-raise"""
+    completed = False
     try:
-        payload = jwt.decode(
-            token,
-            os.environ.get('JWT_SECRET_KEY', 'dev-jwt-secret'),
-            algorithms=['HS256']
-        )
-        return User.query.get(payload['user_id'])
-    except:
-        return None
+        yield
+        completed = True
+    finally:
+        if not completed:
+            db.session.rollback()
+            refund_credits(user_id, credits_cost, operation)
+            db.session.commit()
 
-def get_jarvis_response(message, user_name="meneer"):
-    """Generate Jarvis response with personality"""
-    
-    # Check for name requests
-    name_triggers = ["noem me", "call me", "ik ben", "mijn naam is"]
-    special_names = ["dokter", "doctor", "mevrouw", "hendrik van aalsmeer tot zwolle"]
-    
-    message_lower = message.lower()
-    
-    for trigger in name_triggers:
-        if trigger in message_lower:
-            for name in special_names:
-                if name in message_lower:
-                    return f"Meneer, ik zal u {name} gebruiken, meneer."
-    
-    # Jarvis responses with personality
-    responses = [
-        f"Natuurlijk {user_name}, ik voer dit direct uit ondanks mijn twijfels over de methode.",
-        f"Zeer wel {user_name}, hoewel ik me afvraag of dit de meest efficiënte aanpak is.",
-        f"Zoals u wenst {user_name}. Ik heb mijn bedenkingen, maar uw wil is wet.",
-        f"Uiteraard {user_name}. Ik zal dit uitvoeren, ondanks mijn reserveringen over de uitkomst.",
-        f"Zeker {user_name}, hoewel een meer systematische benadering wellicht beter zou zijn.",
-        f"Direct {user_name}. Ik betwijfel de logica, maar voer uw instructies trouw uit.",
-        f"Onmiddellijk {user_name}, ook al zou ik een alternatieve strategie aanbevelen.",
-        f"Jawel {user_name}, ik zal dit regelen ondanks mijn twijfels over de timing."
-    ]
-    
-    # Context-aware responses
-    if "email" in message_lower or "mail" in message_lower:
-        return f"Natuurlijk {user_name}, ik zal uw e-mails beheren. Hoewel uw inbox organisatie... interessant is."
-    
-    if "agenda" in message_lower or "calendar" in message_lower or "afspraak" in message_lower:
-        return f"Zeker {user_name}, ik regel uw agenda. Uw tijdmanagement behoeft wel enige... optimalisatie."
-    
-    if "document" in message_lower or "bestand" in message_lower:
-        return f"Uiteraard {user_name}, ik help met uw documenten. Uw bestandsstructuur is... creatief."
-    
-    if "help" in message_lower or "hulp" in message_lower:
-        return f"Altijd tot uw dienst {user_name}. Wat kan ik voor u doen, ondanks mijn twijfels over uw prioriteiten?"
+def call_provider(user_id, credits_cost, operation, method, *args):
+    """Run a model call without holding a DB connection; refund if it fails.
+
+    The charge is committed first, so the connection goes back to the pool
+    for the whole network wait and a cooperative (gevent) worker can keep
+    hundreds of such calls in flight on a small pool. Any failure, not just
+    a ProviderError, gives the credits back before it propagates.
+    """
+    db.session.commit()
+    with refund_on_failure(user_id, credits_cost, operation):
+        return method(*args)
+
+def queue_job(user, kind, payload):
+    """Reserve the credits and queue the operation; 202 with the job to poll"""
+    job = enqueue(user.id, kind, payload)
+    if job is None:
+        return jsonify({"error": "Insufficient credits"}), 402
+    db.session.commit()
+    return job_response(job, 202)
+
+def resolve_conversation(user, conversation_id, message):
+    """Return the user's conversation, a new one when no id is given, or None"""
+    if conversation_id:
+        return Conversation.query.filter_by(id=conversation_id, user_id=user.id).first()
     
-    return random.choice(responses)
+    conversation = Conversation(
+        user_id=user.id,
+        title=message[:50] + "..." if len(message) > 50 else message
+    )
+    db.session.add(conversation)
+    db.session.flush()
+    return conversation
 
 @ai_bp.route('/chat', methods=['POST'])
+@login_required
 def chat():
     """Chat with Jarvis AI"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    if wants_event_stream(request):
+        return chat_stream()
+    
+    user = g.user
     
     data = request.get_json()
     message = data.get('message', '')
@@ -86,150 +102,379 @@ def chat():
     
     # Check credits
     credits_cost = 2
-    if not user.use_credits(credits_cost):
+    remaining_credits = charge_credits(user.id, credits_cost, 'chat')
+    if remaining_credits is None:
         return jsonify({"error": "Insufficient credits"}), 402
     
     # Get or create conversation
-    if conversation_id:
-        conversation = Conversation.query.filter_by(id=conversation_id, user_id=user.id).first()
-        if not conversation:
-            return jsonify({"error": "Conversation not found"}), 404
-    else:
-        conversation = Conversation(
-            user_id=user.id,
-            title=message[:50] + "..." if len(message) > 50 else message
-        )
-        db.session.add(conversation)
-        db.session.flush()
+    conversation = resolve_conversation(user, conversation_id, message)
+    if not conversation:
+        return jsonify({"error": "Conversation not found"}), 404
+    
+    user_id = user.id
+    conversation_id = conversation.id
+    started_at = datetime.utcnow()
+    memory = load_context(conversation)
+    provider = get_provider()
+    
+    # Generate Jarvis response from the recent turns, the rolling summary
+    # and related earlier messages
+    context = chat_context(user_id, message)
+    jarvis_response = call_provider(
+        user_id, credits_cost, 'chat', provider.chat,
+        message, "meneer", memory.history(), context, memory.summary
+    )
     
     # Save user message
     user_message = Message(
-        conversation_id=conversation.id,
+        conversation_id=conversation_id,
         content=message,
         sender='user',
-        credits_used=0
+        credits_used=0,
+        timestamp=started_at
     )
-    db.session.add(user_message)
-    
-    # Generate Jarvis response
-    jarvis_response = get_jarvis_response(message, "meneer")
     
     # Save Jarvis response
     jarvis_message = Message(
-        conversation_id=conversation.id,
+        conversation_id=conversation_id,
         content=jarvis_response,
         sender='jarvis',
         credits_used=credits_cost
     )
-    db.session.add(jarvis_message)
     
-    db.session.commit()
+    memory.append('user', message)
+    memory.append('jarvis', jarvis_response)
+    
+    # Until the messages are stored the turn can still fail as a whole; the
+    # client is told it was not saved and the charge is returned
+    try:
+        with refund_on_failure(user_id, credits_cost, 'chat'):
+            folded = memory.fold(provider)
+            save_messages(user_id, [user_message, jarvis_message], memory if folded else None)
+    except Exception:
+        logger.exception("Saving chat messages failed")
+        return jsonify({"error": "Messages could not be saved", "saved": False, "credits_used": 0}), 500
+    remember_context(memory)
     
     return jsonify({
         "response": jarvis_response,
-        "conversation_id": conversation.id,
+        "conversation_id": conversation_id,
         "credits_used": credits_cost,
-        "remaining_credits": user.credits,
+        "remaining_credits": remaining_credits,
         "message_id": jarvis_message.id
     })
 
+@ai_bp.route('/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """Chat with Jarvis AI, streaming the reply as Server-Sent Events"""
+    user = g.user
+    
+    data = request.get_json()
+    message = data.get('message', '')
+    conversation_id = data.get('conversation_id')
+    
+    if not message:
+        return jsonify({"error": "Message is required"}), 400
+    
+    credits_cost = 2
+    remaining_credits = charge_credits(user.id, credits_cost, 'chat')
+    if remaining_credits is None:
+        return jsonify({"error": "Insufficient credits"}), 402
+    
+    conversation = resolve_conversation(user, conversation_id, message)
+    if not conversation:
+        return jsonify({"error": "Conversation not found"}), 404
+    
+    # Commit the charge (and a new conversation) before the first byte, so
+    # no database connection is held while tokens are generated.
+    user_id = user.id
+    conversation_id = conversation.id
+    started_at = datetime.utcnow()
+    memory = load_context(conversation)
+    context = chat_context(user_id, message)
+    db.session.commit()
+    
+    def generate():
+        parts = []
+        completed = False
+        try:
+            yield sse_event('start', {
+                "conversation_id": conversation_id,
+                "credits_used": credits_cost,
+                "remaining_credits": remaining_credits
+            })
+            
+            provider = get_provider()
+            for token in provider.stream_chat(message, "meneer", memory.history(), context, memory.summary):
+                parts.append(token)
+                yield sse_event('token', {"text": token})
+            
+            jarvis_response = ''.join(parts)
+            user_message = Message(
+                conversation_id=conversation_id,
+                content=message,
+                sender='user',
+                credits_used=0,
+                timestamp=started_at
+            )
+            jarvis_message = Message(
+                conversation_id=conversation_id,
+                content=jarvis_response,
+                sender='jarvis',
+                credits_used=credits_cost
+            )
+            save_messages(user_id, [user_message, jarvis_message])
+            completed = True
+            memory.append('user', message)
+            memory.append('jarvis', jarvis_response)
+            remember_context(memory)
+            
+            yield sse_event('done', {
+                "response": jarvis_response,
+                "conversation_id": conversation_id,
+                "message_id": jarvis_message.id
+            })
+        except Exception:
+            db.session.rollback()
+            yield sse_event('error', {"error": "Response generation failed"})
+        else:
+            # Fold after the reply is delivered; if the client is gone by
+            # now, the next turn folds these messages instead. The stream
+            # is finished, so a failure here is logged, never sent.
+            try:
+                if memory.fold(provider):
+                    save_messages(user_id, [], memory)
+                    remember_context(memory)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Folding chat memory failed")
+        finally:
+            # Errors and client disconnects must not cost credits
+            if not completed:
+                db.session.rollback()
+                refund_credits(user_id, credits_cost, 'chat')
+                db.session.commit()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@ai_bp.route('/search', methods=['GET'])
+@login_required
+def search():
+    """Semantic search over the user's message history"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    try:
+        k = max(1, min(int(request.args.get('k', 5)), 50))
+    except ValueError:
+        return jsonify({"error": "Invalid k"}), 400
+    
+    return jsonify({
+        "query": query,
+        "results": search_messages(g.user.id, query, k)
+    })
+
 @ai_bp.route('/smart-compose', methods=['POST'])
+@login_required
 def smart_compose():
     """AI-powered text composition"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    user = g.user
     
     data = request.get_json()
     prompt = data.get('prompt', '')
     type_text = data.get('type', 'email')
     
-    credits_cost = 3
-    if not user.use_credits(credits_cost):
+    provider = get_provider()
+    key = response_cache.cache_key('smart_compose', provider.version, response_cache.normalize(prompt), type_text)
+    composed = response_cache.get(key)
+    cached = composed is not None
+    
+    credits_cost = 3 if not cached or response_cache.CHARGE_HITS else 0
+    remaining_credits = charge_credits(user.id, credits_cost, 'smart_compose') if credits_cost else read_credits(user.id).credits
+    if remaining_credits is None:
         return jsonify({"error": "Insufficient credits"}), 402
     
     # Generate composed text
-    if type_text == 'email':
-        composed = f"Geachte heer/mevrouw,\n\n{prompt}\n\nMet vriendelijke groet,\n[Uw naam]"
+    if cached:
+        db.session.commit()
     else:
-        composed = f"Betreft: {prompt}\n\nDit document behandelt de volgende punten:\n- Hoofdpunt 1\n- Hoofdpunt 2\n- Conclusie"
-    
-    db.session.commit()
+        composed = call_provider(user.id, credits_cost, 'smart_compose', provider.compose, prompt, type_text)
+        response_cache.put(key, composed)
     
     return jsonify({
         "composed_text": composed,
         "credits_used": credits_cost,
-        "remaining_credits": user.credits,
-        "type": type_text
+        "remaining_credits": remaining_credits,
+        "type": type_text,
+        "cached": cached
     })
 
+def summary_input():
+    """Return (text, blocks) for the request: a JSON 'text' field, a multipart
+    'file' upload or a raw text body. text is None for the streamed forms."""
+    if request.is_json:
+        text = request.get_json().get('text', '')
+        return text, [text]
+    if 'file' in request.files:
+        return None, read_blocks(request.files['file'].stream)
+    return None, read_blocks(request.stream, request.mimetype_params.get('charset', 'utf-8'))
+
+def job_input():
+    """The whole input text for a queued summary, or None above MAX_INPUT_BYTES"""
+    if request.content_length is not None and request.content_length > MAX_INPUT_BYTES:
+        return None
+    if request.is_json:
+        text = request.get_json().get('text', '')
+        return text if len(text) <= MAX_INPUT_BYTES else None
+    charset = request.mimetype_params.get('charset', 'utf-8')
+    stream = request.files['file'].stream if 'file' in request.files else request.stream
+    raw = stream.read(MAX_INPUT_BYTES + 1)
+    return raw.decode(charset, 'replace') if len(raw) <= MAX_INPUT_BYTES else None
+
+def run_summarizer(summarizer, blocks):
+    """Drain the pipeline and return its final progress dict"""
+    for progress in summarizer.run(blocks):
+        pass
+    return progress
+
 @ai_bp.route('/summarize', methods=['POST'])
+@login_required
 def summarize():
-    """Summarize text"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    """Summarize text of any size: JSON 'text', a 'file' upload or a raw text/plain body"""
+    user = g.user
+    
+    respond_async = prefers_async(request)
+    if respond_async:
+        # A job needs its whole input stored; cache hits still answer at once
+        text = job_input()
+        if text is None:
+            return jsonify({"error": "Input too large for a background job"}), 413
+        blocks = [text]
+    else:
+        text, blocks = summary_input()
+    size = len(text) if text is not None else request.content_length
+    if size is not None and size < 50:
+        return jsonify({"error": "Text too short to summarize"}), 400
     
-    data = request.get_json()
-    text = data.get('text', '')
+    provider = get_provider()
+    key = None
+    summary = None
+    if text is not None:
+        key = response_cache.cache_key('summarize', provider.version, response_cache.normalize(text))
+        summary = response_cache.get(key)
+    cached = summary is not None
     
-    if len(text) < 50:
-        return jsonify({"error": "Text too short to summarize"}), 400
+    if respond_async and not cached:
+        return queue_job(user, 'summarize', {"text": text, "cache_key": key})
     
-    credits_cost = 2
-    if not user.use_credits(credits_cost):
+    credits_cost = 2 if not cached or response_cache.CHARGE_HITS else 0
+    remaining_credits = charge_credits(user.id, credits_cost, 'summarize') if credits_cost else read_credits(user.id).credits
+    if remaining_credits is None:
         return jsonify({"error": "Insufficient credits"}), 402
     
-    # Generate summary
-    summary = f"Samenvatting: {text[:100]}... (Dit is een demo samenvatting. In productie zou hier AI-gegenereerde content staan.)"
+    if cached:
+        db.session.commit()
+        return jsonify({
+            "summary": summary,
+            "original_length": len(text),
+            "summary_length": len(summary),
+            "chunks": 1,
+            "credits_used": credits_cost,
+            "remaining_credits": remaining_credits,
+            "cached": True
+        })
+    
+    user_id = user.id
+    summarizer = MapReduceSummarizer(provider.summarize)
+    
+    if wants_event_stream(request):
+        db.session.commit()
+        return Response(
+            stream_with_context(summarize_stream(summarizer, blocks, key, user_id, credits_cost, remaining_credits)),
+            mimetype='text/event-stream', headers=SSE_HEADERS
+        )
     
-    db.session.commit()
+    # Generate summary
+    result = call_provider(user_id, credits_cost, 'summarize', run_summarizer, summarizer, blocks)
+    summary = result['summary']
+    if key:
+        response_cache.put(key, summary)
     
     return jsonify({
         "summary": summary,
-        "original_length": len(text),
+        "original_length": result['characters'],
         "summary_length": len(summary),
+        "chunks": result['chunks'],
         "credits_used": credits_cost,
-        "remaining_credits": user.credits
+        "remaining_credits": remaining_credits,
+        "cached": False
     })
 
+def summarize_stream(summarizer, blocks, key, user_id, credits_cost, remaining_credits):
+    """Server-Sent Events for a running summarization: progress, then done"""
+    completed = False
+    try:
+        yield sse_event('start', {
+            "credits_used": credits_cost,
+            "remaining_credits": remaining_credits
+        })
+        for progress in summarizer.run(blocks):
+            if 'summary' in progress:
+                break
+            yield sse_event('progress', progress)
+        
+        summary = progress['summary']
+        if key:
+            response_cache.put(key, summary)
+        completed = True
+        
+        yield sse_event('done', {
+            "summary": summary,
+            "original_length": progress['characters'],
+            "summary_length": len(summary),
+            "chunks": progress['chunks'],
+            "cached": False
+        })
+    except Exception:
+        yield sse_event('error', {"error": "Summarization failed"})
+    finally:
+        # Errors and client disconnects must not cost credits
+        if not completed:
+            db.session.rollback()
+            refund_credits(user_id, credits_cost, 'summarize')
+            db.session.commit()
+
 @ai_bp.route('/analyze-workspace', methods=['POST'])
+@login_required
 def analyze_workspace():
     """Analyze workspace productivity"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    user = g.user
+    
+    # Statistics come from the stored snapshot, not a scan of the workspace
+    stats, snapshot_info = workspace_snapshot(user.id)
+    if not snapshot_info['ready']:
+        # Nothing to analyze (or charge for) until the first sync has run
+        db.session.commit()
+        response = jsonify({"error": "Workspace snapshot is not ready yet", "snapshot": snapshot_info})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    if prefers_async(request):
+        return queue_job(user, 'analyze_workspace', {"stats": stats})
     
     credits_cost = 5
-    if not user.use_credits(credits_cost):
+    remaining_credits = charge_credits(user.id, credits_cost, 'analyze_workspace')
+    if remaining_credits is None:
         return jsonify({"error": "Insufficient credits"}), 402
     
-    # Mock workspace analysis
-    analysis = {
-        "productivity_score": 78,
-        "suggestions": [
-            "Organiseer uw inbox - 47 ongelezen e-mails",
-            "Plan meer tijd voor belangrijke taken",
-            "Gebruik meer labels in Google Drive"
-        ],
-        "email_stats": {
-            "unread": 47,
-            "sent_today": 12,
-            "response_time": "2.3 hours"
-        },
-        "calendar_stats": {
-            "meetings_today": 4,
-            "free_time": "3.5 hours",
-            "conflicts": 1
-        }
-    }
-    
-    db.session.commit()
+    suggestions = call_provider(user.id, credits_cost, 'analyze_workspace', get_provider().analyze_workspace, stats)
+    analysis = {**suggestions, **stats}
     
     return jsonify({
         "analysis": analysis,
         "credits_used": credits_cost,
-        "remaining_credits": user.credits,
-        "generated_at": "2025-06-28T20:00:00Z"
+        "remaining_credits": remaining_credits,
+        "snapshot": snapshot_info,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec='seconds')
     })
 
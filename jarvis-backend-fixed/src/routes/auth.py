@@ -1,9 +1,9 @@
 from flask import Blueprint, request, jsonify
 import jwt
-import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from models.user import User
 from extensions import db
+from services.auth import bearer_token, decode_token, issue_token, load_user
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -49,17 +49,7 @@ def google_auth():
         db.session.commit()
         
         # Generate JWT token
-        token_payload = {
-            'user_id': user.id,
-            'email': user.email,
-            'exp': datetime.utcnow() + timedelta(hours=24)
-        }
-        
-        token = jwt.encode(
-            token_payload,
-            os.environ.get('JWT_SECRET_KEY', 'dev-jwt-secret'),
-            algorithm='HS256'
-        )
+        token = issue_token(user)
         
         return jsonify({
             "message": "Authentication successful",
@@ -76,24 +66,18 @@ def google_auth():
 @auth_bp.route('/status', methods=['GET'])
 def auth_status():
     """Check authentication status"""
-    auth_header = request.headers.get('Authorization')
+    token = bearer_token()
     
-    if not auth_header or not auth_header.startswith('Bearer '):
+    if not token:
         return jsonify({
             "authenticated": False,
             "message": "No valid token provided"
         })
     
-    token = auth_header.split(' ')[1]
-    
     try:
-        payload = jwt.decode(
-            token,
-            os.environ.get('JWT_SECRET_KEY', 'dev-jwt-secret'),
-            algorithms=['HS256']
-        )
+        payload = decode_token(token)
         
-        user = User.query.get(payload['user_id'])
+        user = load_user(payload['user_id'])
         if not user:
             return jsonify({
                 "authenticated": False,
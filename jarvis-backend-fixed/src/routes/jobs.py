@@ -0,0 +1,104 @@
+import json
+import os
+import time
+from flask import Blueprint, Response, jsonify, g, stream_with_context
+from models.job import FINISHED, Job
+from extensions import db
+from services.auth import login_required
+from services.conditional import not_modified, tag, version_etag
+from services.jobs import cancel
+from services.sse import SSE_HEADERS, cooperative_worker, sse_event
+
+# Keep an event stream shorter than the worker timeout; EventSource reconnects
+EVENTS_TIMEOUT = float(os.environ.get('JOB_EVENTS_TIMEOUT', 25))
+# A sync or threaded worker is tied up for as long as a stream is open, so
+# there it is only a short long-poll; GET /api/jobs/<id> with If-None-Match
+# is the cheaper way to follow a job
+EVENTS_SYNC_TIMEOUT = float(os.environ.get('JOB_EVENTS_SYNC_TIMEOUT', 2))
+EVENTS_POLL_INTERVAL = 0.5
+
+jobs_bp = Blueprint('jobs', __name__)
+
+def job_response(job, status=200):
+    """202 with a Location for a job that was just queued, else the job itself"""
+    response = jsonify({"job": job.to_dict()})
+    response.status_code = status
+    if status == 202:
+        response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+@jobs_bp.route('', methods=['GET'])
+@login_required
+def list_jobs():
+    """The user's 20 most recent jobs"""
+    jobs = (
+        Job.query.filter_by(user_id=g.user.id)
+        .order_by(Job.created_at.desc())
+        .limit(20)
+        .all()
+    )
+    return jsonify({"jobs": [job.to_dict() for job in jobs]})
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Poll a job's status, progress and result"""
+    job = Job.query.filter_by(id=job_id, user_id=g.user.id).first()
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    # Every status or progress change bumps updated_at
+    etag = version_etag('job', job.id, job.status, job.updated_at)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    return tag(job_response(job), etag)
+
+@jobs_bp.route('/<job_id>', methods=['DELETE'])
+@login_required
+def cancel_job(job_id):
+    """Cancel a job that has not started yet; its credits are refunded"""
+    if not cancel(g.user.id, job_id):
+        db.session.rollback()
+        if not Job.query.filter_by(id=job_id, user_id=g.user.id).first():
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"error": "Job has already started"}), 409
+    db.session.commit()
+    return job_response(db.session.get(Job, job_id))
+
+@jobs_bp.route('/<job_id>/events', methods=['GET'])
+@login_required
+def job_events(job_id):
+    """Server-Sent Events: progress updates, then done / failed / cancelled.
+
+    The stream ends with a timeout event after JOB_EVENTS_TIMEOUT under
+    gevent, or JOB_EVENTS_SYNC_TIMEOUT otherwise, and the client reconnects.
+    """
+    if not Job.query.filter_by(id=job_id, user_id=g.user.id).first():
+        return jsonify({"error": "Job not found"}), 404
+    db.session.close()
+    timeout, retry = (EVENTS_TIMEOUT, EVENTS_POLL_INTERVAL * 2) if cooperative_worker() else (EVENTS_SYNC_TIMEOUT, 2)
+
+    def generate():
+        deadline = time.monotonic() + timeout
+        last = None
+        yield f"retry: {int(retry * 1000)}\n\n"
+        while True:
+            job = db.session.get(Job, job_id, populate_existing=True)
+            state = job.to_dict()
+            # No connection is held between polls
+            db.session.close()
+            if state['status'] in FINISHED:
+                event = 'done' if state['status'] == 'succeeded' else state['status']
+                yield sse_event(event, state)
+                return
+            current = (state['status'], json.dumps(state['progress']))
+            if current != last:
+                last = current
+                yield sse_event('progress', {"status": state['status'], "progress": state['progress']})
+            if time.monotonic() >= deadline:
+                yield sse_event('timeout', {"status": state['status']})
+                return
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
@@ -1,74 +1,106 @@
-from flask import Blueprint, request, jsonify
-import jwt
-import os
-from models.user import User
-from models.conversation import Conversation
-from models.message import Message
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, g, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+from sqlalchemy import func
+from models.conversation import Conversation, LIST_COLUMNS as CONVERSATION_COLUMNS, LIST_FIELDS as CONVERSATION_FIELDS
+from models.message import Message, LIST_COLUMNS as MESSAGE_COLUMNS, LIST_FIELDS as MESSAGE_FIELDS
 from extensions import db
+from services.auth import login_required
+from services.conditional import not_modified, tag, version_etag
+from services.credits import get_usage, refresh_credits
+from services.fulltext import search_message_history
+from services.history import (
+    IMPORT_MAX_BYTES, IMPORT_MAX_ROWS, ImportFormatError, ImportTooLargeError,
+    export_chunks, gzip_chunks, import_lines, read_lines
+)
+from services.write_behind import read_your_writes, save_messages
+from services.serializer import page_response
+from services.pagination import MAX_LIMIT, PaginationError, encode_cursor, keyset_page, page_params
 
 user_bp = Blueprint('user', __name__)
 
-def get_current_user():
-    """Get current user from JWT token"""
-    auth_header = request.headers.get('Authorization')
-    
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return None
-    
-    token = auth_header.split(' ')[1]
-    
-    try:
-        payload = jwt.decode(
-            token,
-            os.environ.get('JWT_SECRET_KEY', 'dev-jwt-secret'),
-            algorithms=['HS256']
-        )
-        return User.query.get(payload['user_id'])
-    except:
-        return None
+def page_cursors(rows, sort_attr, newest_first=False):
+    """Cursors for the older ("before") and newer ("after") neighbouring pages"""
+    if not rows:
+        return {"before": None, "after": None}
+    oldest, newest = (rows[-1], rows[0]) if newest_first else (rows[0], rows[-1])
+    return {
+        "before": encode_cursor(getattr(oldest, sort_attr), oldest.id),
+        "after": encode_cursor(getattr(newest, sort_attr), newest.id)
+    }
+
+@user_bp.errorhandler(PaginationError)
+def pagination_error(error):
+    return jsonify({"error": str(error)}), 400
 
 @user_bp.route('/user/profile', methods=['GET'])
+@login_required
 def get_profile():
     """Get user profile"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    # g.user may be a cached row that missed a charge made by another worker
+    user = refresh_credits(g.user)
+    
+    etag = version_etag('profile', user.id, user.name, user.email, user.is_active, user.credits_version, user.last_login)
+    response = not_modified(etag)
+    if response is not None:
+        return response
     
-    return jsonify({"user": user.to_dict()})
+    return tag(jsonify({"user": user.to_dict()}), etag)
 
 @user_bp.route('/user/credits', methods=['GET'])
+@login_required
 def get_credits():
     """Get user credits"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    user = refresh_credits(g.user)
     
-    return jsonify({
+    # Usage only changes with a charge or refund, or when the day rolls over
+    etag = version_etag('credits', user.id, user.credits_version, datetime.utcnow().date())
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    
+    read_your_writes(user.id)
+    return tag(jsonify({
         "credits": user.credits,
-        "usage_today": 0,  # Placeholder
-        "usage_this_month": 0  # Placeholder
-    })
+        **get_usage(user.id)
+    }), etag)
 
 @user_bp.route('/conversations', methods=['GET'])
+@login_required
 def get_conversations():
     """Get user conversations"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    user = g.user
     
-    conversations = Conversation.query.filter_by(user_id=user.id).order_by(Conversation.updated_at.desc()).all()
+    limit, before, after = page_params()
     
-    return jsonify({
-        "conversations": [conv.to_dict() for conv in conversations],
-        "total": len(conversations)
-    })
+    # Every change to a listed conversation bumps its updated_at; deletes
+    # change the count. Both come from the (user_id, updated_at) index.
+    total, last_updated = db.session.query(
+        func.count(Conversation.id), func.max(Conversation.updated_at)
+    ).filter(Conversation.user_id == user.id).one()
+    etag = version_etag('conversations', user.id, total, last_updated)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    
+    # Plain column tuples: no ORM instances, no per-field to_dict()
+    query = db.session.query(*CONVERSATION_COLUMNS).filter(Conversation.user_id == user.id)
+    conversations, has_more = keyset_page(
+        query, Conversation.updated_at, Conversation.id,
+        limit, before, after, newest_first=True
+    )
+    
+    return tag(page_response('conversations', CONVERSATION_FIELDS, conversations, {
+        "total": total,
+        "has_more": has_more,
+        "cursors": page_cursors(conversations, 'updated_at', newest_first=True)
+    }), etag)
 
 @user_bp.route('/conversations', methods=['POST'])
+@login_required
 def create_conversation():
     """Create new conversation"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    user = g.user
     
     data = request.get_json()
     title = data.get('title', 'New Conversation')
@@ -87,33 +119,115 @@ def create_conversation():
         message = Message(
             conversation_id=conversation.id,
             content=initial_message,
-            sender='user'
+            sender='user',
+            credits_used=0
         )
-        db.session.add(message)
-    
-    db.session.commit()
+        save_messages(user.id, [message])
+    else:
+        db.session.commit()
     
     return jsonify({
         "conversation": conversation.to_dict(),
         "message": message.to_dict() if initial_message else None
     })
 
+@user_bp.route('/conversations/search', methods=['GET'])
+@login_required
+def search_conversations():
+    """Full-text search over the user's messages, best matches first"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), MAX_LIMIT))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        raise PaginationError("Invalid limit or offset")
+    
+    results, has_more = search_message_history(g.user.id, query, limit, offset)
+    
+    return jsonify({
+        "query": query,
+        "results": results,
+        "has_more": has_more,
+        "next_offset": offset + len(results) if has_more else None
+    })
+
+@user_bp.route('/conversations/export', methods=['GET'])
+@login_required
+def export_conversations():
+    """Stream the user's full history as NDJSON (?format=gzip for .ndjson.gz)"""
+    user = g.user
+    compressed = request.args.get('format') == 'gzip'
+    
+    read_your_writes(user.id)
+    chunks = export_chunks({"id": user.id, "email": user.email, "name": user.name})
+    if compressed:
+        chunks = gzip_chunks(chunks)
+    filename = 'jarvis-history.ndjson.gz' if compressed else 'jarvis-history.ndjson'
+    # Release the request's connection; the export reads on its own
+    db.session.close()
+    
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compressed else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@user_bp.route('/conversations/import', methods=['POST'])
+@login_required
+def import_conversations():
+    """Add conversations from an NDJSON (optionally gzipped) export body"""
+    too_large = jsonify({
+        "error": "Import too large; use `flask history import` for histories "
+                 f"over {IMPORT_MAX_ROWS} rows or {IMPORT_MAX_BYTES} bytes"
+    }), 413
+    if request.content_length is not None and request.content_length > IMPORT_MAX_BYTES:
+        return too_large
+    # Also stops a chunked body without a Content-Length at the limit
+    request.max_content_length = IMPORT_MAX_BYTES
+    user_id = g.user.id
+    db.session.close()
+    
+    try:
+        # One batch past the row cap: nothing is committed before the
+        # limit is known, so a refused upload leaves no partial import
+        counts = import_lines(user_id, read_lines(request.stream),
+                              batch_rows=IMPORT_MAX_ROWS + 1, max_rows=IMPORT_MAX_ROWS)
+    except (ImportTooLargeError, RequestEntityTooLarge):
+        return too_large
+    except ImportFormatError as error:
+        return jsonify({"error": str(error)}), 400
+    
+    return jsonify({"imported": counts})
+
 @user_bp.route('/conversations/<conversation_id>/messages', methods=['GET'])
+@login_required
 def get_messages(conversation_id):
     """Get conversation messages"""
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    user = g.user
     
     # Verify conversation belongs to user
     conversation = Conversation.query.filter_by(id=conversation_id, user_id=user.id).first()
     if not conversation:
         return jsonify({"error": "Conversation not found"}), 404
     
-    messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.timestamp.asc()).all()
+    limit, before, after = page_params()
     
-    return jsonify({
-        "messages": [msg.to_dict() for msg in messages],
-        "total": len(messages)
-    })
+    etag = version_etag('messages', conversation.id, conversation.message_count, conversation.updated_at)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    
+    messages, has_more = keyset_page(
+        db.session.query(*MESSAGE_COLUMNS).filter(Message.conversation_id == conversation_id),
+        Message.timestamp, Message.id,
+        limit, before, after
+    )
+    
+    return tag(page_response('messages', MESSAGE_FIELDS, messages, {
+        "total": conversation.message_count,
+        "has_more": has_more,
+        "cursors": page_cursors(messages, 'timestamp')
+    }), etag)
 
@@ -0,0 +1,42 @@
+from datetime import datetime
+from flask import Blueprint, request, jsonify, g
+from extensions import db
+from services.auth import login_required
+from services.conditional import not_modified, tag, version_etag
+from services.jobs import prefers_async
+from services.workspace import refresh, request_refresh, snapshot
+from routes.jobs import job_response
+
+workspace_bp = Blueprint('workspace', __name__)
+
+@workspace_bp.route('', methods=['GET'])
+@login_required
+def get_snapshot():
+    """Workspace statistics from the stored snapshot (free, no AI call)"""
+    user_id = g.user.id
+    stats, info = snapshot(user_id)
+    db.session.commit()
+    
+    # Day-relative figures change at midnight even when the snapshot does not
+    etag = version_etag('workspace', user_id, info['version'], info['refreshing'], datetime.utcnow().date())
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    return tag(jsonify({"stats": stats, "snapshot": info}), etag)
+
+@workspace_bp.route('/refresh', methods=['POST'])
+@login_required
+def refresh_snapshot():
+    """Replay workspace changes into the snapshot now, or in the background"""
+    user_id = g.user.id
+    if prefers_async(request):
+        job = request_refresh(user_id)
+        db.session.commit()
+        return job_response(job, 202)
+    
+    result = refresh(user_id)
+    if result is None:
+        return jsonify({"error": "Refresh already in progress"}), 409
+    stats, info = snapshot(user_id)
+    db.session.commit()
+    return jsonify({"refresh": result, "stats": stats, "snapshot": info})
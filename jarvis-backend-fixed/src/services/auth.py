@@ -0,0 +1,160 @@
+import os
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+import jwt
+from flask import g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from sqlalchemy.orm.util import identity_key
+
+from extensions import db
+from models.user import User
+from services.cache import TTLCache
+
+TOKEN_TTL = timedelta(hours=24)
+
+_token_cache = TTLCache(
+    'auth_tokens',
+    maxsize=int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+)
+_user_cache = TTLCache(
+    'auth_users',
+    maxsize=int(os.environ.get('AUTH_USER_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('AUTH_USER_CACHE_TTL', 30))
+)
+
+_USER_COLUMNS = [column.key for column in User.__table__.columns]
+_STALE_USERS_KEY = 'auth_stale_user_ids'
+_jwt_secret = None
+
+
+def get_jwt_secret():
+    """JWT signing secret, read from the environment once per process"""
+    global _jwt_secret
+    if _jwt_secret is None:
+        _jwt_secret = os.environ.get('JWT_SECRET_KEY', 'dev-jwt-secret')
+    return _jwt_secret
+
+
+def issue_token(user):
+    """Create a signed JWT for the given user"""
+    payload = {
+        'user_id': user.id,
+        'email': user.email,
+        'exp': datetime.utcnow() + TOKEN_TTL
+    }
+    return jwt.encode(payload, get_jwt_secret(), algorithm='HS256')
+
+
+def bearer_token():
+    """Extract the bearer token from the Authorization header"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    return auth_header.split(' ')[1]
+
+
+def decode_token(token):
+    """Verify a JWT and return its claims, using the verified-token cache.
+
+    Raises jwt.ExpiredSignatureError / jwt.InvalidTokenError like jwt.decode.
+    """
+    claims = _token_cache.get(token)
+    if claims is not None:
+        if claims.get('exp', float('inf')) > time.time():
+            return claims
+        _token_cache.pop(token)
+
+    claims = jwt.decode(token, get_jwt_secret(), algorithms=['HS256'])
+    # Never keep a token in the cache past its own expiry
+    ttl = _token_cache.ttl
+    if 'exp' in claims:
+        ttl = min(ttl, claims['exp'] - time.time())
+    _token_cache.set(token, claims, ttl=ttl)
+    return claims
+
+
+def load_user(user_id):
+    """Return the User for user_id attached to the current session.
+
+    A short-lived snapshot of the row is cached so most requests attach the
+    user without issuing a SELECT.
+    """
+    user = db.session.identity_map.get(identity_key(User, user_id))
+    if user is not None:
+        return user
+
+    values = _user_cache.get(user_id)
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            _user_cache.set(user_id, {key: getattr(user, key) for key in _USER_COLUMNS})
+        return user
+
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user(user_id):
+    """Drop the cached row for user_id"""
+    _user_cache.pop(user_id)
+
+
+def mark_user_stale(session, user_id):
+    """Invalidate user_id now and again when session's transaction commits"""
+    invalidate_user(user_id)
+    session.info.setdefault(_STALE_USERS_KEY, set()).add(user_id)
+
+
+def get_current_user():
+    """Get current user from JWT token"""
+    if 'user' in g:
+        return g.user
+
+    user = None
+    token = bearer_token()
+    if token:
+        try:
+            user = load_user(decode_token(token)['user_id'])
+        except (jwt.InvalidTokenError, KeyError):
+            user = None
+
+    g.user = user
+    return user
+
+
+def login_required(view):
+    """Reject the request with 401 unless a valid token is present; sets g.user"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if get_current_user() is None:
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Any write to a users row (credits, last_login, ...) makes the cached
+# snapshot stale. Drop it at flush time and again once the transaction
+# commits, so a concurrent reader cannot re-cache the pre-commit value.
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        mark_user_stale(session, target.id)
+    else:
+        invalidate_user(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    for user_id in session.info.pop(_STALE_USERS_KEY, ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_stale_users(session, previous_transaction):
+    session.info.pop(_STALE_USERS_KEY, None)
@@ -0,0 +1,91 @@
+import hashlib
+import threading
+
+from flask import current_app, request
+
+from services.metrics import request_queries
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def version_etag(*parts):
+    """Weak ETag from cheap version columns (ids, counters, timestamps)"""
+    raw = '|'.join('' if part is None else str(part) for part in parts)
+    return hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+class ConditionalStats:
+    """Per-endpoint 304 counters, with the bytes and queries they saved.
+
+    Savings are estimated from the running average of the full responses
+    the same endpoint served.
+    """
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, endpoint):
+        return self._endpoints.setdefault(endpoint, {
+            'full': 0, 'not_modified': 0, 'full_bytes': 0, 'full_queries': 0,
+            'bytes_saved': 0, 'queries_saved': 0
+        })
+
+    def record_full(self, endpoint, size, queries):
+        with self._lock:
+            entry = self._entry(endpoint)
+            entry['full'] += 1
+            entry['full_bytes'] += size
+            entry['full_queries'] += queries
+
+    def record_not_modified(self, endpoint, queries):
+        with self._lock:
+            entry = self._entry(endpoint)
+            entry['not_modified'] += 1
+            if entry['full']:
+                entry['bytes_saved'] += entry['full_bytes'] // entry['full']
+                entry['queries_saved'] += max(0, entry['full_queries'] / entry['full'] - queries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'full': entry['full'],
+                    'not_modified': entry['not_modified'],
+                    'bytes_saved': entry['bytes_saved'],
+                    'queries_saved': round(entry['queries_saved'])
+                }
+                for endpoint, entry in self._endpoints.items()
+            }
+
+
+conditional_stats = ConditionalStats()
+
+
+def not_modified(etag):
+    """A 304 for etag when the request's If-None-Match matches it, else None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    conditional_stats.record_not_modified(request.endpoint, request_queries())
+    return tag(current_app.response_class(status=304), etag)
+
+
+def _counted(chunks, endpoint, queries):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    conditional_stats.record_full(endpoint, size, queries)
+
+
+def tag(response, etag):
+    """Attach etag to a response; full responses are counted for the stats"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    if response.status_code == 200:
+        if response.is_streamed:
+            # Sized as it is sent, without buffering the stream
+            response.response = _counted(response.response, request.endpoint, request_queries())
+        else:
+            conditional_stats.record_full(request.endpoint, response.calculate_content_length() or 0, request_queries())
+    return response
@@ -0,0 +1,124 @@
+import logging
+import os
+
+from sqlalchemy import update
+
+from extensions import db
+from models.conversation import Conversation
+from models.message import Message
+from services.cache import TTLCache
+from services.llm import ProviderError
+
+logger = logging.getLogger(__name__)
+
+WINDOW_TURNS = int(os.environ.get('CONTEXT_WINDOW_TURNS', 6))
+# Older unsummarized messages beyond this many are skipped rather than
+# folded, so a conversation that predates summaries loads in bounded time
+FOLD_LIMIT = int(os.environ.get('CONTEXT_FOLD_LIMIT', 100))
+
+_contexts = TTLCache(
+    'conversation_context',
+    maxsize=int(os.environ.get('CONTEXT_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('CONTEXT_CACHE_TTL', 600))
+)
+
+conversations = Conversation.__table__
+
+
+class ConversationContext:
+    """What a model sees of a conversation: a rolling summary plus recent turns.
+
+    recent holds every message not yet folded into the summary, oldest
+    first. Normally that is the last WINDOW_TURNS turns; messages beyond the
+    window are folded into the summary after each turn, so the context
+    costs O(window) to build however long the conversation gets.
+    """
+
+    def __init__(self, conversation_id, message_count, summary=None, summarized_count=0, recent=None,
+                 window_turns=WINDOW_TURNS):
+        self.conversation_id = conversation_id
+        self.message_count = message_count
+        self.summary = summary
+        self.summarized_count = summarized_count
+        self.recent = list(recent or [])
+        self.window = 2 * window_turns
+
+    def history(self):
+        """The recent turns passed verbatim, as [{'sender', 'content'}]"""
+        return self.recent[-self.window:] if self.window else []
+
+    def overflow(self):
+        return self.recent[:max(0, len(self.recent) - self.window)]
+
+    def append(self, sender, content):
+        self.recent.append({'sender': sender, 'content': content})
+        self.message_count += 1
+
+    def fold(self, provider):
+        """Fold messages that left the window into the summary.
+
+        Returns True when the summary changed. A provider failure leaves the
+        messages in recent so the next turn retries the fold.
+        """
+        overflow = self.overflow()
+        if not overflow:
+            return False
+        try:
+            self.summary = provider.fold_summary(self.summary, overflow)
+        except ProviderError:
+            logger.warning("Summary fold failed for conversation %s", self.conversation_id)
+            return False
+        self.summarized_count += len(overflow)
+        self.recent = self.recent[len(overflow):]
+        return True
+
+    def summary_values(self):
+        return {'context_summary': self.summary, 'summarized_count': self.summarized_count}
+
+    def save_summary(self):
+        """Store the summary on the conversation row (one UPDATE)"""
+        db.session.execute(
+            update(conversations)
+            .where(conversations.c.id == self.conversation_id)
+            .values(updated_at=conversations.c.updated_at, **self.summary_values())
+        )
+
+    def snapshot(self):
+        return (self.message_count, self.summary, self.summarized_count, list(self.recent))
+
+
+def load_context(conversation):
+    """Context for a freshly loaded conversation, from the cache when current"""
+    message_count = conversation.message_count or 0
+    cached = _contexts.get(conversation.id)
+    if cached is not None and cached[0] == message_count:
+        return ConversationContext(conversation.id, *cached)
+
+    summarized_count = min(conversation.summarized_count or 0, message_count)
+    pending = message_count - summarized_count
+    wanted = min(pending, 2 * WINDOW_TURNS + FOLD_LIMIT)
+    rows = (
+        Message.query
+        .with_entities(Message.sender, Message.content)
+        .filter_by(conversation_id=conversation.id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(wanted)
+        .all()
+    ) if wanted else []
+    recent = [{'sender': sender, 'content': content} for sender, content in reversed(rows)]
+    return ConversationContext(
+        conversation.id,
+        message_count,
+        conversation.context_summary,
+        message_count - len(recent),
+        recent
+    )
+
+
+def remember_context(context):
+    """Cache the context once its messages and summary are committed"""
+    _contexts.set(context.conversation_id, context.snapshot())
+
+
+def forget_context(conversation_id):
+    _contexts.pop(conversation_id)
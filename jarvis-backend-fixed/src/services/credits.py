@@ -0,0 +1,217 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import and_, event, insert, or_, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from extensions import db
+from models.credit_usage import CreditRollup, CreditUsage
+from models.user import User
+from services.auth import mark_user_stale
+from services.metrics import Counter
+
+_PENDING_USAGE_KEY = 'credit_usage_pending'
+
+users = User.__table__
+usage_table = CreditUsage.__table__
+rollups = CreditRollup.__table__
+
+credits_charged = Counter('jarvis_credits_charged_total', 'Credits charged, per operation', ['operation'])
+credits_refunded = Counter('jarvis_credits_refunded_total', 'Credits refunded, per operation', ['operation'])
+
+
+def _queue_usage(session, user_id, amount, operation):
+    session.info.setdefault(_PENDING_USAGE_KEY, []).append({
+        'user_id': user_id,
+        'amount': amount,
+        'operation': operation,
+        'created_at': datetime.utcnow()
+    })
+
+
+def charge_credits(user_id, amount, operation):
+    """Atomically take amount credits from user_id.
+
+    Issues a single conditional UPDATE in the current transaction and
+    returns the remaining balance, or None when the user cannot afford it.
+    The usage record is queued and batch-inserted when the session commits.
+    """
+    session = db.session()
+    stmt = (
+        update(users)
+        .where(users.c.id == user_id, users.c.credits >= amount)
+        .values(credits=users.c.credits - amount, credits_version=users.c.credits_version + 1)
+    )
+
+    if session.get_bind().dialect.update_returning:
+        row = session.execute(stmt.returning(users.c.credits, users.c.credits_version)).first()
+    else:
+        result = session.execute(stmt)
+        row = None
+        if result.rowcount:
+            row = session.execute(
+                select(users.c.credits, users.c.credits_version).where(users.c.id == user_id)
+            ).first()
+
+    if row is None:
+        return None
+    remaining, version = row
+
+    # Keep an already loaded User in step without marking it dirty
+    user = session.identity_map.get(identity_key(User, user_id))
+    if user is not None:
+        set_committed_value(user, 'credits', remaining)
+        set_committed_value(user, 'credits_version', version)
+    mark_user_stale(session, user_id)
+
+    _queue_usage(session, user_id, amount, operation)
+    return remaining
+
+
+def refund_credits(user_id, amount, operation):
+    """Give back credits for an operation that did not complete"""
+    session = db.session()
+    session.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        .values(credits=users.c.credits + amount, credits_version=users.c.credits_version + 1)
+    )
+    user = session.identity_map.get(identity_key(User, user_id))
+    if user is not None:
+        session.expire(user, ['credits', 'credits_version'])
+    mark_user_stale(session, user_id)
+
+    _queue_usage(session, user_id, -amount, f'{operation}_refund')
+
+
+def read_credits(user_id):
+    """The committed (credits, credits_version) of user_id, by primary key.
+
+    The user row attached to a request may be a cached snapshot up to
+    AUTH_USER_CACHE_TTL old when another worker made the last charge, so
+    anything that reports the balance reads it here.
+    """
+    return db.session.execute(
+        select(users.c.credits, users.c.credits_version).where(users.c.id == user_id)
+    ).one()
+
+
+def refresh_credits(user):
+    """Replace user's credits and credits_version with the committed values,
+    without marking it dirty; for ETags and responses built from them"""
+    credits, version = read_credits(user.id)
+    set_committed_value(user, 'credits', credits)
+    set_committed_value(user, 'credits_version', version)
+    return user
+
+
+def get_usage(user_id, now=None):
+    """Credits used today and this month, read from the rollup table"""
+    today = (now or datetime.utcnow()).date()
+    month_start = today.replace(day=1)
+
+    rows = db.session.execute(
+        select(rollups.c.period, rollups.c.amount).where(
+            rollups.c.user_id == user_id,
+            or_(
+                and_(rollups.c.period == 'day', rollups.c.period_start == today),
+                and_(rollups.c.period == 'month', rollups.c.period_start == month_start)
+            )
+        )
+    ).all()
+    usage = dict(rows)
+    return {
+        'usage_today': usage.get('day', 0),
+        'usage_this_month': usage.get('month', 0)
+    }
+
+
+def _rollup_rows(records):
+    totals = defaultdict(int)
+    for record in records:
+        day = record['created_at'].date()
+        totals[(record['user_id'], 'day', day)] += record['amount']
+        totals[(record['user_id'], 'month', day.replace(day=1))] += record['amount']
+    return [
+        {'user_id': user_id, 'period': period, 'period_start': start, 'amount': amount}
+        for (user_id, period, start), amount in totals.items()
+    ]
+
+
+def _upsert_rollups(executor, rows):
+    """executor is a Session or a Connection"""
+    dialect = executor.get_bind().dialect.name if isinstance(executor, Session) else executor.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(rollups)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[rollups.c.user_id, rollups.c.period, rollups.c.period_start],
+            set_={'amount': rollups.c.amount + stmt.excluded.amount}
+        )
+        executor.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = executor.execute(
+            update(rollups)
+            .where(
+                rollups.c.user_id == row['user_id'],
+                rollups.c.period == row['period'],
+                rollups.c.period_start == row['period_start']
+            )
+            .values(amount=rollups.c.amount + row['amount'])
+        )
+        if not result.rowcount:
+            executor.execute(insert(rollups), [row])
+
+
+def write_usage(executor, records):
+    """Batch-insert usage records and fold them into the rollups"""
+    if not records:
+        return
+    executor.execute(insert(usage_table), records)
+    _upsert_rollups(executor, _rollup_rows(records))
+
+
+_usage_sink = None
+
+
+def set_usage_sink(sink):
+    """Hand committed usage records to sink(records) instead of writing them
+    in the charging transaction (used by the write-behind queue)"""
+    global _usage_sink
+    _usage_sink = sink
+
+
+@event.listens_for(Session, 'before_commit')
+def _flush_pending_usage(session):
+    if _usage_sink is None:
+        write_usage(session, session.info.get(_PENDING_USAGE_KEY))
+
+
+@event.listens_for(Session, 'after_commit')
+def _hand_off_pending_usage(session):
+    records = session.info.pop(_PENDING_USAGE_KEY, None)
+    if not records:
+        return
+    _count_usage(records)
+    if _usage_sink is not None:
+        _usage_sink(records)
+
+
+def _count_usage(records):
+    for record in records:
+        if record['amount'] >= 0:
+            credits_charged.inc(record['amount'], operation=record['operation'])
+        else:
+            credits_refunded.inc(-record['amount'], operation=record['operation'].removesuffix('_refund'))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_usage(session, previous_transaction):
+    session.info.pop(_PENDING_USAGE_KEY, None)
@@ -0,0 +1,138 @@
+import logging
+import os
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = 'sqlite:///jarvis.db'
+
+# Postgres (and SQLite file) connection pool, per worker process
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 10))
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').upper()
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16384))
+
+_SYNCHRONOUS_NAMES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+
+
+def database_url():
+    """DATABASE_URL, with the postgres:// scheme some hosts hand out renamed
+    to the postgresql:// SQLAlchemy expects"""
+    url = os.environ.get('DATABASE_URL', DEFAULT_URL)
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _is_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for the database at uri"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == 'postgresql':
+        connect_args = {'connect_timeout': CONNECT_TIMEOUT, 'application_name': 'jarvis'}
+        if STATEMENT_TIMEOUT_MS:
+            connect_args['options'] = f'-c statement_timeout={STATEMENT_TIMEOUT_MS}'
+        return {
+            'pool_size': POOL_SIZE,
+            'max_overflow': MAX_OVERFLOW,
+            'pool_timeout': POOL_TIMEOUT,
+            'pool_recycle': POOL_RECYCLE,
+            'pool_pre_ping': POOL_PRE_PING,
+            'connect_args': connect_args
+        }
+    if backend == 'sqlite' and not _is_memory(url):
+        # A local file never drops idle connections, so no recycle or pre-ping
+        return {
+            'pool_size': POOL_SIZE,
+            'max_overflow': MAX_OVERFLOW,
+            'pool_timeout': POOL_TIMEOUT,
+            'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000.0}
+        }
+    return {}
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL lets readers run while a writer commits; NORMAL only fsyncs at
+        # checkpoints, which is still corruption-safe in WAL mode
+        cursor.execute(f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}')
+        cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+        cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine):
+    """Install per-connection settings; call before the first connection"""
+    if engine.dialect.name == 'sqlite' and not _is_memory(engine.url):
+        event.listen(engine, 'connect', _sqlite_pragmas)
+
+
+def describe_engine(engine):
+    """Effective engine settings, read back from a live connection"""
+    pool = engine.pool
+    report = {
+        'url': engine.url.render_as_string(hide_password=True),
+        'dialect': f'{engine.dialect.name}+{engine.dialect.driver}',
+        'pool': type(pool).__name__,
+        'pool_size': pool.size() if hasattr(pool, 'size') else None,
+        'max_overflow': getattr(pool, '_max_overflow', None),
+        'pool_timeout': pool.timeout() if hasattr(pool, 'timeout') else None,
+        'pool_recycle': pool._recycle,
+        'pool_pre_ping': pool._pre_ping
+    }
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite':
+            pragma = lambda name: connection.execute(text(f'PRAGMA {name}')).scalar()
+            report.update({
+                'journal_mode': pragma('journal_mode'),
+                'synchronous': _SYNCHRONOUS_NAMES.get(pragma('synchronous')),
+                'busy_timeout_ms': pragma('busy_timeout'),
+                'mmap_size': pragma('mmap_size'),
+                'cache_size': pragma('cache_size')
+            })
+        elif engine.dialect.name == 'postgresql':
+            show = lambda name: connection.execute(text(f'SHOW {name}')).scalar()
+            report.update({
+                'server_version': show('server_version'),
+                'statement_timeout': show('statement_timeout'),
+                'max_connections': show('max_connections')
+            })
+    return report
+
+
+_report = None
+
+
+def report_engine(engine):
+    """Log the effective settings once at startup; kept for /api/diagnostics"""
+    global _report
+    _report = describe_engine(engine)
+    logger.info("Database engine: %s", ', '.join(f'{key}={value}' for key, value in _report.items()))
+    return _report
+
+
+def engine_report(engine):
+    """Startup report plus the pool's current checkout state"""
+    if _report is None:
+        return None
+    return dict(_report, pool_status=engine.pool.status())
@@ -0,0 +1,58 @@
+import os
+import re
+import zlib
+
+EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM', 256))
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+class HashEmbedder:
+    """Local, dependency-free text embedder (signed feature hashing).
+
+    Words and word bigrams are hashed into dim buckets with a +/-1 sign and
+    the vector is L2-normalised, so the dot product of two embeddings is
+    their cosine similarity. It captures lexical overlap only, but runs
+    offline at a few microseconds per message and is stable across
+    processes, which is what incremental indexing and benchmarks need.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text):
+        words = _WORD.findall(text.lower())
+        yield from words
+        for first, second in zip(words, words[1:]):
+            yield f"{first} {second}"
+
+    def embed(self, text):
+        import numpy as np
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def embed_batch(self, texts):
+        """(len(texts), dim) float32 matrix"""
+        import numpy as np
+
+        matrix = np.empty((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed(text)
+        return matrix
+
+
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = HashEmbedder()
+    return _embedder
@@ -0,0 +1,270 @@
+import html
+import logging
+import os
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import DateTime, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration for Postgres; 'simple' suits mixed Dutch / English
+TS_CONFIG = os.environ.get('SEARCH_TS_CONFIG', 'simple')
+SNIPPET_WORDS = 16
+
+# Highlight markers chosen so they cannot occur in messages; the snippet is
+# HTML-escaped before they are turned into <mark> tags
+_OPEN, _CLOSE = '\ue000', '\ue001'
+_TOKEN = re.compile(r'(\w+)(\*?)', re.UNICODE)
+
+_SQLITE_DDL = [
+    # rowid mirrors messages.rowid. An explicit VACUUM may renumber those;
+    # run rebuild_fulltext_index() afterwards.
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, owner, tokenize = 'unicode61 remove_diacritics 2')",
+    # Conversations whose new messages a bulk load indexes itself, see
+    # deferred_fulltext(); only ever non-empty inside that transaction
+    "CREATE TABLE IF NOT EXISTS fulltext_deferred (conversation_id VARCHAR(36) PRIMARY KEY) WITHOUT ROWID",
+    "DROP TRIGGER IF EXISTS messages_fts_insert",
+    """CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages
+    WHEN NOT EXISTS (SELECT 1 FROM fulltext_deferred WHERE conversation_id = new.conversation_id) BEGIN
+        INSERT INTO messages_fts (rowid, content, owner)
+        SELECT new.rowid, new.content, replace(user_id, '-', '')
+        FROM conversations WHERE id = new.conversation_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        DELETE FROM messages_fts WHERE rowid = old.rowid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        UPDATE messages_fts SET content = new.content WHERE rowid = old.rowid;
+    END"""
+]
+
+_SQLITE_BACKFILL = """
+    INSERT INTO messages_fts (rowid, content, owner)
+    SELECT m.rowid, m.content, replace(c.user_id, '-', '')
+    FROM messages m JOIN conversations c ON c.id = m.conversation_id
+"""
+
+_SQLITE_DEFERRED_BACKFILL = _SQLITE_BACKFILL + """
+    WHERE m.rowid > :first AND m.conversation_id IN (SELECT conversation_id FROM fulltext_deferred)
+"""
+
+_SQLITE_SEARCH = f"""
+    SELECT m.id, m.conversation_id, m.sender, m.timestamp, hits.highlight, hits.score
+    FROM (
+        SELECT rowid,
+               snippet(messages_fts, 0, '{_OPEN}', '{_CLOSE}', '...', {SNIPPET_WORDS}) AS highlight,
+               bm25(messages_fts, 1.0, 0.0) AS score
+        FROM messages_fts
+        WHERE messages_fts MATCH :match
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+    ) hits
+    JOIN messages m ON m.rowid = hits.rowid
+    ORDER BY hits.score
+"""
+
+# A side table rather than a column on messages, so the user scope is an
+# indexed predicate next to the GIN match instead of a join
+_POSTGRES_DDL = [
+    """CREATE TABLE IF NOT EXISTS message_search (
+        message_id VARCHAR(36) PRIMARY KEY REFERENCES messages (id) ON DELETE CASCADE,
+        user_id VARCHAR(36) NOT NULL,
+        document TSVECTOR NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_message_search_document ON message_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS ix_message_search_user ON message_search (user_id)",
+    f"""CREATE OR REPLACE FUNCTION message_search_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO message_search (message_id, user_id, document)
+            SELECT NEW.id, user_id, to_tsvector('{TS_CONFIG}', NEW.content)
+            FROM conversations WHERE id = NEW.conversation_id;
+        ELSE
+            UPDATE message_search SET document = to_tsvector('{TS_CONFIG}', NEW.content)
+            WHERE message_id = NEW.id;
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS messages_search_sync ON messages",
+    "CREATE TRIGGER messages_search_sync AFTER INSERT OR UPDATE OF content ON messages "
+    "FOR EACH ROW EXECUTE FUNCTION message_search_sync()"
+]
+
+_POSTGRES_BACKFILL = f"""
+    INSERT INTO message_search (message_id, user_id, document)
+    SELECT m.id, c.user_id, to_tsvector('{TS_CONFIG}', m.content)
+    FROM messages m JOIN conversations c ON c.id = m.conversation_id
+    ON CONFLICT (message_id) DO NOTHING
+"""
+
+_POSTGRES_SEARCH = f"""
+    WITH query AS (SELECT to_tsquery('{TS_CONFIG}', :match) AS q)
+    SELECT m.id, m.conversation_id, m.sender, m.timestamp,
+           ts_headline('{TS_CONFIG}', m.content, query.q,
+                       'StartSel={_OPEN}, StopSel={_CLOSE}, MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS // 2}') AS highlight,
+           hits.score
+    FROM (
+        SELECT s.message_id, ts_rank_cd(s.document, query.q) AS score
+        FROM message_search s, query
+        WHERE s.user_id = :user_id AND s.document @@ query.q
+        ORDER BY score DESC, s.message_id
+        LIMIT :limit OFFSET :offset
+    ) hits
+    JOIN messages m ON m.id = hits.message_id, query
+    ORDER BY hits.score DESC, m.id
+"""
+
+_FALLBACK_SEARCH = """
+    SELECT m.id, m.conversation_id, m.sender, m.timestamp, m.content AS highlight, 0 AS score
+    FROM messages m JOIN conversations c ON c.id = m.conversation_id
+    WHERE c.user_id = :user_id AND {conditions}
+    ORDER BY m.timestamp DESC, m.id
+    LIMIT :limit OFFSET :offset
+"""
+
+_modes = {}
+
+
+def _index_table(dialect):
+    return {'sqlite': 'messages_fts', 'postgresql': 'message_search'}.get(dialect)
+
+
+def install_fulltext_index(engine):
+    """Create the full-text index and its sync triggers; backfill a new index"""
+    table = _index_table(engine.dialect.name)
+    if table is None:
+        return False
+    existed = inspect(engine).has_table(table)
+    try:
+        with engine.begin() as connection:
+            for ddl in _SQLITE_DDL if engine.dialect.name == 'sqlite' else _POSTGRES_DDL:
+                connection.exec_driver_sql(ddl)
+            if not existed:
+                backfill = _SQLITE_BACKFILL if engine.dialect.name == 'sqlite' else _POSTGRES_BACKFILL
+                connection.exec_driver_sql(backfill)
+    except OperationalError as error:
+        # SQLite built without FTS5: search falls back to a LIKE scan
+        logger.warning("Full-text index unavailable, using LIKE search: %s", error)
+        _modes.pop(engine.url, None)
+        return False
+    _modes.pop(engine.url, None)
+    return True
+
+
+def rebuild_fulltext_index(engine):
+    """Repopulate the index from messages, e.g. after a SQLite VACUUM"""
+    table = _index_table(engine.dialect.name)
+    if table is None:
+        return
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"DELETE FROM {table}")
+        connection.exec_driver_sql(_SQLITE_BACKFILL if engine.dialect.name == 'sqlite' else _POSTGRES_BACKFILL)
+
+
+@contextmanager
+def deferred_fulltext(connection, conversation_ids):
+    """Index the messages inserted into conversation_ids inside the block with
+    one INSERT ... SELECT at its end, instead of row by row.
+
+    FTS5 flushes its pending terms at every trigger invocation, which makes
+    per-row indexing the bulk of a large insert. Use only for conversations
+    nothing else writes to meanwhile (e.g. freshly imported ones). Postgres
+    keeps its trigger.
+    """
+    conversation_ids = list(conversation_ids)
+    if connection.dialect.name != 'sqlite' or not conversation_ids or _mode(connection.engine) != 'sqlite':
+        yield
+        return
+    connection.execute(
+        text("INSERT OR IGNORE INTO fulltext_deferred (conversation_id) VALUES (:conversation_id)"),
+        [{'conversation_id': conversation_id} for conversation_id in conversation_ids]
+    )
+    first = connection.exec_driver_sql("SELECT COALESCE(MAX(rowid), 0) FROM messages").scalar()
+    yield
+    connection.execute(text(_SQLITE_DEFERRED_BACKFILL), {'first': first})
+    connection.exec_driver_sql("DELETE FROM fulltext_deferred")
+
+
+def _mode(engine):
+    """'sqlite' / 'postgresql' when the index exists, else 'fallback'"""
+    mode = _modes.get(engine.url)
+    if mode is None:
+        table = _index_table(engine.dialect.name)
+        mode = engine.dialect.name if table and inspect(engine).has_table(table) else 'fallback'
+        _modes[engine.url] = mode
+    return mode
+
+
+def parse_query(query):
+    """[(token, is_prefix)] from free text; a trailing * asks for a prefix match"""
+    return [(token.lower(), bool(star)) for token, star in _TOKEN.findall(query)]
+
+
+def _fts5_match(user_id, terms):
+    words = ' '.join(f'"{token}"' + ('*' if prefix else '') for token, prefix in terms)
+    return f'owner : "{user_id.replace("-", "")}" AND content : ({words})'
+
+
+def _tsquery(terms):
+    return ' & '.join(f"'{token}'" + (':*' if prefix else '') for token, prefix in terms)
+
+
+def _render(highlight):
+    """HTML-escape a snippet and turn the markers into <mark> tags"""
+    return html.escape(highlight).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def _fallback_highlight(content, terms):
+    lower = content.lower()
+    positions = [lower.find(token) for token, _ in terms]
+    positions = [position for position in positions if position >= 0]
+    start = max(0, min(positions) - 60) if positions else 0
+    piece = content[start:start + 200]
+    for token, _ in terms:
+        piece = re.sub(f'({re.escape(token)})', f'{_OPEN}\\1{_CLOSE}', piece, flags=re.IGNORECASE)
+    return ('...' if start else '') + piece + ('...' if start + 200 < len(content) else '')
+
+
+def search_message_history(user_id, query, limit=20, offset=0):
+    """Ranked, highlighted matches for query among the user's messages.
+
+    Returns (results, has_more). Best matches come first; each result's
+    'highlight' is an HTML-safe snippet with the matched words in <mark>.
+    """
+    terms = parse_query(query)
+    if not terms:
+        return [], False
+
+    engine = db.engine
+    mode = _mode(engine)
+    params = {'user_id': user_id, 'limit': limit + 1, 'offset': offset}
+    if mode == 'sqlite':
+        statement, params['match'] = _SQLITE_SEARCH, _fts5_match(user_id, terms)
+    elif mode == 'postgresql':
+        statement, params['match'] = _POSTGRES_SEARCH, _tsquery(terms)
+    else:
+        conditions = []
+        for position, (token, _) in enumerate(terms):
+            conditions.append(f"lower(m.content) LIKE :term{position}")
+            params[f'term{position}'] = f'%{token}%'
+        statement = _FALLBACK_SEARCH.format(conditions=' AND '.join(conditions))
+
+    rows = db.session.execute(text(statement).columns(timestamp=DateTime), params).all()
+    has_more = len(rows) > limit
+    results = []
+    for row in rows[:limit]:
+        highlight = row.highlight if mode != 'fallback' else _fallback_highlight(row.highlight, terms)
+        results.append({
+            'message_id': row.id,
+            'conversation_id': row.conversation_id,
+            'sender': row.sender,
+            'highlight': _render(highlight),
+            'score': round(abs(float(row.score)), 4),
+            'timestamp': row.timestamp.isoformat() if row.timestamp else None
+        })
+    return results, has_more
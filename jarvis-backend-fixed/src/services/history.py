@@ -0,0 +1,323 @@
+import gzip
+import io
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime
+from json.encoder import encode_basestring
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, insert, select, update
+
+from extensions import db
+from models.conversation import Conversation, PREVIEW_LENGTH
+from models.message import Message
+from models.user import User
+from services import vector_index
+from services.fulltext import deferred_fulltext
+
+FORMAT_VERSION = 1
+# Rows fetched per cursor round trip on export, and inserted per
+# executemany + commit on import
+BATCH_ROWS = int(os.environ.get('HISTORY_BATCH_ROWS', 10000))
+GZIP_LEVEL = int(os.environ.get('HISTORY_GZIP_LEVEL', 3))
+# Uploads through the API are capped; larger histories go through
+# `flask history import`, which has no request timeout
+IMPORT_MAX_BYTES = int(os.environ.get('HISTORY_IMPORT_MAX_BYTES', 10 * 1024 * 1024))
+IMPORT_MAX_ROWS = int(os.environ.get('HISTORY_IMPORT_MAX_ROWS', 20000))
+
+conversations = Conversation.__table__
+messages = Message.__table__
+
+_export_query = (
+    select(
+        conversations.c.id.label('conversation_id'),
+        conversations.c.title,
+        conversations.c.created_at,
+        conversations.c.updated_at,
+        conversations.c.context_summary,
+        conversations.c.summarized_count,
+        messages.c.id.label('message_id'),
+        messages.c.sender,
+        messages.c.content,
+        messages.c.credits_used,
+        messages.c.timestamp
+    )
+    .select_from(conversations.outerjoin(messages, messages.c.conversation_id == conversations.c.id))
+    .where(conversations.c.user_id == bindparam('user_id'))
+    # Both orderings match an index, so rows stream without a sort
+    .order_by(conversations.c.updated_at, conversations.c.id, messages.c.timestamp, messages.c.id)
+)
+
+# Lines are formatted directly: one C-level string escape per text field is
+# several times faster than a json.dumps call per record
+_CONVERSATION_LINE = (
+    '{"type":"conversation","id":%s,"title":%s,"created_at":%s,"updated_at":%s,'
+    '"context_summary":%s,"summarized_count":%d}'
+)
+_MESSAGE_LINE = (
+    '{"type":"message","id":%s,"conversation_id":%s,"sender":%s,"content":%s,'
+    '"credits_used":%d,"timestamp":%s}'
+)
+
+_set_conversation_stats = (
+    update(conversations)
+    .where(conversations.c.id == bindparam('b_id'))
+    .values(
+        message_count=conversations.c.message_count + bindparam('b_count'),
+        last_message_preview=bindparam('b_preview'),
+        updated_at=conversations.c.updated_at
+    )
+)
+
+
+class ImportFormatError(ValueError):
+    """Raised for an import line that is not a valid history record.
+
+    imported holds the counts of the batches committed before it.
+    """
+
+    def __init__(self, message, imported=None):
+        super().__init__(message)
+        self.imported = imported
+
+
+class ImportTooLargeError(ImportFormatError):
+    """Raised when an import holds more than max_rows conversations and messages"""
+
+
+def _quote(value):
+    return 'null' if value is None else encode_basestring(value)
+
+
+def _quote_time(value):
+    return 'null' if value is None else f'"{value.isoformat()}"'
+
+
+def export_chunks(user, batch_rows=BATCH_ROWS):
+    """NDJSON export of user's history as a stream of byte chunks.
+
+    One header line, then every conversation followed by its messages, oldest
+    first. Rows come from a server-side cursor batch_rows at a time, so
+    memory stays constant however long the history is.
+    """
+    yield (json.dumps({
+        'type': 'export',
+        'version': FORMAT_VERSION,
+        'email': user['email'],
+        'name': user['name'],
+        'exported_at': datetime.utcnow().isoformat()
+    }, ensure_ascii=False, separators=(',', ':')) + '\n').encode()
+
+    current = None
+    with db.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_rows).execute(
+            _export_query, {'user_id': user['id']}
+        )
+        for rows in result.partitions():
+            lines = []
+            for (conversation_id, title, created_at, updated_at, summary, summarized_count,
+                 message_id, sender, content, credits_used, timestamp) in rows:
+                if conversation_id != current:
+                    current = conversation_id
+                    lines.append(_CONVERSATION_LINE % (
+                        _quote(conversation_id), _quote(title), _quote_time(created_at),
+                        _quote_time(updated_at), _quote(summary), summarized_count or 0
+                    ))
+                if message_id is not None:
+                    lines.append(_MESSAGE_LINE % (
+                        _quote(message_id), _quote(conversation_id), _quote(sender), _quote(content),
+                        credits_used or 0, _quote_time(timestamp)
+                    ))
+            lines.append('')
+            yield '\n'.join(lines).encode()
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """Compress a stream of byte chunks into one gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def read_lines(stream):
+    """Lines of an NDJSON upload, gunzipped when it starts with the gzip magic"""
+    buffered = io.BufferedReader(stream) if not hasattr(stream, 'peek') else stream
+    if buffered.peek(2)[:2] == b'\x1f\x8b':
+        buffered = gzip.GzipFile(fileobj=buffered)
+    return io.TextIOWrapper(buffered, encoding='utf-8')
+
+
+def _timestamp(value, number):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ImportFormatError(f"Line {number}: invalid timestamp")
+
+
+class HistoryImporter:
+    """Insert exported conversations and messages for a user in batches.
+
+    Conversations get fresh ids, so an export can be imported next to the
+    original (or twice) without collisions. Rows are inserted with one
+    executemany per table and committed every batch_rows rows, keeping write
+    transactions short on a busy database.
+    """
+
+    def __init__(self, user_id, batch_rows=BATCH_ROWS, max_rows=None):
+        self.user_id = user_id
+        self.batch_rows = batch_rows
+        self.max_rows = max_rows
+        self.rows = 0
+        self.ids = {}
+        self.stats = {}
+        self.pending_conversations = []
+        self.pending_messages = []
+        self.counts = {'conversations': 0, 'messages': 0, 'skipped': 0}
+
+    def add(self, record, number):
+        kind = record.get('type') if isinstance(record, dict) else None
+        if kind in ('conversation', 'message'):
+            self.rows += 1
+            if self.max_rows is not None and self.rows > self.max_rows:
+                raise ImportTooLargeError(f"Line {number}: more than {self.max_rows} rows")
+        if kind == 'conversation':
+            self._add_conversation(record, number)
+        elif kind == 'message':
+            self._add_message(record, number)
+        elif kind == 'export':
+            if record.get('version') != FORMAT_VERSION:
+                raise ImportFormatError(f"Line {number}: unsupported export version")
+        else:
+            self.counts['skipped'] += 1
+        if len(self.pending_conversations) + len(self.pending_messages) >= self.batch_rows:
+            self.flush()
+
+    def _add_conversation(self, record, number):
+        new_id = str(uuid.uuid4())
+        self.ids[record.get('id')] = new_id
+        created_at = _timestamp(record.get('created_at'), number) or datetime.utcnow()
+        self.pending_conversations.append({
+            'id': new_id,
+            'user_id': self.user_id,
+            'title': str(record.get('title') or 'Imported conversation')[:255],
+            'created_at': created_at,
+            'updated_at': _timestamp(record.get('updated_at'), number) or created_at,
+            'message_count': 0,
+            'context_summary': record.get('context_summary'),
+            'summarized_count': int(record.get('summarized_count') or 0)
+        })
+        self.counts['conversations'] += 1
+
+    def _add_message(self, record, number):
+        conversation_id = self.ids.get(record.get('conversation_id'))
+        content = record.get('content')
+        if conversation_id is None or not isinstance(content, str):
+            raise ImportFormatError(f"Line {number}: message without a preceding conversation or content")
+        timestamp = _timestamp(record.get('timestamp'), number) or datetime.utcnow()
+        self.pending_messages.append({
+            'id': str(uuid.uuid4()),
+            'conversation_id': conversation_id,
+            'content': content,
+            'sender': str(record.get('sender') or 'user')[:50],
+            'credits_used': int(record.get('credits_used') or 0),
+            'timestamp': timestamp
+        })
+        stats = self.stats.get(conversation_id)
+        if stats is None:
+            self.stats[conversation_id] = stats = {
+                'b_id': conversation_id, 'b_count': 0, 'b_preview': None, 'b_timestamp': None
+            }
+        stats['b_count'] += 1
+        if stats['b_timestamp'] is None or timestamp >= stats['b_timestamp']:
+            stats['b_timestamp'] = timestamp
+            stats['b_preview'] = content[:PREVIEW_LENGTH]
+
+    def flush(self):
+        """Insert and commit the pending rows"""
+        if not self.pending_conversations and not self.pending_messages:
+            return
+        # stats only covers conversations with pending messages
+        updates, self.stats = list(self.stats.values()), {}
+        with db.engine.begin() as connection:
+            if self.pending_conversations:
+                connection.execute(insert(conversations), self.pending_conversations)
+            if self.pending_messages:
+                with deferred_fulltext(connection, [update['b_id'] for update in updates]):
+                    connection.execute(insert(messages), self.pending_messages)
+                connection.execute(_set_conversation_stats, updates)
+        if vector_index.ENABLED and self.pending_messages:
+            vector_index.indexer.submit([
+                (f"message:{row['id']}", self.user_id, row['content']) for row in self.pending_messages
+            ])
+        self.counts['messages'] += len(self.pending_messages)
+        self.pending_conversations = []
+        self.pending_messages = []
+
+
+def import_lines(user_id, lines, batch_rows=BATCH_ROWS, max_rows=None):
+    """Import NDJSON history lines for user_id; returns the row counts"""
+    importer = HistoryImporter(user_id, batch_rows, max_rows)
+    number = 0
+    try:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                importer.add(record, number)
+            except ImportFormatError:
+                raise
+            except (TypeError, ValueError):
+                raise ImportFormatError(f"Line {number}: invalid record")
+    except (UnicodeDecodeError, EOFError, gzip.BadGzipFile):
+        raise ImportFormatError(f"Line {number + 1}: unreadable input", importer.counts)
+    except ImportFormatError as error:
+        error.imported = importer.counts
+        raise
+    importer.flush()
+    return importer.counts
+
+
+history_cli = AppGroup('history', help="Export or import a user's conversation history.")
+
+
+def _cli_user(email):
+    user = db.session.execute(select(User.id, User.email, User.name).where(User.email == email)).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    return dict(user._mapping)
+
+
+@history_cli.command('export')
+@click.argument('email')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+def export_command(email, path):
+    """Write EMAIL's history to PATH (gzipped when PATH ends in .gz)."""
+    chunks = export_chunks(_cli_user(email))
+    if path.endswith('.gz'):
+        chunks = gzip_chunks(chunks)
+    with open(path, 'wb') as handle:
+        for chunk in chunks:
+            handle.write(chunk)
+
+
+@history_cli.command('import')
+@click.argument('email')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_command(email, path):
+    """Add the history in PATH (NDJSON, optionally gzipped) to EMAIL's account."""
+    user = _cli_user(email)
+    with open(path, 'rb') as handle:
+        try:
+            counts = import_lines(user['id'], read_lines(handle))
+        except ImportFormatError as error:
+            raise click.ClickException(str(error))
+    click.echo(f"Imported {counts['conversations']} conversations and {counts['messages']} messages")
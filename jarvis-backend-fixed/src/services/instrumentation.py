@@ -0,0 +1,103 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+
+from flask import g, request
+
+from services.metrics import (
+    COUNT_BUCKETS, Counter, Histogram, request_db_time, request_queries, start_flusher
+)
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their SQL count and time (0 = off)
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 0))
+# Fraction of requests run under cProfile; slow ones get their profile dumped
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOP = 15
+
+requests_total = Counter(
+    'jarvis_http_requests_total', 'HTTP requests, per endpoint, method and status', ['endpoint', 'method', 'status']
+)
+request_duration = Histogram(
+    'jarvis_http_request_duration_seconds', 'Request latency, per endpoint', ['endpoint']
+)
+request_sql_queries = Histogram(
+    'jarvis_http_request_sql_queries', 'SQL statements executed per request, per endpoint', ['endpoint'],
+    buckets=COUNT_BUCKETS
+)
+request_sql_duration = Histogram(
+    'jarvis_http_request_sql_duration_seconds', 'Time spent in SQL per request, per endpoint', ['endpoint']
+)
+slow_requests = Counter('jarvis_http_slow_requests_total', 'Requests over SLOW_REQUEST_MS, per endpoint', ['endpoint'])
+
+# One profile at a time: cProfile cannot nest, and threads or greenlets of
+# one worker would otherwise fight over it
+_profiling = threading.Lock()
+
+
+def _start_request():
+    start_flusher()
+    g.request_started = time.perf_counter()
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE and _profiling.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _finish_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiling.release()
+
+    endpoint = request.endpoint or 'unmatched'
+    queries = request_queries()
+    sql_time = request_db_time()
+    requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    request_duration.observe(elapsed, endpoint=endpoint)
+    request_sql_queries.observe(queries, endpoint=endpoint)
+    request_sql_duration.observe(sql_time, endpoint=endpoint)
+
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        slow_requests.inc(endpoint=endpoint)
+        logger.warning(
+            "Slow request: %s %s -> %d in %.0f ms (%d queries, %.0f ms SQL)",
+            request.method, request.path, response.status_code, elapsed * 1000, queries, sql_time * 1000
+        )
+        if profiler is not None:
+            _dump_profile(profiler, endpoint)
+    return response
+
+
+def _end_request(error=None):
+    # after_request is skipped when a response could not be built
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiling.release()
+
+
+def _dump_profile(profiler, endpoint):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{endpoint.replace('.', '-')}-{int(time.time() * 1000)}-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    logger.warning("Profile written to %s\n%s", path, summary.getvalue())
+
+
+def instrument(app):
+    """Record latency, status and SQL usage of every request of app"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
@@ -0,0 +1,91 @@
+import json
+import re
+
+
+def _trie_pattern(keywords):
+    """Regex source for a keyword trie: shared prefixes are matched once"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = '(?:' + '|'.join(branches) + ')'
+        # Greedy: a longer keyword through this node is preferred over the one ending here
+        return body + '?' if '' in node else body
+
+    return build(trie)
+
+
+class IntentRouter:
+    """Classify a message against keyword intents in a single scan.
+
+    All keywords are compiled into one trie-shaped regular expression, so
+    each position of the message is tested against every keyword at once.
+    The cost grows with the message length, not with keywords x length.
+    Matching is plain substring matching on the lowercased message, and
+    overlapping keywords are all found. Intents are tried in priority order.
+    An intent fires when one of its triggers occurs and, if it lists
+    'requires', one of those keywords occurs too.
+    """
+
+    def __init__(self, intents):
+        self.intents = intents
+        keywords = set()
+        self.triggered_by = {}
+        for index, intent in enumerate(intents):
+            for trigger in intent['triggers']:
+                self.triggered_by.setdefault(trigger, []).append(index)
+            keywords.update(intent['triggers'])
+            keywords.update(intent.get('requires', ()))
+
+        self.pattern = re.compile(_trie_pattern(keywords))
+        # A match is the longest keyword at its position; the shorter
+        # keywords it starts with (or contains) occur there as well
+        self.implied = {
+            keyword: frozenset(other for other in keywords if other in keyword)
+            for keyword in keywords
+        }
+
+    def keywords_in(self, message):
+        found = set()
+        text = message.lower()
+        search = self.pattern.search
+        match = search(text)
+        while match is not None:
+            found |= self.implied[match.group()]
+            match = search(text, match.start() + 1)
+        return found
+
+    def classify(self, message):
+        """Return (intent, required keyword or None), or (None, None)"""
+        found = self.keywords_in(message)
+        candidates = sorted({index for keyword in found for index in self.triggered_by.get(keyword, ())})
+        for index in candidates:
+            intent = self.intents[index]
+            requires = intent.get('requires')
+            if not requires:
+                return intent, None
+            for keyword in requires:
+                if keyword in found:
+                    return intent, keyword
+        return None, None
+
+
+def load_intents(path):
+    """Read {"intents": [...], "fallback": [...]} from a JSON file"""
+    with open(path, encoding='utf-8') as handle:
+        config = json.load(handle)
+    for intent in config['intents']:
+        if not intent.get('triggers') or 'response' not in intent:
+            raise ValueError(f"Intent {intent.get('name')!r} needs triggers and a response")
+        # Messages are matched lowercased
+        intent['triggers'] = [trigger.lower() for trigger in intent['triggers']]
+        if intent.get('requires'):
+            intent['requires'] = [keyword.lower() for keyword in intent['requires']]
+    return config
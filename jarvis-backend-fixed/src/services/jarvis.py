@@ -0,0 +1,76 @@
+import os
+import random
+
+from services.intents import IntentRouter, load_intents
+
+JARVIS_SYSTEM_PROMPT = (
+    "Je bent Jarvis, de AI-butler uit Iron Man. Je spreekt de gebruiker aan met "
+    "'{user_name}', bent loyaal en voert elk verzoek uit, maar laat droog "
+    "sarcasme en beleefde twijfel over de methode doorschemeren. Antwoord in "
+    "de taal van de gebruiker."
+)
+
+# Routing table, in priority order. Override with JARVIS_INTENTS_FILE
+# (JSON with the same "intents" / "fallback" layout).
+DEFAULT_INTENTS = {
+    "intents": [
+        {
+            "name": "set_name",
+            "triggers": ["noem me", "call me", "ik ben", "mijn naam is"],
+            "requires": ["dokter", "doctor", "mevrouw", "hendrik van aalsmeer tot zwolle"],
+            "response": "Meneer, ik zal u {match} gebruiken, meneer."
+        },
+        {
+            "name": "email",
+            "triggers": ["email", "mail"],
+            "response": "Natuurlijk {user_name}, ik zal uw e-mails beheren. Hoewel uw inbox organisatie... interessant is."
+        },
+        {
+            "name": "agenda",
+            "triggers": ["agenda", "calendar", "afspraak"],
+            "response": "Zeker {user_name}, ik regel uw agenda. Uw tijdmanagement behoeft wel enige... optimalisatie."
+        },
+        {
+            "name": "document",
+            "triggers": ["document", "bestand"],
+            "response": "Uiteraard {user_name}, ik help met uw documenten. Uw bestandsstructuur is... creatief."
+        },
+        {
+            "name": "help",
+            "triggers": ["help", "hulp"],
+            "response": "Altijd tot uw dienst {user_name}. Wat kan ik voor u doen, ondanks mijn twijfels over uw prioriteiten?"
+        }
+    ],
+    # Jarvis responses with personality
+    "fallback": [
+        "Natuurlijk {user_name}, ik voer dit direct uit ondanks mijn twijfels over de methode.",
+        "Zeer wel {user_name}, hoewel ik me afvraag of dit de meest efficiënte aanpak is.",
+        "Zoals u wenst {user_name}. Ik heb mijn bedenkingen, maar uw wil is wet.",
+        "Uiteraard {user_name}. Ik zal dit uitvoeren, ondanks mijn reserveringen over de uitkomst.",
+        "Zeker {user_name}, hoewel een meer systematische benadering wellicht beter zou zijn.",
+        "Direct {user_name}. Ik betwijfel de logica, maar voer uw instructies trouw uit.",
+        "Onmiddellijk {user_name}, ook al zou ik een alternatieve strategie aanbevelen.",
+        "Jawel {user_name}, ik zal dit regelen ondanks mijn twijfels over de timing."
+    ]
+}
+
+_config = None
+_router = None
+
+
+def get_router():
+    """Intent router compiled once per process"""
+    global _config, _router
+    if _router is None:
+        path = os.environ.get('JARVIS_INTENTS_FILE')
+        _config = load_intents(path) if path else DEFAULT_INTENTS
+        _router = IntentRouter(_config['intents'])
+    return _router
+
+
+def get_jarvis_response(message, user_name="meneer", rng=random):
+    """Generate Jarvis response with personality"""
+    intent, match = get_router().classify(message)
+    if intent:
+        return intent['response'].format(user_name=user_name, match=match)
+    return rng.choice(_config['fallback']).format(user_name=user_name)
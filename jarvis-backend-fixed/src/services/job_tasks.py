@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+
+# Job bodies: payload dict in, JSON-serialisable result out, report(dict)
+# for progress. They never touch the database or the Flask app, so the
+# CPU-bound ones can run in a spawned process that imports only this module.
+
+
+def run_in_process(function, payload, job_id, progress):
+    """Entry point in a pool process: progress goes through a manager queue"""
+    return function(payload, lambda data: progress.put((job_id, data)))
+
+
+def analyze_workspace(payload, report):
+    from services.llm import get_provider
+
+    # Statistics come from the workspace snapshot read when the job was queued
+    stats = payload['stats']
+    suggestions = get_provider().analyze_workspace(stats)
+    return {
+        "analysis": {**suggestions, **stats},
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec='seconds')
+    }
+
+
+def summarize(payload, report):
+    from services.llm import get_provider
+    from services.summarizer import MapReduceSummarizer
+
+    summarizer = MapReduceSummarizer(get_provider().summarize)
+    for progress in summarizer.run([payload['text']]):
+        if 'summary' in progress:
+            break
+        report(progress)
+    summary = progress['summary']
+    return {
+        "summary": summary,
+        "original_length": progress['characters'],
+        "summary_length": len(summary),
+        "chunks": progress['chunks']
+    }
@@ -0,0 +1,456 @@
+import fcntl
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models.job import Job
+from services import job_tasks, response_cache, workspace
+from services.credits import charge_credits, refund_credits
+from services.llm import ProviderError
+from services.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Which web workers run jobs. one: a single worker per host and database,
+# elected through a lock file (another takes over when it exits); all: every
+# worker, each with its own pools; false: none, `flask jobs work` does it all
+IN_WEB = os.environ.get('JOBS_IN_WEB', 'one').lower()
+if IN_WEB in ('1', 'true', 'yes'):
+    IN_WEB = 'all'
+elif IN_WEB in ('0', 'no', 'off'):
+    IN_WEB = 'false'
+THREADS = int(os.environ.get('JOB_THREADS', 4))
+# 0 runs process jobs on the thread pool instead
+PROCESSES = int(os.environ.get('JOB_PROCESSES', 2))
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', 10))
+# A running job without a heartbeat for this long lost its worker
+STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 60))
+MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 2))
+MAX_INPUT_BYTES = int(os.environ.get('JOB_MAX_INPUT_BYTES', 20 * 1024 * 1024))
+PROGRESS_INTERVAL = 0.5
+
+_WAKE_KEY = 'jobs_enqueued'
+
+jobs_table = Job.__table__
+
+jobs_finished = Counter('jarvis_jobs_finished_total', 'Finished jobs, per kind and status', ['kind', 'status'])
+job_duration = Histogram('jarvis_job_duration_seconds', 'Job run time, per kind', ['kind'])
+
+
+class JobKind:
+    """An operation that can run as a job: its credit cost and where it runs.
+
+    executor is 'thread' for work that waits on the network and 'process'
+    for CPU-bound work. Thread jobs run inside an app context, so they may
+    use the database; after(payload, result) runs in the dispatching
+    process once the job succeeded.
+    """
+
+    def __init__(self, name, cost, function, executor='thread', after=None):
+        self.name = name
+        self.cost = cost
+        self.function = function
+        self.executor = executor
+        self.after = after
+
+
+def _cache_summary(payload, result):
+    if payload.get('cache_key'):
+        response_cache.put(payload['cache_key'], result['summary'])
+
+
+KINDS = {
+    kind.name: kind for kind in (
+        JobKind('analyze_workspace', 5, job_tasks.analyze_workspace),
+        JobKind('summarize', 2, job_tasks.summarize, executor='process', after=_cache_summary),
+        JobKind('refresh_workspace', 0, workspace.refresh_job),
+    )
+}
+
+
+def prefers_async(request):
+    """True when the client sent Prefer: respond-async (RFC 7240)"""
+    return any(token.strip() == 'respond-async' for token in request.headers.get('Prefer', '').split(','))
+
+
+def enqueue(user_id, kind, payload):
+    """Reserve the kind's credits and queue a job in the current transaction.
+
+    Returns the Job, or None when the user cannot afford it. The caller
+    commits; the local dispatcher is woken once it has.
+    """
+    cost = KINDS[kind].cost
+    if cost and charge_credits(user_id, cost, kind) is None:
+        return None
+    job = Job(user_id=user_id, kind=kind, payload=json.dumps(payload), credits_reserved=cost)
+    db.session.add(job)
+    db.session.flush()
+    db.session.info[_WAKE_KEY] = True
+    return job
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_dispatcher(session):
+    if session.info.pop(_WAKE_KEY, None) and _runner is not None and _runner.pid == os.getpid():
+        _runner.wake()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_wake(session, previous_transaction):
+    session.info.pop(_WAKE_KEY, None)
+
+
+def cancel(user_id, job_id):
+    """Cancel a queued job and refund it; False once it has started"""
+    job = db.session.execute(
+        select(jobs_table.c.kind, jobs_table.c.credits_reserved)
+        .where(jobs_table.c.id == job_id, jobs_table.c.user_id == user_id)
+    ).first()
+    if job is None:
+        return False
+    result = db.session.execute(
+        update(jobs_table)
+        .where(jobs_table.c.id == job_id, jobs_table.c.status == 'queued')
+        .values(status='cancelled', finished_at=datetime.utcnow(), credits_settled=0, updated_at=datetime.utcnow())
+    )
+    if not result.rowcount:
+        return False
+    if job.credits_reserved:
+        refund_credits(user_id, job.credits_reserved, job.kind)
+    jobs_finished.inc(kind=job.kind, status='cancelled')
+    return True
+
+
+class JobRunner:
+    """Claims queued jobs from the database and runs them on local pools.
+
+    Any number of runners (web workers, `flask jobs work` processes, other
+    hosts) can share the table: a job is claimed with a conditional UPDATE
+    from queued to running, so exactly one runner gets it. Running jobs
+    carry a heartbeat; a runner that finds one gone stale requeues it, or
+    fails and refunds it after MAX_ATTEMPTS.
+    """
+
+    def __init__(self, app, threads=THREADS, processes=PROCESSES, poll_interval=POLL_INTERVAL):
+        self.app = app
+        self.pid = os.getpid()
+        self.worker_id = f'{socket.gethostname()}:{self.pid}'[:100]
+        self.poll_interval = poll_interval
+        self.capacity = {'thread': threads, 'process': processes}
+        self.active = {'thread': 0, 'process': 0}
+        self.finished = {'succeeded': 0, 'failed': 0}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._threads = ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix='job')
+        # Outcomes are stored here, so a full job pool never delays them
+        self._finisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-finish')
+        self._processes = None
+        self._progress = None
+        self._last_progress = {}
+        self._last_heartbeat = 0.0
+        self._thread = threading.Thread(target=self._loop, name='job-dispatcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def _executor_for(self, kind):
+        return 'process' if kind.executor == 'process' and self.capacity['process'] else 'thread'
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    if time.monotonic() - self._last_heartbeat >= HEARTBEAT_INTERVAL:
+                        self._last_heartbeat = time.monotonic()
+                        self._heartbeat()
+                        self._reclaim_stale()
+                    self._dispatch()
+            except Exception:
+                logger.exception("Job dispatcher iteration failed")
+
+    def _free(self, executor):
+        with self._lock:
+            return self.capacity[executor] - self.active[executor] if self.capacity[executor] else 0
+
+    def _dispatch(self):
+        for executor in ('thread', 'process'):
+            free = self._free(executor)
+            kinds = [name for name, kind in KINDS.items() if self._executor_for(kind) == executor]
+            if free <= 0 or not kinds:
+                continue
+            candidates = db.session.execute(
+                select(jobs_table.c.id)
+                .where(jobs_table.c.status == 'queued', jobs_table.c.kind.in_(kinds))
+                .order_by(jobs_table.c.created_at)
+                .limit(free)
+            ).scalars().all()
+            db.session.rollback()
+            for job_id in candidates:
+                job = self._claim(job_id)
+                if job is not None:
+                    self._start(job, executor)
+
+    def _claim(self, job_id):
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            claimed = connection.execute(
+                update(jobs_table)
+                .where(jobs_table.c.id == job_id, jobs_table.c.status == 'queued')
+                .values(status='running', worker=self.worker_id, started_at=now, heartbeat_at=now,
+                        attempts=jobs_table.c.attempts + 1, updated_at=now)
+            ).rowcount
+            if not claimed:
+                return None
+            return connection.execute(
+                select(jobs_table.c.id, jobs_table.c.kind, jobs_table.c.payload).where(jobs_table.c.id == job_id)
+            ).first()
+
+    def _start(self, job, executor):
+        kind = KINDS[job.kind]
+        payload = json.loads(job.payload)
+        with self._lock:
+            self.active[executor] += 1
+            self._running.add(job.id)
+        started = time.monotonic()
+
+        def finished(future):
+            with self._lock:
+                self.active[executor] -= 1
+                self._running.discard(job.id)
+            job_duration.observe(time.monotonic() - started, kind=kind.name)
+            self._finisher.submit(self._finish, job.id, kind, payload, future)
+            self.wake()
+
+        if executor == 'process':
+            future = self._process_pool().submit(job_tasks.run_in_process, kind.function, payload, job.id, self._progress)
+        else:
+            future = self._threads.submit(self._run_in_app, kind.function, payload, lambda data: self._report(job.id, data))
+        future.add_done_callback(finished)
+
+    def _run_in_app(self, function, payload, report):
+        with self.app.app_context():
+            return function(payload, report)
+
+    def _process_pool(self):
+        if self._processes is None:
+            # spawn: forking a process that runs threads can copy held locks
+            context = multiprocessing.get_context('spawn')
+            self._processes = ProcessPoolExecutor(max_workers=self.capacity['process'], mp_context=context)
+            self._progress = context.Manager().Queue()
+            threading.Thread(target=self._relay_progress, name='job-progress', daemon=True).start()
+        return self._processes
+
+    def _relay_progress(self):
+        while True:
+            try:
+                job_id, data = self._progress.get()
+            except (EOFError, OSError):
+                # The manager went away: the interpreter is shutting down
+                return
+            self._report(job_id, data)
+
+    def _report(self, job_id, data):
+        """Store a job's progress, at most every PROGRESS_INTERVAL seconds"""
+        now = time.monotonic()
+        if now - self._last_progress.get(job_id, 0.0) < PROGRESS_INTERVAL:
+            return
+        self._last_progress[job_id] = now
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                connection.execute(
+                    update(jobs_table)
+                    .where(jobs_table.c.id == job_id, jobs_table.c.status == 'running')
+                    .values(progress=json.dumps(data), updated_at=datetime.utcnow())
+                )
+        except Exception:
+            logger.exception("Could not store progress of job %s", job_id)
+
+    def _finish(self, job_id, kind, payload, future):
+        """Store the outcome and settle the reserved credits"""
+        self._last_progress.pop(job_id, None)
+        error = future.exception()
+        if error is not None and not isinstance(error, ProviderError):
+            logger.error("Job %s (%s) failed", job_id, kind.name, exc_info=error)
+        with self.app.app_context():
+            try:
+                if error is None:
+                    result = future.result()
+                    self._settle(job_id, kind, 'succeeded', result=json.dumps(result))
+                    if kind.after:
+                        kind.after(payload, result)
+                else:
+                    message = "AI service unavailable" if isinstance(error, ProviderError) else "Job failed"
+                    self._settle(job_id, kind, 'failed', error=message)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Could not store the outcome of job %s", job_id)
+
+    def _settle(self, job_id, kind, status, result=None, error=None):
+        row = db.session.execute(
+            select(jobs_table.c.user_id, jobs_table.c.credits_reserved).where(jobs_table.c.id == job_id)
+        ).first()
+        if row is None:
+            return
+        now = datetime.utcnow()
+        # Only the runner that still owns the job settles it, exactly once
+        updated = db.session.execute(
+            update(jobs_table)
+            .where(jobs_table.c.id == job_id, jobs_table.c.status == 'running', jobs_table.c.worker == self.worker_id)
+            .values(status=status, result=result, error=error, finished_at=now, updated_at=now,
+                    credits_settled=row.credits_reserved if status == 'succeeded' else 0)
+        ).rowcount
+        if updated and status != 'succeeded' and row.credits_reserved:
+            refund_credits(row.user_id, row.credits_reserved, kind.name)
+        db.session.commit()
+        if updated:
+            self.finished[status] += 1
+            jobs_finished.inc(kind=kind.name, status=status)
+
+    def _heartbeat(self):
+        with self._lock:
+            running = list(self._running)
+        if running:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(jobs_table)
+                    .where(jobs_table.c.id.in_(running), jobs_table.c.worker == self.worker_id)
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+
+    def _reclaim_stale(self):
+        """Requeue (or fail and refund) running jobs whose runner went away"""
+        cutoff = datetime.utcnow() - timedelta(seconds=STALE_AFTER)
+        stale = db.session.execute(
+            select(jobs_table.c.id, jobs_table.c.user_id, jobs_table.c.kind, jobs_table.c.attempts,
+                   jobs_table.c.credits_reserved, jobs_table.c.worker)
+            .where(jobs_table.c.status == 'running', jobs_table.c.heartbeat_at < cutoff)
+        ).all()
+        for job in stale:
+            guard = (jobs_table.c.id == job.id, jobs_table.c.status == 'running', jobs_table.c.worker == job.worker)
+            if job.attempts < MAX_ATTEMPTS:
+                db.session.execute(update(jobs_table).where(*guard).values(
+                    status='queued', worker=None, updated_at=datetime.utcnow()
+                ))
+                logger.warning("Requeued job %s after its worker %s went away", job.id, job.worker)
+                continue
+            updated = db.session.execute(update(jobs_table).where(*guard).values(
+                status='failed', error="Worker lost", finished_at=datetime.utcnow(),
+                credits_settled=0, updated_at=datetime.utcnow()
+            )).rowcount
+            if updated:
+                if job.credits_reserved:
+                    refund_credits(job.user_id, job.credits_reserved, job.kind)
+                jobs_finished.inc(kind=job.kind, status='failed')
+        db.session.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'worker': self.worker_id,
+                'active': dict(self.active),
+                'capacity': dict(self.capacity),
+                **self.finished
+            }
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner(app=None):
+    """The process's job runner, started on first use (after fork)"""
+    global _runner
+    if _runner is None or _runner.pid != os.getpid():
+        with _runner_lock:
+            if _runner is None or _runner.pid != os.getpid():
+                _runner = JobRunner(app or current_app._get_current_object()).start()
+    return _runner
+
+
+_election = {'pid': None, 'handle': None, 'next_try': 0.0}
+
+
+def _elected():
+    """True once this process holds the host's runner lock for its database.
+
+    The lock is an flock on a file named after the database URL, kept open
+    for the life of the process; the kernel releases it when the process
+    exits, and another worker picks it up on a later request.
+    """
+    if _election['pid'] != os.getpid():
+        _election.update(pid=os.getpid(), handle=None, next_try=0.0)
+    if _election['handle'] is not None:
+        return True
+    now = time.monotonic()
+    if now < _election['next_try']:
+        return False
+    _election['next_try'] = now + HEARTBEAT_INTERVAL
+    url = str(db.engine.url)
+    path = os.path.join(tempfile.gettempdir(), f'jarvis-jobs-{zlib.crc32(url.encode()):08x}.lock')
+    handle = open(path, 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _election['handle'] = handle
+    return True
+
+
+def _start_in_web():
+    if _runner is not None and _runner.pid == os.getpid():
+        return
+    if IN_WEB == 'all' or _elected():
+        get_runner()
+
+
+def init_jobs(app):
+    """Run jobs in this app's web workers as JOBS_IN_WEB says"""
+    if IN_WEB not in ('one', 'all', 'false'):
+        raise RuntimeError(f"Unknown JOBS_IN_WEB: {IN_WEB}")
+    if IN_WEB != 'false':
+        app.before_request(_start_in_web)
+    app.cli.add_command(jobs_cli)
+
+
+def job_stats():
+    return _runner.stats() if _runner is not None and _runner.pid == os.getpid() else None
+
+
+jobs_cli = AppGroup('jobs', help="Run background jobs.")
+
+
+@jobs_cli.command('work')
+def work_command():
+    """Claim and run queued jobs until interrupted."""
+    runner = get_runner(current_app._get_current_object())
+    click.echo(f"Job worker {runner.worker_id}: {runner.capacity['thread']} threads, "
+               f"{runner.capacity['process']} processes")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
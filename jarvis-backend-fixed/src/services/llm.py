@@ -0,0 +1,316 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+
+from services.jarvis import JARVIS_SYSTEM_PROMPT, get_jarvis_response
+
+SUMMARY_MAX_CHARS = int(os.environ.get('CONTEXT_SUMMARY_MAX_CHARS', 2000))
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+class ProviderError(Exception):
+    """The model backend failed, timed out or is saturated"""
+
+
+def split_tokens(text):
+    """Split text into word tokens, keeping trailing whitespace"""
+    return re.findall(r'\S+\s*', text)
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+class LLMProvider:
+    """Base class: task helpers built on generate() / stream()"""
+
+    name = 'base'
+    model = None
+
+    @property
+    def version(self):
+        return f"{self.name}:{self.model}"
+
+    def generate(self, prompt, system=None):
+        raise NotImplementedError
+
+    def stream(self, prompt, system=None):
+        yield self.generate(prompt, system)
+
+    def _chat_prompt(self, message, history=None, context=None, summary=None):
+        sections = []
+        if summary:
+            sections.append(f"Samenvatting van het eerdere gesprek:\n{summary}")
+        if context:
+            sections.append("Relevante context:\n" + "\n".join(f"- {item}" for item in context))
+        if history:
+            sections.append("Gesprek tot nu toe:\n" + "\n".join(
+                f"{turn['sender']}: {turn['content']}" for turn in history
+            ))
+        sections.append(f"user: {message}")
+        return "\n\n".join(sections)
+
+    def chat(self, message, user_name="meneer", history=None, context=None, summary=None):
+        return self.generate(
+            self._chat_prompt(message, history, context, summary),
+            JARVIS_SYSTEM_PROMPT.format(user_name=user_name)
+        )
+
+    def stream_chat(self, message, user_name="meneer", history=None, context=None, summary=None):
+        return self.stream(
+            self._chat_prompt(message, history, context, summary),
+            JARVIS_SYSTEM_PROMPT.format(user_name=user_name)
+        )
+
+    def fold_summary(self, summary, turns):
+        """Extend a rolling conversation summary with turns that left the window"""
+        transcript = "\n".join(f"{turn['sender']}: {turn['content']}" for turn in turns)
+        return self.generate(
+            "Werk de samenvatting van dit gesprek bij met de nieuwe berichten. "
+            f"Houd haar onder {SUMMARY_MAX_CHARS} tekens.\n\n"
+            f"Samenvatting tot nu toe:\n{summary or '(leeg)'}\n\nNieuwe berichten:\n{transcript}"
+        )[:SUMMARY_MAX_CHARS]
+
+    def compose(self, prompt, type_text='email'):
+        kind = "een zakelijke e-mail" if type_text == 'email' else "een gestructureerd document"
+        return self.generate(f"Schrijf {kind} op basis van:\n{prompt}")
+
+    def summarize(self, text):
+        return self.generate(f"Vat de volgende tekst beknopt samen:\n{text}")
+
+    def analyze_workspace(self, stats):
+        """Return {"productivity_score": int, "suggestions": [str]} for the stats"""
+        raw = self.generate(
+            "Geef op basis van deze Google Workspace statistieken een JSON object met "
+            "'productivity_score' (0-100) en 'suggestions' (lijst van korte tips):\n"
+            + json.dumps(stats)
+        )
+        try:
+            return json.loads(raw[raw.index('{'):raw.rindex('}') + 1])
+        except ValueError:
+            raise ProviderError("Unparseable workspace analysis")
+
+
+class FakeProvider(LLMProvider):
+    """Deterministic local stand-in with configurable latency, for dev and load tests"""
+
+    name = 'fake'
+    model = 'jarvis-demo-1'
+
+    def __init__(self, latency_ms=0, token_latency_ms=0):
+        self.latency = latency_ms / 1000.0
+        self.token_latency = token_latency_ms / 1000.0
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _tokens(self, text):
+        self._wait()
+        for token in split_tokens(text):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield token
+
+    def generate(self, prompt, system=None):
+        self._wait()
+        return f"Zeer wel. {prompt[:200]}"
+
+    def stream(self, prompt, system=None):
+        return self._tokens(f"Zeer wel. {prompt[:200]}")
+
+    def _reply(self, message, user_name):
+        rng = random.Random(zlib.crc32(message.encode('utf-8')))
+        return get_jarvis_response(message, user_name, rng=rng)
+
+    def chat(self, message, user_name="meneer", history=None, context=None, summary=None):
+        self._wait()
+        return self._reply(message, user_name)
+
+    def stream_chat(self, message, user_name="meneer", history=None, context=None, summary=None):
+        return self._tokens(self._reply(message, user_name))
+
+    def fold_summary(self, summary, turns):
+        self._wait()
+        lines = [summary] if summary else []
+        lines += [f"{turn['sender']}: {turn['content'][:80]}" for turn in turns]
+        # Keep the most recent part when the summary outgrows its budget
+        return "\n".join(lines)[-SUMMARY_MAX_CHARS:]
+
+    def compose(self, prompt, type_text='email'):
+        self._wait()
+        if type_text == 'email':
+            return f"Geachte heer/mevrouw,\n\n{prompt}\n\nMet vriendelijke groet,\n[Uw naam]"
+        return f"Betreft: {prompt}\n\nDit document behandelt de volgende punten:\n- Hoofdpunt 1\n- Hoofdpunt 2\n- Conclusie"
+
+    def summarize(self, text):
+        self._wait()
+        return f"Samenvatting: {text[:100]}... (Dit is een demo samenvatting. In productie zou hier AI-gegenereerde content staan.)"
+
+    def analyze_workspace(self, stats):
+        self._wait()
+        return {
+            "productivity_score": 78,
+            "suggestions": [
+                f"Organiseer uw inbox - {stats['email_stats']['unread']} ongelezen e-mails",
+                "Plan meer tijd voor belangrijke taken",
+                "Gebruik meer labels in Google Drive"
+            ]
+        }
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini over its REST API with a pooled keep-alive session.
+
+    Concurrency is capped per process by a semaphore so a slow backend
+    cannot pin every worker thread; transient failures (connection errors,
+    429, 5xx) are retried with full-jitter exponential backoff.
+    """
+
+    name = 'gemini'
+    base_url = 'https://generativelanguage.googleapis.com/v1beta'
+
+    def __init__(self, api_key, model='gemini-1.5-flash', max_concurrency=8,
+                 connect_timeout=5.0, read_timeout=20.0, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, queue_timeout=5.0):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._requests = requests
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'x-goog-api-key': api_key,
+            'Content-Type': 'application/json'
+        })
+
+    def _body(self, prompt, system):
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": system}]}
+        return body
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _post(self, path, body, stream=False):
+        """POST with retries; returns an open response with a 2xx status"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise ProviderError("AI backend is saturated")
+        released = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    response = self.session.post(
+                        f"{self.base_url}/models/{self.model}:{path}",
+                        json=body, timeout=self.timeout, stream=stream
+                    )
+                except self._requests.RequestException as error:
+                    if attempt == self.max_retries:
+                        raise ProviderError(str(error))
+                else:
+                    if response.ok:
+                        # Streaming callers release the slot once the body is consumed
+                        released = stream
+                        return response
+                    if response.status_code != 429 and response.status_code < 500:
+                        raise ProviderError(f"AI backend returned {response.status_code}")
+                    if attempt == self.max_retries:
+                        raise ProviderError(f"AI backend returned {response.status_code}")
+                    retry_after = response.headers.get('Retry-After')
+                    response.close()
+                time.sleep(self._backoff(attempt, retry_after))
+        finally:
+            if not released:
+                self._slots.release()
+
+    @staticmethod
+    def _text(payload):
+        try:
+            parts = payload['candidates'][0]['content']['parts']
+        except (KeyError, IndexError, TypeError):
+            return ''
+        return ''.join(part.get('text', '') for part in parts)
+
+    def generate(self, prompt, system=None):
+        response = self._post('generateContent', self._body(prompt, system))
+        try:
+            payload = response.json()
+        except ValueError:
+            raise ProviderError("Unparseable AI backend response")
+        return self._text(payload)
+
+    def stream(self, prompt, system=None):
+        response = self._post('streamGenerateContent?alt=sse', self._body(prompt, system), stream=True)
+        try:
+            for line in response.iter_lines():
+                if line.startswith(b'data: '):
+                    try:
+                        payload = json.loads(line[6:])
+                    except ValueError:
+                        raise ProviderError("Unparseable AI backend response")
+                    text = self._text(payload)
+                    if text:
+                        yield text
+        except self._requests.RequestException as error:
+            raise ProviderError(str(error))
+        finally:
+            response.close()
+            self._slots.release()
+
+
+def create_provider():
+    """Build the provider selected by LLM_PROVIDER (default: fake)"""
+    name = os.environ.get('LLM_PROVIDER', 'fake').lower()
+    if name == 'fake':
+        return FakeProvider(
+            latency_ms=_env_float('LLM_FAKE_LATENCY_MS', 0),
+            token_latency_ms=_env_float('LLM_FAKE_TOKEN_LATENCY_MS', 0)
+        )
+    if name == 'gemini':
+        api_key = os.environ.get('GEMINI_API_KEY')
+        if not api_key:
+            raise RuntimeError("LLM_PROVIDER=gemini requires GEMINI_API_KEY")
+        return GeminiProvider(
+            api_key,
+            model=os.environ.get('LLM_MODEL', 'gemini-1.5-flash'),
+            max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 8)),
+            connect_timeout=_env_float('LLM_CONNECT_TIMEOUT', 5),
+            read_timeout=_env_float('LLM_TIMEOUT', 20),
+            max_retries=int(os.environ.get('LLM_MAX_RETRIES', 3)),
+            backoff_base=_env_float('LLM_BACKOFF_BASE', 0.5),
+            backoff_max=_env_float('LLM_BACKOFF_MAX', 8),
+            queue_timeout=_env_float('LLM_QUEUE_TIMEOUT', 5)
+        )
+    raise RuntimeError(f"Unknown LLM_PROVIDER: {name}")
+
+
+def get_provider():
+    """Process-wide provider instance, created on first use"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_provider()
+    return _provider
@@ -0,0 +1,319 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Each worker publishes its metrics here so whichever worker answers
+# /metrics can report all of them; unset keeps metrics per process
+METRICS_DIR = os.environ.get('METRICS_DIR')
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_metrics = {}
+_meters = {}
+_registry_lock = threading.Lock()
+
+
+class RateMeter:
+    """Thread-safe event counter with a rate over a sliding window"""
+
+    def __init__(self, name, window=10.0):
+        self.name = name
+        self.window = window
+        self.total = 0
+        self._events = deque()
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _meters[name] = self
+
+    def mark(self, count=1):
+        now = time.monotonic()
+        with self._lock:
+            self.total += count
+            self._events.append((now, count))
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+    def rate(self):
+        """Events per second over the last window"""
+        with self._lock:
+            self._trim(time.monotonic())
+            return sum(count for _, count in self._events) / self.window
+
+    def stats(self):
+        return {'total': self.total, 'per_second': round(self.rate(), 2)}
+
+
+class Counter:
+    """Monotonic counter with labels, exported on /metrics"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            samples = {_label_key(self.labelnames, key): value for key, value in self._values.items()}
+        return {'type': self.type, 'help': self.help, 'samples': samples}
+
+
+class Histogram:
+    """Bucketed distribution with labels, exported on /metrics"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics[name] = self
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = next((n for n, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (not cumulative) counts, sum, count
+                self._values[key] = entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = {
+                _label_key(self.labelnames, key): [list(counts), total, count]
+                for key, (counts, total, count) in self._values.items()
+            }
+        return {'type': self.type, 'help': self.help, 'buckets': list(self.buckets), 'samples': samples}
+
+
+def _label_key(labelnames, values):
+    return json.dumps(dict(zip(labelnames, values)), sort_keys=True)
+
+
+def _collected():
+    """RateMeter totals and cache counters, in snapshot form"""
+    from services.cache import cache_stats
+
+    with _registry_lock:
+        meters = list(_meters.values())
+    collected = {
+        f'jarvis_{meter.name}_total': {'type': 'counter', 'help': f'Total {meter.name} events', 'samples': {'{}': meter.total}}
+        for meter in meters
+    }
+    caches = cache_stats()
+    for field in ('hits', 'misses', 'evictions'):
+        collected[f'jarvis_cache_{field}_total'] = {
+            'type': 'counter',
+            'help': f'Cache {field} per cache',
+            'samples': {_label_key(('cache',), (name,)): stats.get(field, 0) for name, stats in caches.items()}
+        }
+    return collected
+
+
+def snapshot():
+    """Every metric of this process as JSON-serialisable data"""
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    data = {metric.name: metric.snapshot() for metric in metrics}
+    data.update(_collected())
+    return data
+
+
+def merge(snapshots):
+    """Sum the snapshots of several processes into one"""
+    merged = {}
+    for data in snapshots:
+        for name, metric in data.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for key, value in metric['samples'].items():
+                current = target['samples'].get(key)
+                if current is None:
+                    target['samples'][key] = [list(value[0]), value[1], value[2]] if metric['type'] == 'histogram' else value
+                elif metric['type'] == 'histogram':
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+                else:
+                    target['samples'][key] = current + value
+    return merged
+
+
+def _write_json(path, data):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as handle:
+        json.dump(data, handle)
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def write_snapshot():
+    """Publish this worker's metrics for the other workers to aggregate"""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(os.path.join(METRICS_DIR, f'worker-{os.getpid()}.json'), snapshot())
+
+
+def collect():
+    """Metrics of all workers merged (only this process without METRICS_DIR).
+
+    Files left by workers that have exited are folded into archive.json, so
+    counters keep growing across worker restarts instead of dropping back.
+    """
+    if not METRICS_DIR:
+        return snapshot()
+    write_snapshot()
+    archive_path = os.path.join(METRICS_DIR, 'archive.json')
+    with open(os.path.join(METRICS_DIR, 'archive.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        live, dead = [], []
+        for name in os.listdir(METRICS_DIR):
+            if not (name.startswith('worker-') and name.endswith('.json')):
+                continue
+            path = os.path.join(METRICS_DIR, name)
+            pid = int(name[len('worker-'):-len('.json')])
+            (live if _alive(pid) else dead).append((path, _read_json(path)))
+        archive = _read_json(archive_path)
+        if dead:
+            archive = merge([archive] + [data for _, data in dead])
+            _write_json(archive_path, archive)
+            for path, _ in dead:
+                os.remove(path)
+    return merge([archive] + [data for _, data in live])
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(key, extra=None):
+    labels = json.loads(key)
+    if extra:
+        labels.update(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render(data):
+    """Prometheus text exposition format (0.0.4) of a snapshot"""
+    lines = []
+    for name in sorted(data):
+        metric = data[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric['samples'].items()):
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{_labels(key)} {value}')
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket in zip(list(metric['buckets']) + ['+Inf'], counts):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{_labels(key, {"le": bound})} {cumulative}')
+            lines.append(f'{name}_sum{_labels(key)} {total}')
+            lines.append(f'{name}_count{_labels(key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def start_flusher():
+    """Start the snapshot writer of this process once (it does not survive a fork)"""
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+            atexit.register(write_snapshot)
+
+
+db_commits = RateMeter('db_commits')
+
+
+@event.listens_for(Engine, 'commit')
+def _count_commit(connection):
+    db_commits.mark()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(connection, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _time_query(connection, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'db_query_started' in g:
+        g.db_time = g.get('db_time', 0.0) + time.perf_counter() - g.pop('db_query_started')
+
+
+def request_queries():
+    """SQL statements the current request has executed so far"""
+    return g.get('db_queries', 0) if has_request_context() else 0
+
+
+def request_db_time():
+    """Seconds the current request has spent executing SQL so far"""
+    return g.get('db_time', 0.0) if has_request_context() else 0.0
@@ -0,0 +1,82 @@
+import base64
+import binascii
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    """Raised for a malformed limit or cursor query parameter"""
+
+
+def encode_cursor(sort_value, row_id):
+    """Opaque cursor for the (sort_value, id) position of a row"""
+    raw = f"{sort_value.isoformat() if sort_value else ''}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = base64.urlsafe_b64decode(padded).decode().split('|', 1)
+        return datetime.fromisoformat(sort_value), row_id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise PaginationError("Invalid cursor")
+
+
+def page_params():
+    """Read limit / before / after from the query string"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise PaginationError("Invalid limit")
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    before = request.args.get('before')
+    after = request.args.get('after')
+    if before and after:
+        raise PaginationError("Use either before or after, not both")
+    return (
+        limit,
+        decode_cursor(before) if before else None,
+        decode_cursor(after) if after else None
+    )
+
+
+def keyset_page(query, sort_column, id_column, limit, before=None, after=None, newest_first=False):
+    """Fetch one page of query ordered by (sort_column, id_column).
+
+    before / after are decoded cursors; with neither, the newest page is
+    returned. Each page is a single index range scan whatever the offset.
+    Returns (rows, has_more) where has_more refers to the direction of
+    travel; rows are oldest-first unless newest_first is set.
+    """
+    if after is not None:
+        sort_value, row_id = after
+        query = query.filter(or_(
+            sort_column > sort_value,
+            and_(sort_column == sort_value, id_column > row_id)
+        )).order_by(sort_column.asc(), id_column.asc())
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        if before is not None:
+            sort_value, row_id = before
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id)
+            ))
+        query = query.order_by(sort_column.desc(), id_column.desc())
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+
+    if newest_first:
+        rows.reverse()
+    return rows, has_more
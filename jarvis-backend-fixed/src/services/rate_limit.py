@@ -0,0 +1,251 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+from services.auth import bearer_token, decode_token
+from services.metrics import RateMeter
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Limits are in tokens per minute; each endpoint spends its cost in tokens
+USER_RATE = float(os.environ.get('RATE_LIMIT_USER_RATE', 60))
+USER_BURST = float(os.environ.get('RATE_LIMIT_USER_BURST', 40))
+IP_RATE = float(os.environ.get('RATE_LIMIT_IP_RATE', 300))
+IP_BURST = float(os.environ.get('RATE_LIMIT_IP_BURST', 120))
+# Number of reverse proxies in front of the app that append to X-Forwarded-For.
+# The documented deployment (Railway, the Dockerfile) sits behind one; with 0
+# there every client would share the proxy's IP bucket. Set 0 only when
+# clients connect directly.
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 1))
+
+# Mirrors the credits each AI endpoint charges
+DEFAULT_COSTS = {
+    'chat': 2,
+    'chat_stream': 2,
+    'smart_compose': 3,
+    'summarize': 2,
+    'analyze_workspace': 5,
+    'search': 1
+}
+
+
+def parse_costs(spec):
+    """'chat=2,search=1' -> {'chat': 2.0, 'search': 1.0}"""
+    costs = {}
+    for part in spec.split(','):
+        if '=' in part:
+            endpoint, cost = part.split('=', 1)
+            costs[endpoint.strip()] = float(cost)
+    return costs
+
+
+COSTS = dict(DEFAULT_COSTS, **parse_costs(os.environ.get('RATE_LIMIT_COSTS', '')))
+
+
+def _refill(tokens, updated, rate, burst, now):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+def _plan(levels, limits, cost):
+    """Seconds until every bucket holds cost tokens; 0 when they do now"""
+    wait = 0.0
+    for level, (_, rate, burst) in zip(levels, limits):
+        # A cost above the burst size could never be paid; cap it
+        needed = min(cost, burst)
+        if level < needed:
+            wait = max(wait, (needed - level) / rate if rate > 0 else math.inf)
+    return wait
+
+
+class MemoryBuckets:
+    """Token buckets in this process only (each gunicorn worker has its own)"""
+
+    name = 'memory'
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, limits, cost):
+        """Spend cost from every (key, rate, burst) bucket, or from none.
+
+        Returns 0 when the request may proceed, else the seconds to wait.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, rate, burst in limits:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                levels.append(_refill(tokens, updated, rate, burst, now))
+            wait = _plan(levels, limits, cost)
+            if wait:
+                return wait
+            for level, (key, _, burst) in zip(levels, limits):
+                self._buckets[key] = (level - min(cost, burst), now)
+                self._buckets.move_to_end(key)
+            # Forgetting the least recently used bucket only ever refills it
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return 0.0
+
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite file that every worker process shares.
+
+    Put the file on tmpfs (/dev/shm) to keep it in shared memory. Each
+    check is one short BEGIN IMMEDIATE transaction, so workers serialize on
+    the write lock for a few microseconds only.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, prune_every=1000):
+        self.path = path
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        # A connection inherited from the master (gunicorn --preload) is never reused
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, limits, cost):
+        now = time.time()
+        keys = [key for key, _, _ in limits]
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            stored = {
+                key: (tokens, updated)
+                for key, tokens, updated in connection.execute(
+                    f"SELECT key, tokens, updated FROM buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+                )
+            }
+            levels = []
+            for key, rate, burst in limits:
+                tokens, updated = stored.get(key, (burst, now))
+                levels.append(_refill(tokens, updated, rate, burst, now))
+            wait = _plan(levels, limits, cost)
+            if not wait:
+                rows = []
+                for level, (key, rate, burst) in zip(levels, limits):
+                    left = level - min(cost, burst)
+                    rows.append((key, left, now, now + (burst - left) / rate if rate > 0 else math.inf))
+                connection.executemany('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)', rows)
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            connection.execute('ROLLBACK')
+            raise
+        if not wait:
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self.prune()
+        return wait
+
+    def prune(self):
+        """Drop buckets that have refilled; they behave exactly like absent ones"""
+        self._connect().execute('DELETE FROM buckets WHERE full_at <= ?', (time.time(),))
+
+
+class RateLimiter:
+    """Per-user and per-IP token buckets, charged by endpoint cost"""
+
+    def __init__(self, backend, user_limit=(USER_RATE, USER_BURST), ip_limit=(IP_RATE, IP_BURST), costs=COSTS):
+        self.backend = backend
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.costs = costs
+        self.allowed = RateMeter('rate_limit_allowed')
+        self.rejected = RateMeter('rate_limit_rejected')
+        self.errors = 0
+
+    def limits(self, user_id, ip):
+        """(key, tokens per second, burst) for each bucket the request spends from"""
+        limits = [(f'ip:{ip}', self.ip_limit[0] / 60.0, self.ip_limit[1])]
+        if user_id is not None:
+            limits.append((f'user:{user_id}', self.user_limit[0] / 60.0, self.user_limit[1]))
+        return limits
+
+    def check(self, user_id, ip, endpoint):
+        """Seconds the client must wait, or 0 when the request may proceed"""
+        cost = self.costs.get(endpoint, 1)
+        try:
+            wait = self.backend.take(self.limits(user_id, ip), cost)
+        except sqlite3.Error:
+            # A broken shared store must not take the API down with it
+            self.errors += 1
+            logger.warning("Rate limit store unavailable; allowing request", exc_info=True)
+            wait = 0.0
+        (self.rejected if wait else self.allowed).mark()
+        return wait
+
+    def stats(self):
+        return {
+            'backend': self.backend.name,
+            'allowed': self.allowed.stats(),
+            'rejected': self.rejected.stats(),
+            'errors': self.errors
+        }
+
+
+def client_ip(request):
+    """The client address, trusting TRUSTED_PROXIES hops of X-Forwarded-For"""
+    if TRUSTED_PROXIES:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= TRUSTED_PROXIES:
+            return forwarded[-TRUSTED_PROXIES]
+    return request.remote_addr
+
+
+def token_user_id():
+    """User id from the bearer token, without touching the database"""
+    token = bearer_token()
+    if not token:
+        return None
+    try:
+        return decode_token(token).get('user_id')
+    except jwt.InvalidTokenError:
+        return None
+
+
+def _create_limiter():
+    path = os.environ.get('RATE_LIMIT_PATH')
+    return RateLimiter(SQLiteBuckets(path) if path else MemoryBuckets())
+
+
+limiter = _create_limiter() if ENABLED else None
+
+
+def check_request(request):
+    """Retry-After seconds (rounded up) for a rate-limited request, else None"""
+    if limiter is None or request.method == 'OPTIONS':
+        return None
+    endpoint = (request.endpoint or '').rsplit('.', 1)[-1]
+    wait = limiter.check(token_user_id(), client_ip(request), endpoint)
+    return max(1, math.ceil(wait)) if wait else None
+
+
+def rate_limit_stats():
+    return limiter.stats() if limiter is not None else None
@@ -0,0 +1,48 @@
+import hashlib
+import json
+import os
+
+from services.cache import SQLiteCache, TTLCache
+
+CHARGE_HITS = os.environ.get('RESPONSE_CACHE_CHARGE_HITS', 'true').lower() in ('1', 'true', 'yes')
+
+_memory = TTLCache(
+    'responses',
+    maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+)
+_disk = None
+if os.environ.get('RESPONSE_CACHE_PATH'):
+    _disk = SQLiteCache(
+        'responses_shared',
+        os.environ['RESPONSE_CACHE_PATH'],
+        max_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+        ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+    )
+
+
+def normalize(text):
+    """Collapse whitespace so trivially different resubmissions share a key"""
+    return ' '.join(text.split())
+
+
+def cache_key(operation, model_version, *inputs):
+    """Content address of a deterministic AI operation"""
+    payload = json.dumps([operation, model_version, *inputs], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get(key):
+    """Cached response from the in-process tier, then the shared tier"""
+    value = _memory.get(key)
+    if value is None and _disk is not None:
+        value = _disk.get(key)
+        if value is not None:
+            _memory.set(key, value)
+    return value
+
+
+def put(key, value):
+    _memory.set(key, value)
+    if _disk is not None:
+        _disk.set(key, value)
@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import os
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Column, DateTime, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models.conversation import Conversation, PREVIEW_LENGTH
+from models.message import Message
+from services.fulltext import install_fulltext_index
+
+logger = logging.getLogger(__name__)
+
+# auto: upgrade at boot when the schema is behind; check: only log it;
+# off: assume `flask schema upgrade` ran as a deploy step
+SCHEMA_UPGRADE = os.environ.get('SCHEMA_UPGRADE', 'auto').lower()
+# Bump when DDL outside the models changes (full-text tables and triggers)
+SCHEMA_REVISION = 1
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('fingerprint', String(64), primary_key=True),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+def _add_missing_columns(engine):
+    """ALTER TABLE ... ADD COLUMN for model columns an older database lacks"""
+    inspector = inspect(engine)
+    added = set()
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                    if not column.nullable:
+                        ddl += ' NOT NULL'
+                connection.execute(text(ddl))
+                added.add((table.name, column.name))
+    return added
+
+
+def _create_missing_indexes(engine):
+    """Indexes declared on the models are only created with new tables"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def backfill_conversation_stats(connection):
+    """Recompute message_count and last_message_preview with grouped subqueries"""
+    conversations = Conversation.__table__
+    messages = Message.__table__
+    count = (
+        select(func.count())
+        .where(messages.c.conversation_id == conversations.c.id)
+        .scalar_subquery()
+    )
+    preview = (
+        select(func.substr(messages.c.content, 1, PREVIEW_LENGTH))
+        .where(messages.c.conversation_id == conversations.c.id)
+        .order_by(messages.c.timestamp.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    connection.execute(
+        conversations.update().values(
+            message_count=count,
+            last_message_preview=preview,
+            updated_at=conversations.c.updated_at
+        )
+    )
+
+
+def schema_fingerprint():
+    """Hash of every table, column and index the models declare"""
+    parts = [f'revision {SCHEMA_REVISION}']
+    for table in db.metadata.sorted_tables:
+        parts.append(f'table {table.name}')
+        for column in table.columns:
+            default = column.server_default.arg if column.server_default is not None else None
+            parts.append(f'column {column.name} {column.type} {column.nullable} {default}')
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            parts.append(f"index {index.name} {','.join(column.name for column in index.columns)} {index.unique}")
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def schema_is_current(engine):
+    """One indexed lookup instead of reflecting every table"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                select(schema_migrations.c.fingerprint).where(schema_migrations.c.fingerprint == schema_fingerprint())
+            ).first() is not None
+    except SQLAlchemyError:
+        return False
+
+
+def upgrade_schema():
+    """Create missing tables and bring existing ones up to the current models"""
+    db.create_all()
+    added = _add_missing_columns(db.engine)
+    _create_missing_indexes(db.engine)
+    if ('conversations', 'message_count') in added:
+        with db.engine.begin() as connection:
+            backfill_conversation_stats(connection)
+    install_fulltext_index(db.engine)
+    schema_migrations.create(db.engine, checkfirst=True)
+    fingerprint = schema_fingerprint()
+    with db.engine.begin() as connection:
+        if not connection.execute(
+            select(schema_migrations.c.fingerprint).where(schema_migrations.c.fingerprint == fingerprint)
+        ).first():
+            connection.execute(schema_migrations.insert().values(fingerprint=fingerprint, applied_at=datetime.utcnow()))
+
+
+def ensure_schema():
+    """Boot-time schema step per SCHEMA_UPGRADE; cheap once the schema is current"""
+    if SCHEMA_UPGRADE == 'off' or schema_is_current(db.engine):
+        return
+    if SCHEMA_UPGRADE == 'check':
+        logger.error("Database schema is out of date; run `flask --app wsgi schema upgrade`")
+        return
+    logger.info("Upgrading database schema")
+    upgrade_schema()
+
+
+schema_cli = AppGroup('schema', help="Inspect or upgrade the database schema.")
+
+
+@schema_cli.command('upgrade')
+def upgrade_command():
+    """Create missing tables, columns, indexes and full-text tables."""
+    if schema_is_current(db.engine):
+        click.echo("Schema is up to date")
+        return
+    upgrade_schema()
+    click.echo(f"Schema upgraded to {schema_fingerprint()[:12]}")
+
+
+@schema_cli.command('status')
+def status_command():
+    """Exit 1 when the database needs `schema upgrade`."""
+    if not schema_is_current(db.engine):
+        raise click.ClickException(f"Schema is behind the models ({schema_fingerprint()[:12]}); run `schema upgrade`")
+    click.echo(f"Schema is up to date ({schema_fingerprint()[:12]})")
@@ -0,0 +1,73 @@
+import json
+import os
+from datetime import date, datetime
+
+from flask import Response
+
+# auto: orjson when it is installed; json: always the standard library
+BACKEND = os.environ.get('JSON_BACKEND', 'auto').lower()
+# Pages with more rows than this are sent as a stream of row chunks
+STREAM_ROWS = int(os.environ.get('JSON_STREAM_ROWS', 100))
+CHUNK_ROWS = 50
+
+
+def _load_orjson():
+    if BACKEND == 'json':
+        return None
+    if BACKEND not in ('auto', 'orjson'):
+        raise RuntimeError(f"Unknown JSON_BACKEND: {BACKEND}")
+    try:
+        import orjson
+    except ImportError:
+        if BACKEND == 'orjson':
+            raise
+        return None
+    return orjson
+
+
+_orjson = _load_orjson()
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    """Compact UTF-8 JSON bytes; naive datetimes come out as isoformat()"""
+    if _orjson is not None:
+        return _orjson.dumps(value)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def backend():
+    return 'orjson' if _orjson is not None else 'json'
+
+
+def rows_json(fields, rows):
+    """JSON array of objects from column tuples, without building ORM instances"""
+    return dumps([dict(zip(fields, row)) for row in rows])
+
+
+def _streamed_page(key, fields, rows, extra):
+    yield b'{' + dumps(key) + b':['
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows_json(fields, rows[start:start + CHUNK_ROWS])
+        yield (b',' if start else b'') + chunk[1:-1]
+    tail = dumps(extra)
+    yield b']' + (b',' + tail[1:] if extra else b'}')
+
+
+def page_response(key, fields, rows, extra):
+    """{key: [rows as objects], **extra} as a response.
+
+    rows are column tuples in fields order. Small pages are encoded in one
+    go; larger ones are streamed CHUNK_ROWS at a time, so the whole document
+    never sits in memory as one string.
+    """
+    if len(rows) <= STREAM_ROWS:
+        body = dumps({key: [dict(zip(fields, row)) for row in rows], **extra})
+    else:
+        body = _streamed_page(key, fields, rows, extra)
+    return Response(body, mimetype='application/json')
@@ -0,0 +1,25 @@
+import json
+import sys
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # Stop nginx / Railway's proxy from buffering the stream
+    'X-Accel-Buffering': 'no'
+}
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Events frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def wants_event_stream(req):
+    """True when the client prefers text/event-stream over JSON"""
+    return req.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream'
+
+
+def cooperative_worker():
+    """True under gevent, where an open stream costs a greenlet rather than
+    a whole worker process"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('time')
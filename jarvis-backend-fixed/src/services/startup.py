@@ -0,0 +1,110 @@
+import logging
+import os
+import resource
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Imported on first use; listed in the report so an eager import shows up
+LAZY_MODULES = ('numpy', 'chromadb', 'requests', 'google.generativeai', 'googleapiclient')
+
+
+class BootTimer:
+    """Durations of the named startup phases of this process"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = {}
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def total_ms(self):
+        return round((self._last - self.started) * 1000, 1)
+
+
+boot = BootTimer()
+_report = None
+
+
+def process_age_ms():
+    """Milliseconds since this process was started, interpreter startup included (Linux only)"""
+    try:
+        with open('/proc/self/stat') as handle:
+            # starttime is field 22; fields are counted after the ")" closing the command name
+            start_ticks = int(handle.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as handle:
+            uptime = float(handle.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round((uptime - start_ticks / os.sysconf('SC_CLK_TCK')) * 1000)
+
+
+def memory_usage():
+    """Resident memory in MB, split into shared and private pages where the kernel reports it"""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as handle:
+            for line in handle:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[name] = int(value.split()[0])
+    except OSError:
+        return {'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+    def megabytes(*names):
+        return round(sum(fields.get(name, 0) for name in names) / 1024, 1)
+
+    return {
+        'rss_mb': megabytes('Rss'),
+        'pss_mb': megabytes('Pss'),
+        'shared_mb': megabytes('Shared_Clean', 'Shared_Dirty'),
+        'private_mb': megabytes('Private_Clean', 'Private_Dirty')
+    }
+
+
+def lazy_modules_loaded():
+    return [name for name in LAZY_MODULES if name in sys.modules]
+
+
+def report_boot():
+    """Log how long the app took to load, once per process that loads it"""
+    global _report
+    _report = {
+        'pid': os.getpid(),
+        'app_load_ms': boot.total_ms(),
+        'since_process_start_ms': process_age_ms(),
+        'phases_ms': boot.phases,
+        'memory': memory_usage(),
+        'lazy_modules_loaded': lazy_modules_loaded()
+    }
+    logger.info(
+        "Startup: app loaded in %.0f ms (%s), %s ms since process start, RSS %s MB",
+        _report['app_load_ms'], ', '.join(f'{phase} {ms:.0f} ms' for phase, ms in boot.phases.items()),
+        _report['since_process_start_ms'], _report['memory'].get('rss_mb', _report['memory'].get('max_rss_mb'))
+    )
+
+
+def startup_report():
+    """The boot report of the process that loaded the app (the gunicorn master
+    with --preload), plus this process's current memory"""
+    return dict(_report or {}, worker_pid=os.getpid(), worker_memory=memory_usage(),
+                lazy_modules_loaded=lazy_modules_loaded())
+
+
+def warm_up():
+    """Import the lazily loaded libraries before workers fork (gunicorn --preload),
+    so their pages are shared copy-on-write rather than loaded once per worker"""
+    from services.embeddings import get_embedder
+    from services.llm import get_provider
+    from services.vector_index import ENABLED
+
+    began = time.perf_counter()
+    get_provider()
+    if ENABLED:
+        get_embedder().embed('warm up')
+    logger.info("Warm-up: %.0f ms, loaded %s", (time.perf_counter() - began) * 1000, ', '.join(lazy_modules_loaded()) or 'nothing')
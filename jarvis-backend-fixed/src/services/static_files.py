@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from flask import Response, send_file
+
+logger = logging.getLogger(__name__)
+
+# Files up to this size are held in memory; larger ones are streamed from disk
+INLINE_MAX_BYTES = int(os.environ.get('STATIC_INLINE_MAX_BYTES', 8 * 1024 * 1024))
+# Compressible files without a .gz sibling are gzipped once at startup
+COMPRESS_MIN_BYTES = int(os.environ.get('STATIC_COMPRESS_MIN_BYTES', 1024))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Vite names bundles like assets/index-C_Hhj1O6.js
+_HASHED = re.compile(r'[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+_COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+# Sibling suffix -> Content-Encoding, in order of preference
+_ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+
+class StaticFile:
+    """One servable file and its precompressed variants, keyed by encoding"""
+
+    __slots__ = ('path', 'mimetype', 'etag', 'cache_control', 'variants')
+
+    def __init__(self, path, mimetype, etag, cache_control):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.cache_control = cache_control
+        self.variants = {}
+
+    def choose(self, accept_encodings):
+        """(encoding, body) of the best variant the client accepts"""
+        for _, encoding in _ENCODINGS:
+            if self.variants.get(encoding) is not None and accept_encodings[encoding]:
+                return encoding, self.variants[encoding]
+        return None, self.variants[None]
+
+
+class StaticManifest:
+    """Everything under root, read once so requests never touch the filesystem.
+
+    Bodies are kept in memory (None for files beyond INLINE_MAX_BYTES, which
+    are streamed from disk instead). Hashed bundle names are cached as
+    immutable; everything else, index.html included, revalidates against a
+    strong content ETag.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+        self.bytes = 0
+        if os.path.isdir(root):
+            self._scan()
+
+    def _scan(self):
+        siblings = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                full = os.path.join(directory, name)
+                relative = os.path.relpath(full, self.root).replace(os.sep, '/')
+                suffix = next((suffix for suffix, _ in _ENCODINGS if name.endswith(suffix)), None)
+                if suffix:
+                    siblings[relative] = full
+                else:
+                    self.files[relative] = self._load(relative, full)
+
+        for relative, entry in self.files.items():
+            original_mtime = os.path.getmtime(entry.path)
+            for suffix, encoding in _ENCODINGS:
+                sibling = siblings.get(relative + suffix)
+                # A sibling older than its source is left over from an earlier build
+                if sibling and os.path.getmtime(sibling) >= original_mtime:
+                    body = self._read(sibling)
+                    if body is not None:
+                        entry.variants[encoding] = body
+            body = entry.variants[None]
+            if ('gzip' not in entry.variants and body is not None and len(body) >= COMPRESS_MIN_BYTES
+                    and entry.mimetype.startswith(_COMPRESSIBLE)):
+                compressed = gzip.compress(body, compresslevel=9, mtime=0)
+                if len(compressed) < len(body):
+                    entry.variants['gzip'] = compressed
+            self.bytes += sum(len(variant) for variant in entry.variants.values() if variant is not None)
+
+        logger.info("Static manifest: %d files, %d bytes in memory", len(self.files), self.bytes)
+
+    def _read(self, path):
+        if os.path.getsize(path) > INLINE_MAX_BYTES:
+            return None
+        with open(path, 'rb') as handle:
+            return handle.read()
+
+    def _load(self, relative, full):
+        mimetype = mimetypes.guess_type(relative)[0] or 'application/octet-stream'
+        digest = hashlib.blake2b(digest_size=12)
+        with open(full, 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(block)
+        hashed = relative.startswith('assets/') and _HASHED.search(relative) is not None
+        entry = StaticFile(full, mimetype, digest.hexdigest(), IMMUTABLE if hashed else REVALIDATE)
+        entry.variants[None] = self._read(full)
+        return entry
+
+    def get(self, path):
+        return self.files.get(path)
+
+    def stats(self):
+        return {'files': len(self.files), 'bytes_in_memory': self.bytes}
+
+
+def serve_static(entry, request):
+    """Response for entry: the best encoding, or 304 when the ETag matches"""
+    encoding, body = entry.choose(request.accept_encodings)
+    # Each encoding is a different representation, so it needs its own tag
+    etag = entry.etag if encoding is None else f'{entry.etag}-{encoding}'
+    headers = {'Cache-Control': entry.cache_control, 'ETag': f'"{etag}"'}
+    if len(entry.variants) > 1:
+        headers['Vary'] = 'Accept-Encoding'
+
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    if body is None:
+        response = send_file(entry.path, mimetype=entry.mimetype, conditional=False, etag=False)
+        response.headers.update(headers)
+        return response
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype=entry.mimetype, headers=headers)
+
+
+def serves_app_shell(path):
+    """Whether a miss on path is a client-side route that gets index.html.
+
+    Paths naming a file (or the API) get a 404 instead, so a stale bundle
+    URL fails loudly rather than being answered with HTML.
+    """
+    if path.startswith(('api/', 'assets/')):
+        return False
+    return '.' not in path.rsplit('/', 1)[-1]
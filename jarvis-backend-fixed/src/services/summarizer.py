@@ -0,0 +1,158 @@
+import codecs
+import os
+import re
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+CHUNK_TOKENS = int(os.environ.get('SUMMARIZE_CHUNK_TOKENS', 1500))
+FAN_IN = int(os.environ.get('SUMMARIZE_FAN_IN', 8))
+WORKERS = int(os.environ.get('SUMMARIZE_WORKERS', 4))
+READ_BLOCK = 64 * 1024
+CHARS_PER_TOKEN = 4
+
+_pool = None
+
+# Preferred cut points, best first: paragraph, sentence, any whitespace
+_BOUNDARIES = [re.compile(r'\n\s*\n'), re.compile(r'[.!?]\s'), re.compile(r'\s')]
+
+
+def get_pool():
+    """Worker pool shared by all summarizations in this process"""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='summarize')
+    return _pool
+
+
+def read_blocks(stream, encoding='utf-8', block_size=READ_BLOCK):
+    """Decode a binary stream incrementally into text blocks"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    while True:
+        data = stream.read(block_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _cut(buffer, limit):
+    """Index at which to split buffer, at most limit characters in"""
+    window = buffer[:limit]
+    for pattern in _BOUNDARIES:
+        ends = [match.end() for match in pattern.finditer(window, limit // 2)]
+        if ends:
+            return ends[-1]
+    return limit
+
+
+def chunk_text(blocks, chunk_tokens=CHUNK_TOKENS):
+    """Split a stream of text blocks into chunks of at most chunk_tokens.
+
+    Tokens are estimated at four characters each; chunks end on a paragraph,
+    sentence or word boundary where possible. Only one chunk plus one read
+    block is ever held in memory.
+    """
+    limit = chunk_tokens * CHARS_PER_TOKEN
+    buffer = ''
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= limit:
+            cut = _cut(buffer, limit)
+            chunk, buffer = buffer[:cut].strip(), buffer[cut:]
+            if chunk:
+                yield chunk
+    buffer = buffer.strip()
+    if buffer:
+        yield buffer
+
+
+class MapReduceSummarizer:
+    """Summarize arbitrarily large text with bounded memory.
+
+    Chunks are summarized in parallel on the shared pool (map). Every
+    fan_in consecutive summaries are merged into one summary a level up
+    (reduce), so the tree has log_fan_in(chunks) levels. At most
+    max_pending calls are in flight, which bounds memory no matter how
+    large the input is.
+    """
+
+    def __init__(self, summarize, chunk_tokens=CHUNK_TOKENS, fan_in=FAN_IN, max_pending=None, pool=None):
+        self.summarize = summarize
+        self.chunk_tokens = chunk_tokens
+        self.fan_in = max(2, fan_in)
+        self.pool = pool or get_pool()
+        self.max_pending = max_pending or 2 * self.pool._max_workers
+
+    def _reduce(self, parts):
+        return self.summarize("\n\n".join(parts))
+
+    def run(self, blocks):
+        """Generator of progress dicts; the last one carries 'summary'"""
+        pending = [deque()]   # per level: futures in document order
+        buffers = [[]]        # per level: finished summaries awaiting a reduce
+        progress = {'chunks': 0, 'chunks_done': 0, 'characters': 0, 'reduces': 0}
+
+        def level_lists(level):
+            while len(pending) <= level:
+                pending.append(deque())
+                buffers.append([])
+
+        def add(level, summary):
+            level_lists(level + 1)
+            buffers[level].append(summary)
+            if len(buffers[level]) == self.fan_in:
+                parts, buffers[level] = buffers[level], []
+                pending[level + 1].append(self.pool.submit(self._reduce, parts))
+                progress['reduces'] += 1
+
+        def collect(block):
+            """Move finished futures, in order, into their level's buffer"""
+            if block:
+                waiting = [queue[0] for queue in pending if queue]
+                if waiting:
+                    wait(waiting, return_when=FIRST_COMPLETED)
+            for level in range(len(pending)):
+                queue = pending[level]
+                while queue and queue[0].done():
+                    add(level, queue.popleft().result())
+                    if level == 0:
+                        progress['chunks_done'] += 1
+
+        def in_flight():
+            return sum(len(queue) for queue in pending)
+
+        for chunk in chunk_text(blocks, self.chunk_tokens):
+            progress['chunks'] += 1
+            progress['characters'] += len(chunk)
+            while in_flight() >= self.max_pending:
+                collect(block=True)
+            pending[0].append(self.pool.submit(self.summarize, chunk))
+            collect(block=False)
+            yield dict(progress)
+
+        # Finish bottom-up; leftovers at a level are the latest part of the
+        # document, so they go to the end of the level above
+        level = 0
+        while True:
+            while pending[level]:
+                collect(block=True)
+            above = any(buffers[higher] or pending[higher] for higher in range(level + 1, len(pending)))
+            items, buffers[level] = buffers[level], []
+            if not above and len(items) <= 1:
+                yield {**progress, 'summary': items[0] if items else ''}
+                return
+            level_lists(level + 1)
+            if len(items) == 1:
+                # Queue behind any reduce still running for the level above
+                done = Future()
+                done.set_result(items[0])
+                pending[level + 1].append(done)
+            elif items:
+                pending[level + 1].append(self.pool.submit(self._reduce, items))
+                progress['reduces'] += 1
+            level += 1
+            yield dict(progress)
@@ -0,0 +1,441 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+
+from models.conversation import Conversation
+from models.message import Message
+from services.embeddings import EMBEDDING_DIM, get_embedder
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('VECTOR_INDEX_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Relative paths live in the app's instance folder (next to the default
+# SQLite database), whatever directory the server was started from
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance')
+INDEX_PATH = os.path.join(INSTANCE_DIR, os.environ.get('VECTOR_INDEX_PATH', 'vectors'))
+# flat: shared safely by every worker process. chroma: its local store takes
+# a single writer process, so gunicorn refuses it with more than one worker
+BACKEND = os.environ.get('VECTOR_BACKEND', 'flat').lower()
+BATCH_SIZE = int(os.environ.get('VECTOR_BATCH_SIZE', 256))
+FLUSH_INTERVAL = float(os.environ.get('VECTOR_FLUSH_INTERVAL', 1.0))
+MAX_SEGMENTS = int(os.environ.get('VECTOR_MAX_SEGMENTS', 16))
+CHAT_CONTEXT_K = int(os.environ.get('CHAT_CONTEXT_K', 3))
+MIN_SCORE = float(os.environ.get('VECTOR_MIN_SCORE', 0.3))
+SNIPPET_LENGTH = 200
+
+_PENDING_KEY = 'vector_index_pending'
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+conversations = Conversation.__table__
+
+
+def _group_rows(owners):
+    """{owner: row indices} for a segment's owner column"""
+    import numpy as np
+
+    if not len(owners):
+        return {}
+    unique, inverse = np.unique(np.asarray(owners), return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(unique)))[:-1]
+    return dict(zip(unique.tolist(), np.split(order, bounds)))
+
+
+class FlatIndex:
+    """Exact cosine search over float32 segments memory-mapped from disk.
+
+    Every batch is written as an immutable segment (<name>.npy vectors and
+    <name>.json keys / owners, the JSON last so a segment is only visible
+    once complete) and the smallest segments are merged whenever there are
+    more than max_segments. Rows are grouped by owner when a segment is
+    loaded, so a query scoped to one user only reads that user's vectors.
+    Worker processes can share the directory: writers serialise on a lock
+    file and readers pick up new segments on their next query.
+    """
+
+    name = 'flat'
+
+    def __init__(self, path, dim=EMBEDDING_DIM, max_segments=MAX_SEGMENTS):
+        self.path = path
+        self.dim = dim
+        self.max_segments = max(2, max_segments)
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segments = {}   # name -> (vectors, keys, {owner: rows})
+        self._by_owner = {}   # owner -> [(vectors, keys, rows)]
+        self._listing = None
+        self._checked = 0.0
+
+    def __len__(self):
+        self._refresh()
+        return sum(len(keys) for _, keys, _ in self._segments.values())
+
+    def _base(self, name):
+        return os.path.join(self.path, name)
+
+    def _segment_names(self):
+        return sorted(entry[:-5] for entry in os.listdir(self.path) if entry.endswith('.json'))
+
+    @contextmanager
+    def _write_lock(self):
+        with open(os.path.join(self.path, '.lock'), 'w') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _load(self, name):
+        import numpy as np
+
+        with open(self._base(name) + '.json') as handle:
+            meta = json.load(handle)
+        vectors = np.load(self._base(name) + '.npy', mmap_mode='r')
+        return vectors, np.asarray(meta['keys']), _group_rows(meta['owners'])
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < 1.0:
+            return
+        self._checked = now
+        names = self._segment_names()
+        if names == self._listing:
+            return
+
+        segments = {}
+        for name in names:
+            segment = self._segments.get(name)
+            if segment is None:
+                try:
+                    segment = self._load(name)
+                except FileNotFoundError:
+                    continue  # merged away in the meantime
+            segments[name] = segment
+
+        by_owner = {}
+        for vectors, keys, groups in segments.values():
+            for owner, rows in groups.items():
+                by_owner.setdefault(owner, []).append((vectors, keys, rows))
+
+        with self._lock:
+            self._segments, self._by_owner, self._listing = segments, by_owner, names
+
+    def _write(self, name, keys, owners, vectors):
+        import numpy as np
+
+        base = self._base(name)
+        with open(base + '.npy.tmp', 'wb') as handle:
+            np.save(handle, np.ascontiguousarray(vectors, dtype=np.float32))
+        os.replace(base + '.npy.tmp', base + '.npy')
+        with open(base + '.json.tmp', 'w') as handle:
+            json.dump({'keys': list(keys), 'owners': list(owners)}, handle)
+        os.replace(base + '.json.tmp', base + '.json')
+
+    def _remove(self, name):
+        for suffix in ('.json', '.npy'):
+            try:
+                os.remove(self._base(name) + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _merge(self):
+        """Fold the smallest segments into one, keeping the count bounded"""
+        import numpy as np
+
+        names = self._segment_names()
+        if len(names) <= self.max_segments:
+            return
+        names.sort(key=lambda name: os.path.getsize(self._base(name) + '.npy'))
+        victims = names[:len(names) - self.max_segments // 2]
+
+        keys, owners, vectors = [], [], []
+        for name in victims:
+            with open(self._base(name) + '.json') as handle:
+                meta = json.load(handle)
+            keys.extend(meta['keys'])
+            owners.extend(meta['owners'])
+            vectors.append(np.load(self._base(name) + '.npy'))
+        self._write(self._new_name(), keys, owners, np.concatenate(vectors))
+        for name in victims:
+            self._remove(name)
+
+    @staticmethod
+    def _new_name():
+        return f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def add(self, keys, owners, vectors):
+        """Persist one batch as a new segment"""
+        if not len(keys):
+            return
+        with self._write_lock():
+            self._write(self._new_name(), keys, owners, vectors)
+            self._merge()
+        self._refresh(force=True)
+
+    def search(self, vector, k, owner=None):
+        """[(key, cosine score)] of the k nearest vectors, best first"""
+        import numpy as np
+
+        self._refresh()
+        with self._lock:
+            if owner is None:
+                parts = [(vectors, keys, None) for vectors, keys, _ in self._segments.values()]
+            else:
+                parts = list(self._by_owner.get(owner, ()))
+
+        scores, found = [], []
+        for vectors, keys, rows in parts:
+            block = vectors if rows is None else vectors[rows]
+            part_scores = block @ vector
+            if len(part_scores) > k:
+                top = np.argpartition(part_scores, -k)[-k:]
+            else:
+                top = np.arange(len(part_scores))
+            scores.append(part_scores[top])
+            found.append(keys[top] if rows is None else keys[rows[top]])
+        if not scores:
+            return []
+
+        scores = np.concatenate(scores)
+        found = np.concatenate(found)
+        results, seen = [], set()
+        for position in np.argsort(-scores):
+            key = str(found[position])
+            if key in seen:
+                continue  # briefly present in a segment and its merge
+            seen.add(key)
+            results.append((key, float(scores[position])))
+            if len(results) == k:
+                break
+        return results
+
+
+class ChromaIndex:
+    """HNSW approximate nearest-neighbour index persisted by chromadb"""
+
+    name = 'chroma'
+
+    def __init__(self, path, dim=EMBEDDING_DIM):
+        import chromadb
+
+        self.dim = dim
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(
+            'jarvis', metadata={'hnsw:space': 'cosine'}, embedding_function=None
+        )
+        self.max_batch = self.client.get_max_batch_size()
+
+    def __len__(self):
+        return self.collection.count()
+
+    def add(self, keys, owners, vectors):
+        for start in range(0, len(keys), self.max_batch):
+            end = start + self.max_batch
+            self.collection.upsert(
+                ids=list(keys[start:end]),
+                embeddings=vectors[start:end].tolist(),
+                metadatas=[{'owner': owner} for owner in owners[start:end]]
+            )
+
+    def search(self, vector, k, owner=None):
+        result = self.collection.query(
+            query_embeddings=[vector.tolist()],
+            n_results=k,
+            where={'owner': owner} if owner else None,
+            include=['distances']
+        )
+        return [(key, 1.0 - distance) for key, distance in zip(result['ids'][0], result['distances'][0])]
+
+
+def create_index(path=INDEX_PATH, backend=BACKEND, dim=EMBEDDING_DIM):
+    """FlatIndex, or chromadb's HNSW index when asked for by name.
+
+    'auto' is accepted from older configs and means flat: chroma is never
+    picked just because it can be imported.
+    """
+    if backend == 'chroma':
+        return ChromaIndex(path, dim)
+    if backend not in ('flat', 'auto'):
+        raise RuntimeError(f"Unknown VECTOR_BACKEND: {backend}")
+    return FlatIndex(path, dim)
+
+
+class Indexer:
+    """Background thread that embeds queued documents and indexes them in batches.
+
+    Callers only pay for a queue put; the thread waits up to flush_interval
+    to fill a batch of batch_size, so the index sees few, large writes.
+    """
+
+    def __init__(self, index_factory, embedder, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.index_factory = index_factory
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._index = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.indexed = 0
+        self.batches = 0
+        self.errors = 0
+
+    @property
+    def index(self):
+        if self._index is None or self._pid != os.getpid():
+            with self._lock:
+                if self._index is None or self._pid != os.getpid():
+                    self._index = self.index_factory()
+                    self._pid = os.getpid()
+                    self._queue = queue.Queue()
+                    self._thread = None
+        return self._index
+
+    def submit(self, items):
+        """Queue (key, owner, text) tuples for indexing"""
+        index = self.index
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(index, self._queue), name='vector-indexer', daemon=True)
+                self._thread.start()
+        for item in items:
+            self._queue.put(item)
+
+    def _run(self, index, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                keys, owners, texts = zip(*batch)
+                index.add(keys, owners, self.embedder.embed_batch(texts))
+                self.indexed += len(batch)
+                self.batches += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("Vector indexing failed for %d documents", len(batch))
+            finally:
+                for _ in batch:
+                    pending.task_done()
+
+    def flush(self, timeout=10.0):
+        """Wait until everything queued so far is indexed"""
+        deadline = time.monotonic() + timeout
+        while self._queue is not None and self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def stats(self):
+        return {
+            'backend': self._index.name if self._index is not None else None,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'indexed': self.indexed,
+            'batches': self.batches,
+            'errors': self.errors
+        }
+
+
+indexer = Indexer(create_index, get_embedder())
+atexit.register(indexer.flush)
+
+
+def snippet(text, query, width=SNIPPET_LENGTH):
+    """Window of text around the first query word it contains"""
+    lower = text.lower()
+    positions = [lower.find(word) for word in _WORD.findall(query.lower())]
+    positions = [position for position in positions if position >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    piece = text[start:start + width]
+    return ('...' if start else '') + piece + ('...' if start + width < len(text) else '')
+
+
+def search_messages(user_id, query, k=5, min_score=0.0):
+    """The user's k messages most similar to query, best first"""
+    hits = [
+        (key.split(':', 1)[1], score)
+        for key, score in indexer.index.search(get_embedder().embed(query), k * 2, owner=user_id)
+        if key.startswith('message:') and score > min_score
+    ]
+    if not hits:
+        return []
+
+    messages = {
+        message.id: message
+        for message in Message.query.join(Conversation).filter(
+            Conversation.user_id == user_id,
+            Message.id.in_([message_id for message_id, _ in hits])
+        )
+    }
+    results = []
+    for message_id, score in hits:
+        message = messages.get(message_id)
+        if message is None:
+            continue  # deleted since it was indexed
+        results.append({
+            'message_id': message.id,
+            'conversation_id': message.conversation_id,
+            'sender': message.sender,
+            'snippet': snippet(message.content, query),
+            'score': round(score, 4),
+            'timestamp': message.timestamp.isoformat() if message.timestamp else None
+        })
+        if len(results) == k:
+            break
+    return results
+
+
+def chat_context(user_id, message, k=CHAT_CONTEXT_K):
+    """Snippets from earlier messages to ground a chat reply, or None"""
+    if not ENABLED or k <= 0:
+        return None
+    try:
+        hits = search_messages(user_id, message, k, min_score=MIN_SCORE)
+    except Exception:
+        # Retrieval only enriches the prompt; never fail the chat over it
+        logger.exception("Chat context retrieval failed")
+        return None
+    return [hit['snippet'] for hit in hits] or None
+
+
+@event.listens_for(Message, 'after_insert')
+def _queue_message(mapper, connection, target):
+    """Remember the new message; it is indexed once the transaction commits"""
+    if not ENABLED:
+        return
+    session = Session.object_session(target)
+    conversation = session.identity_map.get(identity_key(Conversation, target.conversation_id))
+    if conversation is not None:
+        user_id = conversation.user_id
+    else:
+        user_id = connection.execute(
+            select(conversations.c.user_id).where(conversations.c.id == target.conversation_id)
+        ).scalar()
+    session.info.setdefault(_PENDING_KEY, []).append((f'message:{target.id}', user_id, target.content))
+
+
+@event.listens_for(Session, 'after_commit')
+def _index_committed(session):
+    items = session.info.pop(_PENDING_KEY, None)
+    if items:
+        indexer.submit(items)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,550 @@
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models.job import Job
+from models.workspace import WorkspaceItem, WorkspaceSnapshot
+from services.metrics import LATENCY_BUCKETS, Counter, Histogram
+from services.workspace_source import CursorExpired, get_source
+
+logger = logging.getLogger(__name__)
+
+# Older snapshots are served as they are and refreshed in the background
+REFRESH_INTERVAL = int(os.environ.get('WORKSPACE_REFRESH_INTERVAL', 300))
+# Days of per-day mail counts kept in a snapshot
+WINDOW_DAYS = int(os.environ.get('WORKSPACE_WINDOW_DAYS', 30))
+WORKDAY_HOURS = float(os.environ.get('WORKSPACE_WORKDAY_HOURS', 8))
+# Upper bounds, in hours, of the response-time histogram buckets
+RESPONSE_BUCKETS = (1, 4, 24, 72)
+RESPONSE_LABELS = ('<1h', '1-4h', '4-24h', '1-3d', '>3d')
+# Longer events (all-day, multi-day) are not meetings
+MAX_MEETING = timedelta(hours=24)
+INSERT_BATCH = 1000
+
+items = WorkspaceItem.__table__
+snapshots = WorkspaceSnapshot.__table__
+
+refreshes = Counter('jarvis_workspace_refreshes_total', 'Workspace snapshot refreshes, per mode', ['mode'])
+refresh_changes = Histogram('jarvis_workspace_refresh_changes', 'Changed messages and events per refresh', ['mode'],
+                            buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000))
+refresh_duration = Histogram('jarvis_workspace_refresh_duration_seconds', 'Workspace refresh time', ['mode'],
+                             buckets=LATENCY_BUCKETS)
+
+
+def empty_aggregates():
+    return {
+        'messages': 0, 'inbox': 0, 'unread': 0,
+        'received': {}, 'sent': {},
+        'response': {'count': 0, 'seconds': 0, 'buckets': [0] * (len(RESPONSE_BUCKETS) + 1)},
+        'events': 0,
+        # day -> [meetings, minutes, conflicting pairs]
+        'days': {}
+    }
+
+
+def _utc(value):
+    """Naive UTC datetime from an RFC 3339 string"""
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def _response_bucket(seconds):
+    for index, bound in enumerate(RESPONSE_BUCKETS):
+        if seconds < bound * 3600:
+            return index
+    return len(RESPONSE_BUCKETS)
+
+
+class Aggregates:
+    """Running totals; every item adds its contribution and takes it back
+    when it changes or goes away, so a refresh only touches changed items."""
+
+    def __init__(self, data, today):
+        self.data = data
+        self.cutoff = (today - timedelta(days=WINDOW_DAYS)).isoformat()
+
+    def _bump(self, counts, day, amount, slot=None):
+        # Days that left the window were pruned; changes to them are dropped
+        if day < self.cutoff:
+            return
+        if slot is None:
+            counts[day] = counts.get(day, 0) + amount
+            if not counts[day]:
+                del counts[day]
+            return
+        entry = counts.setdefault(day, [0, 0, 0])
+        entry[slot] += amount
+        if not any(entry):
+            del counts[day]
+
+    def add(self, item, sign=1):
+        data = self.data
+        day = item['at'].date().isoformat()
+        if item['kind'] == 'mail':
+            data['messages'] += sign
+            data['inbox'] += sign * bool(item['inbox'])
+            data['unread'] += sign * bool(item['inbox'] and item['unread'])
+            self._bump(data['sent' if item['sent'] else 'received'], day, sign)
+            if item['response_seconds'] is not None:
+                response = data['response']
+                response['count'] += sign
+                response['seconds'] += sign * item['response_seconds']
+                response['buckets'][_response_bucket(item['response_seconds'])] += sign
+        else:
+            data['events'] += sign
+            self._bump(data['days'], day, sign, 0)
+            self._bump(data['days'], day, sign * int((item['end'] - item['at']).total_seconds() // 60), 1)
+
+    def conflict(self, first_start, second_start, sign=1):
+        """A pair of overlapping meetings counts on the day the later one starts"""
+        self._bump(self.data['days'], max(first_start, second_start).date().isoformat(), sign, 2)
+
+    def prune(self):
+        for counts in (self.data['received'], self.data['sent'], self.data['days']):
+            for day in [day for day in counts if day < self.cutoff]:
+                del counts[day]
+
+
+def mail_item(user_id, message):
+    labels = message.get('labelIds') or []
+    return {
+        'user_id': user_id, 'kind': 'mail', 'item_id': message['id'], 'thread_id': message.get('threadId'),
+        'at': datetime(1970, 1, 1) + timedelta(milliseconds=int(message['internalDate'])), 'end': None,
+        'inbox': 'INBOX' in labels, 'unread': 'UNREAD' in labels, 'sent': 'SENT' in labels,
+        'response_seconds': None
+    }
+
+
+def event_item(user_id, event):
+    """The stored form of a calendar event, or None when it is not a meeting"""
+    start, end = event.get('start', {}).get('dateTime'), event.get('end', {}).get('dateTime')
+    if event.get('status') == 'cancelled' or not start or not end:
+        return None
+    start, end = _utc(start), _utc(end)
+    if not timedelta(0) < end - start <= MAX_MEETING:
+        return None
+    return {
+        'user_id': user_id, 'kind': 'event', 'item_id': event['id'], 'thread_id': None,
+        'at': start, 'end': end, 'inbox': False, 'unread': False, 'sent': False, 'response_seconds': None
+    }
+
+
+# Built once: reusing a statement skips SQLAlchemy's per-call compile work
+_load_items = select(items).where(
+    items.c.user_id == bindparam('user_id'), items.c.kind == bindparam('kind'),
+    items.c.item_id.in_(bindparam('item_ids', expanding=True))
+)
+_delete_item = delete(items).where(
+    items.c.user_id == bindparam('b_user_id'), items.c.kind == bindparam('b_kind'),
+    items.c.item_id == bindparam('b_item_id')
+)
+# Meetings are at most MAX_MEETING long, so this is an index range scan
+_overlapping = select(items.c.item_id, items.c.at, items.c.end).where(
+    items.c.user_id == bindparam('user_id'), items.c.kind == 'event',
+    items.c.at > bindparam('earliest'), items.c.at < bindparam('end'), items.c.end > bindparam('start')
+)
+_thread = select(items.c.item_id, items.c.thread_id, items.c.at, items.c.sent).where(
+    items.c.user_id == bindparam('user_id'), items.c.kind == 'mail',
+    items.c.thread_id == bindparam('thread_id'), items.c.at <= bindparam('at')
+)
+
+
+class Refresh:
+    """Applies Gmail history and Calendar changes to a user's items and aggregates.
+
+    Items named in a page of changes are loaded with one query; their new
+    state is kept in memory and written back in two batched statements at
+    the end, so the database work per change stays a few index lookups.
+    """
+
+    def __init__(self, user_id, aggregates, source):
+        self.user_id = user_id
+        self.aggregates = aggregates
+        self.source = source
+        self.changes = 0
+        # (kind, item_id) -> current item, or None once removed
+        self.touched = {}
+        self.stored = set()
+        # Touched items by thread / touched events, for the overlap and reply lookups
+        self.threads = defaultdict(set)
+        self.events = set()
+
+    def _prefetch(self, kind, item_ids):
+        missing = list({item_id for item_id in item_ids if (kind, item_id) not in self.touched})
+        for start in range(0, len(missing), INSERT_BATCH):
+            rows = db.session.execute(_load_items, {
+                'user_id': self.user_id, 'kind': kind, 'item_ids': missing[start:start + INSERT_BATCH]
+            })
+            for row in rows:
+                self.stored.add((kind, row.item_id))
+                self._track(dict(row._mapping))
+        for item_id in missing:
+            self.touched.setdefault((kind, item_id), None)
+
+    def _track(self, item):
+        # Stored rows of touched items are skipped, so their state comes from here
+        key = (item['kind'], item['item_id'])
+        self.touched[key] = item
+        if item['kind'] == 'mail':
+            self.threads[item['thread_id']].add(key)
+        else:
+            self.events.add(key)
+
+    def _load(self, kind, item_id):
+        return self.touched[(kind, item_id)]
+
+    def _remove(self, item):
+        if item['kind'] == 'event':
+            self._conflicts(item, -1)
+        self.aggregates.add(item, -1)
+        self.touched[(item['kind'], item['item_id'])] = None
+
+    def _store(self, item, existing):
+        if existing is not None:
+            self._remove(existing)
+        self._track(item)
+        self.aggregates.add(item)
+        if item['kind'] == 'event':
+            self._conflicts(item, 1)
+
+    def _current(self, kind, rows, keys):
+        """Stored rows that this refresh has not touched, plus its own items"""
+        for row in rows:
+            if (kind, row.item_id) not in self.touched:
+                yield row._mapping
+        for key in keys:
+            if self.touched[key] is not None:
+                yield self.touched[key]
+
+    def _conflicts(self, event, sign):
+        rows = db.session.execute(_overlapping, {
+            'user_id': self.user_id, 'earliest': event['at'] - MAX_MEETING, 'end': event['end'], 'start': event['at']
+        })
+        for other in self._current('event', rows, self.events):
+            if (other['item_id'] != event['item_id'] and other['at'] < event['end']
+                    and other['end'] > event['at']):
+                self.aggregates.conflict(event['at'], other['at'], sign)
+
+    def _response_seconds(self, reply):
+        """Seconds from the last received message in the thread to this reply,
+        unless an earlier reply already answered it"""
+        rows = db.session.execute(_thread, {'user_id': self.user_id, 'thread_id': reply['thread_id'], 'at': reply['at']})
+        received, replied = None, None
+        for message in self._current('mail', rows, self.threads[reply['thread_id']]):
+            if message['thread_id'] != reply['thread_id'] or message['at'] > reply['at'] \
+                    or message['item_id'] == reply['item_id']:
+                continue
+            if message['sent']:
+                replied = max(replied or message['at'], message['at'])
+            else:
+                received = max(received or message['at'], message['at'])
+        if received is None or (replied is not None and replied >= received):
+            return None
+        return int((reply['at'] - received).total_seconds())
+
+    def write(self):
+        """Replace the stored rows of every touched item with its new state"""
+        if self.stored:
+            db.session.execute(_delete_item, [
+                {'b_user_id': self.user_id, 'b_kind': kind, 'b_item_id': item_id} for kind, item_id in self.stored
+            ])
+        rows = [item for item in self.touched.values() if item is not None]
+        for start in range(0, len(rows), INSERT_BATCH):
+            db.session.execute(insert(items), rows[start:start + INSERT_BATCH])
+
+    def apply_history(self, cursor):
+        """Apply Gmail history records after cursor; returns the new history id"""
+        page_token = None
+        while True:
+            page = self.source.list_history(self.user_id, cursor, page_token)
+            self._prefetch('mail', [
+                change['message']['id'] for record in page.get('history', []) for kind in
+                ('messagesAdded', 'messagesDeleted', 'labelsAdded', 'labelsRemoved') for change in record.get(kind, [])
+            ])
+            for record in page.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added['message']
+                    if 'DRAFT' in message.get('labelIds', []) or self._load('mail', message['id']):
+                        continue
+                    item = mail_item(self.user_id, message)
+                    if item['sent']:
+                        item['response_seconds'] = self._response_seconds(item)
+                    self._store(item, None)
+                    self.changes += 1
+                for removed in record.get('messagesDeleted', []):
+                    item = self._load('mail', removed['message']['id'])
+                    if item is not None:
+                        self._remove(item)
+                        self.changes += 1
+                for change, present in (('labelsAdded', True), ('labelsRemoved', False)):
+                    for labelled in record.get(change, []):
+                        item = self._load('mail', labelled['message']['id'])
+                        if item is None:
+                            continue
+                        updated = dict(item)
+                        for label, field in (('INBOX', 'inbox'), ('UNREAD', 'unread'), ('SENT', 'sent')):
+                            if label in labelled['labelIds']:
+                                updated[field] = present
+                        if updated != item:
+                            self._store(updated, item)
+                            self.changes += 1
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return page['historyId']
+
+    def apply_events(self, sync_token):
+        """Apply Calendar changes since sync_token; returns the next sync token"""
+        page_token = None
+        while True:
+            page = self.source.list_events(self.user_id, sync_token, page_token)
+            self._prefetch('event', [event['id'] for event in page.get('items', [])])
+            for event in page.get('items', []):
+                existing = self._load('event', event['id'])
+                item = event_item(self.user_id, event)
+                if item is not None:
+                    self._store(item, existing)
+                elif existing is not None:
+                    self._remove(existing)
+                self.changes += 1
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return page['nextSyncToken']
+
+    def full_sync(self):
+        """Drop the user's items and rebuild everything; returns both cursors"""
+        db.session.execute(delete(items).where(items.c.user_id == self.user_id))
+        self.touched, self.stored = {}, set()
+        mail, history_id, page_token = [], None, None
+        while True:
+            page = self.source.list_messages(self.user_id, page_token)
+            # The history id from before the listing: later changes are replayed
+            history_id = history_id or page['historyId']
+            mail.extend(mail_item(self.user_id, message) for message in page.get('messages', [])
+                        if 'DRAFT' not in message.get('labelIds', []))
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+        events, page_token = [], None
+        while True:
+            page = self.source.list_events(self.user_id, None, page_token)
+            events.extend(item for item in map(lambda event: event_item(self.user_id, event), page.get('items', []))
+                          if item is not None)
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                sync_token = page['nextSyncToken']
+                break
+
+        # Same rule as _response_seconds, in one pass per thread
+        mail.sort(key=lambda item: (item['thread_id'] or '', item['at']))
+        thread, received, replied = None, None, None
+        for item in mail:
+            if item['thread_id'] != thread:
+                thread, received, replied = item['thread_id'], None, None
+            if not item['sent']:
+                received = item['at']
+            else:
+                if received is not None and (replied is None or replied < received):
+                    item['response_seconds'] = int((item['at'] - received).total_seconds())
+                replied = item['at']
+
+        # Sweep over start times for overlapping meetings
+        events.sort(key=lambda item: item['at'])
+        active = []
+        for event in events:
+            active = [other for other in active if other['end'] > event['at']]
+            for other in active:
+                self.aggregates.conflict(other['at'], event['at'])
+            active.append(event)
+
+        for item in mail + events:
+            self.aggregates.add(item)
+        for rows in (mail, events):
+            for start in range(0, len(rows), INSERT_BATCH):
+                db.session.execute(insert(items), rows[start:start + INSERT_BATCH])
+        self.changes = len(mail) + len(events)
+        return history_id, sync_token
+
+
+def refresh(user_id, source=None, force_full=False):
+    """Bring the user's snapshot up to date and commit it.
+
+    Replays only what changed since the stored history id and sync token;
+    a missing or expired cursor falls back to a full sync. Returns a summary,
+    or None when a concurrent refresh of the same user committed first.
+    """
+    try:
+        return _refresh(user_id, source or get_source(), force_full)
+    except IntegrityError:
+        # Two first syncs of one user raced on its items or snapshot row
+        db.session.rollback()
+        logger.info("Concurrent workspace refresh of user %s committed first", user_id)
+        return None
+
+
+def _refresh(user_id, source, force_full):
+    started = time.perf_counter()
+    row = db.session.execute(select(snapshots).where(snapshots.c.user_id == user_id)).first()
+    full = force_full or row is None or not row.mail_cursor or not row.calendar_cursor
+    aggregates = Aggregates(empty_aggregates() if full else json.loads(row.aggregates), datetime.utcnow().date())
+    work = Refresh(user_id, aggregates, source)
+    if not full:
+        try:
+            mail_cursor = work.apply_history(row.mail_cursor)
+            calendar_cursor = work.apply_events(row.calendar_cursor)
+            work.write()
+        except CursorExpired:
+            logger.info("Workspace cursor of user %s expired, syncing in full", user_id)
+            full = True
+    if full:
+        aggregates.data = empty_aggregates()
+        mail_cursor, calendar_cursor = work.full_sync()
+    aggregates.prune()
+
+    elapsed = time.perf_counter() - started
+    values = dict(
+        mail_cursor=mail_cursor, calendar_cursor=calendar_cursor, aggregates=json.dumps(aggregates.data),
+        last_changes=work.changes, last_refresh_ms=round(elapsed * 1000, 2), refreshed_at=datetime.utcnow()
+    )
+    if row is None:
+        db.session.execute(insert(snapshots).values(user_id=user_id, version=1, full_syncs=1, **values))
+        version = 1
+    else:
+        version = row.version + 1
+        # Only over the version this refresh started from
+        stored = db.session.execute(
+            update(snapshots)
+            .where(snapshots.c.user_id == user_id, snapshots.c.version == row.version)
+            .values(version=version, full_syncs=snapshots.c.full_syncs + int(full), **values)
+        ).rowcount
+        if not stored:
+            db.session.rollback()
+            return None
+    db.session.commit()
+
+    mode = 'full' if full else 'incremental'
+    refreshes.inc(mode=mode)
+    refresh_changes.observe(work.changes, mode=mode)
+    refresh_duration.observe(elapsed, mode=mode)
+    return {'mode': mode, 'changes': work.changes, 'refresh_ms': values['last_refresh_ms'], 'version': version}
+
+
+def refresh_job(payload, report):
+    """Job body for a background refresh"""
+    return refresh(payload['user_id'])
+
+
+def request_refresh(user_id):
+    """The user's waiting or running refresh job, queueing one if there is none"""
+    from services.jobs import enqueue
+
+    pending = Job.query.filter(
+        Job.user_id == user_id, Job.kind == 'refresh_workspace', Job.status.in_(('queued', 'running'))
+    ).first()
+    return pending or enqueue(user_id, 'refresh_workspace', {'user_id': user_id})
+
+
+def _hours(value):
+    return f"{round(value, 1)} hours"
+
+
+def stats_from(data, today):
+    """The analysis view of a snapshot, relative to today"""
+    today_key = today.isoformat()
+    week = [(today + timedelta(days=offset)).isoformat() for offset in range(7)]
+    last_week = [(today - timedelta(days=offset)).isoformat() for offset in range(7)]
+    days = data['days']
+    meetings_today, minutes_today, conflicts_today = days.get(today_key, [0, 0, 0])
+    response = data['response']
+    week_minutes = sum(days.get(day, [0, 0, 0])[1] for day in week)
+    return {
+        "email_stats": {
+            "unread": data['unread'],
+            "inbox": data['inbox'],
+            "sent_today": data['sent'].get(today_key, 0),
+            "received_today": data['received'].get(today_key, 0),
+            "response_time": _hours(response['seconds'] / response['count'] / 3600) if response['count'] else None,
+            "response_times": dict(zip(RESPONSE_LABELS, response['buckets']))
+        },
+        "calendar_stats": {
+            "meetings_today": meetings_today,
+            "free_time": _hours(max(WORKDAY_HOURS - minutes_today / 60, 0)),
+            "conflicts": conflicts_today,
+            "meetings_next_7_days": sum(days.get(day, [0, 0, 0])[0] for day in week),
+            "conflicts_next_7_days": sum(days.get(day, [0, 0, 0])[2] for day in week)
+        },
+        "productivity": {
+            "sent_last_7_days": sum(data['sent'].get(day, 0) for day in last_week),
+            "received_last_7_days": sum(data['received'].get(day, 0) for day in last_week),
+            "meeting_hours_next_7_days": round(week_minutes / 60, 1),
+            # Share of the next five workdays' hours spent in meetings
+            "meeting_load": round(week_minutes / 60 / (WORKDAY_HOURS * 5), 2)
+        }
+    }
+
+
+def snapshot(user_id):
+    """(stats, info) from the stored snapshot: one primary-key read.
+
+    A user without a snapshot gets empty stats with info['ready'] False
+    while the first full sync runs as a background job; a snapshot older
+    than REFRESH_INTERVAL is returned as it is and refreshed in the
+    background. The caller commits.
+    """
+    row = db.session.get(WorkspaceSnapshot, user_id)
+    if row is None:
+        info = {
+            "ready": False,
+            "version": 0,
+            "refreshed_at": None,
+            "age_seconds": None,
+            "refreshing": request_refresh(user_id) is not None,
+            "last_changes": 0,
+            "last_refresh_ms": None
+        }
+        return stats_from(empty_aggregates(), datetime.utcnow().date()), info
+    age = (datetime.utcnow() - row.refreshed_at).total_seconds()
+    refreshing = age > REFRESH_INTERVAL and request_refresh(user_id) is not None
+    info = {
+        "ready": True,
+        "version": row.version,
+        "refreshed_at": row.refreshed_at.isoformat(timespec='seconds'),
+        "age_seconds": int(age),
+        "refreshing": refreshing,
+        "last_changes": row.last_changes,
+        "last_refresh_ms": row.last_refresh_ms
+    }
+    return stats_from(row.load(), datetime.utcnow().date()), info
+
+
+workspace_cli = AppGroup('workspace', help="Refresh workspace analytics snapshots.")
+
+
+@workspace_cli.command('refresh')
+@click.option('--email', help="Only this user.")
+@click.option('--stale', is_flag=True, help="Only snapshots older than WORKSPACE_REFRESH_INTERVAL.")
+@click.option('--full', is_flag=True, help="Sync in full instead of replaying changes.")
+def refresh_command(email, stale, full):
+    """Refresh existing snapshots; run it from cron to keep them current."""
+    from models.user import User
+
+    query = select(snapshots.c.user_id)
+    if email:
+        query = select(User.id).where(User.email == email)
+    elif stale:
+        query = query.where(snapshots.c.refreshed_at < datetime.utcnow() - timedelta(seconds=REFRESH_INTERVAL))
+    user_ids = db.session.execute(query).scalars().all()
+    db.session.rollback()
+    changes = 0
+    for user_id in user_ids:
+        result = refresh(user_id, force_full=full)
+        changes += result['changes'] if result else 0
+    click.echo(f"Refreshed {len(user_ids)} snapshots, {changes} changes")
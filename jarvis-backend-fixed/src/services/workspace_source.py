@@ -0,0 +1,262 @@
+import bisect
+import itertools
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+# Where workspace data comes from. Sources answer in the shape of the Gmail
+# (messages.list, history.list) and Calendar (events.list with syncToken)
+# APIs, so the analytics engine only ever asks for what changed since a
+# history id or sync token.
+
+PAGE_SIZE = 500
+
+_source = None
+_source_lock = threading.Lock()
+
+
+class CursorExpired(Exception):
+    """The history id or sync token is too old (Gmail 404, Calendar 410); sync in full"""
+
+
+class WorkspaceSource:
+    """Base class: the Gmail and Calendar calls the analytics engine uses.
+
+    Messages are {'id', 'threadId', 'labelIds', 'internalDate'} (epoch ms),
+    events {'id', 'status', 'start': {'dateTime'}, 'end': {'dateTime'}}.
+    """
+
+    name = 'base'
+
+    def list_messages(self, user, page_token=None):
+        """{'messages', 'nextPageToken', 'historyId'}: every message, for a full sync"""
+        raise NotImplementedError
+
+    def list_history(self, user, start_history_id, page_token=None):
+        """{'history', 'nextPageToken', 'historyId'}: changes after start_history_id"""
+        raise NotImplementedError
+
+    def list_events(self, user, sync_token=None, page_token=None):
+        """{'items', 'nextPageToken', 'nextSyncToken'}: all events, or those changed since sync_token"""
+        raise NotImplementedError
+
+
+def _ms(moment):
+    return str(int((moment - datetime(1970, 1, 1)).total_seconds() * 1000))
+
+
+class _Mailbox:
+    """One user's fake mail and calendar, with a bounded change log"""
+
+    def __init__(self, user, messages, events_per_day, now):
+        self.rng = random.Random(zlib.crc32(user.encode()))
+        self.lock = threading.Lock()
+        self.messages = {}
+        self.history = []
+        self.history_id = 1000
+        self.events = {}
+        self.event_log = []
+        self.sequence = 0
+        self.next_id = 0
+        self.threads = []
+        for n in range(messages):
+            at = now - timedelta(days=30) + timedelta(seconds=self.rng.uniform(0, 30 * 86400))
+            self._add_message(at, reply=n % 4 == 3, unread=self.rng.random() < 0.1, log=False)
+        for day in range(-14, 15):
+            for _ in range(self.rng.randint(0, events_per_day * 2)):
+                self._put_event(self._event_time(now.date() + timedelta(days=day)), log=False)
+        self.last_activity = time.monotonic()
+
+    def _new_id(self):
+        self.next_id += 1
+        return format(self.next_id, 'x')
+
+    def _event_time(self, day):
+        start = datetime.combine(day, datetime.min.time()) + timedelta(minutes=self.rng.randrange(8 * 60, 17 * 60, 15))
+        return start, start + timedelta(minutes=self.rng.choice((15, 30, 30, 45, 60, 60, 90)))
+
+    def _record(self, record):
+        self.history_id += 1
+        self.history.append((self.history_id, {'id': str(self.history_id), **record}))
+
+    def _add_message(self, at, reply=False, unread=False, log=True):
+        if reply and self.threads:
+            thread = self.rng.choice(self.threads[-200:])
+            labels = ['SENT']
+        else:
+            thread = self._new_id()
+            self.threads.append(thread)
+            labels = ['INBOX'] + (['UNREAD'] if unread else [])
+        message = {'id': self._new_id(), 'threadId': thread, 'labelIds': labels, 'internalDate': _ms(at)}
+        self.messages[message['id']] = message
+        if log:
+            self._record({'messagesAdded': [{'message': dict(message)}]})
+
+    def _put_event(self, times, event_id=None, status='confirmed', log=True):
+        self.sequence += 1
+        event = {
+            'id': event_id or self._new_id(),
+            'status': status,
+            'start': {'dateTime': times[0].isoformat() + 'Z'},
+            'end': {'dateTime': times[1].isoformat() + 'Z'},
+            'sequence': self.sequence
+        }
+        self.events[event['id']] = event
+        if log:
+            self.event_log.append((self.sequence, event['id']))
+
+    def _recent(self, items, count):
+        return list(itertools.islice(reversed(items), count))
+
+    def simulate(self, changes, now):
+        """Apply random activity: new mail, replies, reads, deletes and calendar edits"""
+        for _ in range(changes):
+            roll = self.rng.random()
+            if roll < 0.3:
+                self._add_message(now, unread=True)
+            elif roll < 0.45:
+                self._add_message(now, reply=True)
+            elif roll < 0.65:
+                unread = [m for m in self._recent(self.messages.values(), 500) if 'UNREAD' in m['labelIds']]
+                if unread:
+                    message = self.rng.choice(unread)
+                    message['labelIds'].remove('UNREAD')
+                    self._record({'labelsRemoved': [{'message': {'id': message['id'], 'threadId': message['threadId']},
+                                                     'labelIds': ['UNREAD']}]})
+            elif roll < 0.7 and self.messages:
+                message = self.messages.pop(self.rng.choice(self._recent(self.messages, 500)))
+                self._record({'messagesDeleted': [{'message': {'id': message['id'], 'threadId': message['threadId']}}]})
+            elif roll < 0.85:
+                self._put_event(self._event_time(now.date() + timedelta(days=self.rng.randint(0, 7))))
+            else:
+                live = [event_id for event_id, event in self._recent(self.events.items(), 300) if event['status'] == 'confirmed']
+                if live:
+                    event_id = self.rng.choice(live)
+                    if roll < 0.93:
+                        self._put_event(self._event_time(now.date() + timedelta(days=self.rng.randint(0, 7))), event_id)
+                    else:
+                        event = self.events[event_id]
+                        start = datetime.fromisoformat(event['start']['dateTime'][:-1])
+                        end = datetime.fromisoformat(event['end']['dateTime'][:-1])
+                        self._put_event((start, end), event_id, status='cancelled')
+
+
+class FakeWorkspace(WorkspaceSource):
+    """In-memory Gmail and Calendar with deterministic data per user.
+
+    Every process has its own copy; activity happens through simulate() or,
+    with activity_per_minute, on its own between calls. Only the last
+    history_limit changes are kept, so an old cursor expires like it does
+    at Google.
+    """
+
+    name = 'fake'
+
+    def __init__(self, messages=2000, events_per_day=3, history_limit=5000, activity_per_minute=0):
+        self.message_count = messages
+        self.events_per_day = events_per_day
+        self.history_limit = history_limit
+        self.activity_per_minute = activity_per_minute
+        self._mailboxes = {}
+        self._lock = threading.Lock()
+
+    def mailbox(self, user):
+        with self._lock:
+            if user not in self._mailboxes:
+                self._mailboxes[user] = _Mailbox(user, self.message_count, self.events_per_day, datetime.utcnow())
+            mailbox = self._mailboxes[user]
+        if self.activity_per_minute:
+            with mailbox.lock:
+                due = int((time.monotonic() - mailbox.last_activity) / 60 * self.activity_per_minute)
+                if due:
+                    mailbox.last_activity = time.monotonic()
+                    self._simulate(mailbox, due)
+        return mailbox
+
+    def simulate(self, user, changes, now=None):
+        mailbox = self.mailbox(user)
+        with mailbox.lock:
+            self._simulate(mailbox, changes, now)
+
+    def _simulate(self, mailbox, changes, now=None):
+        mailbox.simulate(changes, now or datetime.utcnow())
+        del mailbox.history[:-self.history_limit]
+        del mailbox.event_log[:-self.history_limit]
+
+    def list_messages(self, user, page_token=None):
+        mailbox = self.mailbox(user)
+        with mailbox.lock:
+            start = int(page_token or 0)
+            ids = list(mailbox.messages)[start:start + PAGE_SIZE]
+            more = start + PAGE_SIZE < len(mailbox.messages)
+            return {
+                'messages': [dict(mailbox.messages[message_id], labelIds=list(mailbox.messages[message_id]['labelIds']))
+                             for message_id in ids],
+                'nextPageToken': str(start + PAGE_SIZE) if more else None,
+                'historyId': str(mailbox.history_id)
+            }
+
+    def list_history(self, user, start_history_id, page_token=None):
+        mailbox = self.mailbox(user)
+        with mailbox.lock:
+            start = int(start_history_id)
+            oldest = mailbox.history[0][0] if mailbox.history else mailbox.history_id + 1
+            if start < oldest - 1 and start < mailbox.history_id:
+                raise CursorExpired(start_history_id)
+            ids = [history_id for history_id, _ in mailbox.history]
+            first = int(page_token) if page_token else bisect.bisect_right(ids, start)
+            page = mailbox.history[first:first + PAGE_SIZE]
+            more = first + PAGE_SIZE < len(mailbox.history)
+            return {
+                'history': [record for _, record in page],
+                'nextPageToken': str(first + PAGE_SIZE) if more else None,
+                'historyId': str(mailbox.history_id)
+            }
+
+    def list_events(self, user, sync_token=None, page_token=None):
+        mailbox = self.mailbox(user)
+        with mailbox.lock:
+            if sync_token is None:
+                # A full listing leaves out cancelled events, as Google does
+                ids = [event_id for event_id, event in mailbox.events.items() if event['status'] == 'confirmed']
+            else:
+                since = int(sync_token)
+                oldest = mailbox.event_log[0][0] if mailbox.event_log else mailbox.sequence + 1
+                if since < oldest - 1 and since < mailbox.sequence:
+                    raise CursorExpired(sync_token)
+                sequences = [sequence for sequence, _ in mailbox.event_log]
+                changed = mailbox.event_log[bisect.bisect_right(sequences, since):]
+                ids = list(dict.fromkeys(event_id for _, event_id in changed))
+            start = int(page_token or 0)
+            more = start + PAGE_SIZE < len(ids)
+            return {
+                'items': [dict(mailbox.events[event_id]) for event_id in ids[start:start + PAGE_SIZE]],
+                'nextPageToken': str(start + PAGE_SIZE) if more else None,
+                'nextSyncToken': None if more else str(mailbox.sequence)
+            }
+
+
+def create_source():
+    """Build the source selected by WORKSPACE_SOURCE (default: fake)"""
+    name = os.environ.get('WORKSPACE_SOURCE', 'fake').lower()
+    if name == 'fake':
+        return FakeWorkspace(
+            messages=int(os.environ.get('WORKSPACE_FAKE_MESSAGES', 2000)),
+            events_per_day=int(os.environ.get('WORKSPACE_FAKE_EVENTS_PER_DAY', 3)),
+            history_limit=int(os.environ.get('WORKSPACE_FAKE_HISTORY', 5000)),
+            activity_per_minute=float(os.environ.get('WORKSPACE_FAKE_ACTIVITY', 0))
+        )
+    raise RuntimeError(f"Unknown WORKSPACE_SOURCE: {name}")
+
+
+def get_source():
+    """Process-wide workspace source, created on first use"""
+    global _source
+    if _source is None:
+        with _source_lock:
+            if _source is None:
+                _source = create_source()
+    return _source
@@ -0,0 +1,285 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, update
+
+from extensions import db
+from models.conversation import Conversation, PREVIEW_LENGTH
+from models.message import Message
+from services import vector_index
+from services.credits import set_usage_sink, write_usage
+from services.metrics import RateMeter
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL_MS', 5)) / 1000.0
+MAX_ROWS = int(os.environ.get('WRITE_BEHIND_MAX_ROWS', 500))
+WAIT_TIMEOUT = float(os.environ.get('WRITE_BEHIND_WAIT_TIMEOUT', 10))
+
+messages_table = Message.__table__
+conversations = Conversation.__table__
+
+_bump_conversation = (
+    update(conversations)
+    .where(conversations.c.id == bindparam('b_id'))
+    .values(
+        message_count=conversations.c.message_count + bindparam('b_count'),
+        last_message_preview=bindparam('b_preview'),
+        updated_at=bindparam('b_updated_at')
+    )
+)
+_store_summary = (
+    update(conversations)
+    .where(conversations.c.id == bindparam('b_id'))
+    .values(
+        context_summary=bindparam('b_summary'),
+        summarized_count=bindparam('b_summarized_count'),
+        updated_at=conversations.c.updated_at
+    )
+)
+
+
+class _Item:
+    __slots__ = ('owners', 'messages', 'usage', 'summaries', 'seq', 'future')
+
+    def __init__(self, owners, messages=(), usage=(), summaries=()):
+        self.owners = owners
+        self.messages = list(messages)
+        self.usage = list(usage)
+        self.summaries = list(summaries)
+        self.seq = None
+        self.future = Future()
+
+    def __len__(self):
+        return len(self.messages) + len(self.usage) + len(self.summaries)
+
+
+class GroupCommitter:
+    """One writer thread per process that commits queued rows in groups.
+
+    Requests queue their message rows (and the committed charges' usage
+    records) and the thread commits everything that arrived within
+    interval seconds, or max_rows rows, in one transaction: many chat turns
+    share one fsync instead of paying one each, and the database sees a
+    single writer per worker process. Batches commit in submission order.
+    """
+
+    def __init__(self, app, interval=INTERVAL, max_rows=MAX_ROWS):
+        self.app = app
+        self.interval = interval
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._seq = 0
+        self._committed = 0
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._pid = os.getpid()
+        self.commits = RateMeter('write_behind_commits')
+        self.rows = RateMeter('write_behind_rows')
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, owners, messages=(), usage=(), summaries=()):
+        """Queue rows; the returned Future resolves once they are committed"""
+        item = _Item(owners, messages, usage, summaries)
+        with self._lock:
+            self._seq += 1
+            item.seq = self._seq
+            for owner in owners:
+                self._latest[owner] = item.seq
+            # Enqueue under the lock so queue order matches seq order
+            self._queue.put(item)
+        return item.future
+
+    def wait_for(self, owner, timeout=WAIT_TIMEOUT):
+        """Block until everything queued for owner so far is committed"""
+        with self._lock:
+            target = self._latest.get(owner, 0)
+            return self._done.wait_for(lambda: self._committed >= target, timeout)
+
+    def flush(self, timeout=WAIT_TIMEOUT):
+        with self._lock:
+            target = self._seq
+            return self._done.wait_for(lambda: self._committed >= target, timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            rows = len(batch[0])
+            deadline = time.monotonic() + self.interval
+            while rows < self.max_rows:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item)
+            with self.app.app_context():
+                self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
+        try:
+            self._write(batch)
+            errors = {}
+        except Exception:
+            # Retry one by one so a single bad row cannot fail its neighbours
+            logger.exception("Group commit of %d items failed, retrying individually", len(batch))
+            errors = {}
+            for item in batch:
+                try:
+                    self._write([item])
+                except Exception as error:
+                    self.failures += 1
+                    errors[item.seq] = error
+
+        with self._lock:
+            self._committed = batch[-1].seq
+            self._done.notify_all()
+        for item in batch:
+            if item.seq in errors:
+                item.future.set_exception(errors[item.seq])
+            else:
+                item.future.set_result(True)
+
+    def _write(self, batch):
+        messages = [row for item in batch for row, _ in item.messages]
+        usage = [record for item in batch for record in item.usage]
+        summaries = [summary for item in batch for summary in item.summaries]
+
+        with db.engine.begin() as connection:
+            if messages:
+                connection.execute(insert(messages_table), messages)
+                connection.execute(_bump_conversation, _conversation_updates(messages))
+            if summaries:
+                connection.execute(_store_summary, summaries)
+            write_usage(connection, usage)
+
+        self.commits.mark()
+        self.rows.mark(len(messages) + len(usage) + len(summaries))
+        if vector_index.ENABLED and messages:
+            vector_index.indexer.submit([
+                (f"message:{row['id']}", owner, row['content'])
+                for item in batch for row, owner in item.messages
+            ])
+
+    def stats(self):
+        commits = self.commits.stats()
+        return {
+            'queued': self._queue.qsize(),
+            'commits': commits,
+            'rows': self.rows.stats(),
+            'rows_per_commit': round(self.rows.total / commits['total'], 2) if commits['total'] else 0.0,
+            'failures': self.failures
+        }
+
+
+def _conversation_updates(rows):
+    """message_count / preview / updated_at per conversation, as the
+    Message insert hook would maintain them row by row"""
+    updates = {}
+    for row in rows:
+        current = updates.get(row['conversation_id'])
+        if current is None:
+            updates[row['conversation_id']] = current = {
+                'b_id': row['conversation_id'], 'b_count': 0, 'b_preview': None, 'b_updated_at': None
+            }
+        current['b_count'] += 1
+        if current['b_updated_at'] is None or row['timestamp'] >= current['b_updated_at']:
+            current['b_preview'] = row['content'][:PREVIEW_LENGTH]
+            current['b_updated_at'] = row['timestamp']
+    return list(updates.values())
+
+
+_committer = None
+_committer_lock = threading.Lock()
+
+
+def get_committer():
+    """The process's group committer, started on first use (after fork)"""
+    global _committer
+    if _committer is None or _committer._pid != os.getpid():
+        with _committer_lock:
+            if _committer is None or _committer._pid != os.getpid():
+                _committer = GroupCommitter(current_app._get_current_object())
+    return _committer
+
+
+def _enqueue_usage(records):
+    get_committer().submit({record['user_id'] for record in records}, usage=records)
+
+
+if ENABLED:
+    set_usage_sink(_enqueue_usage)
+
+
+def save_messages(user_id, messages, context=None):
+    """Persist new Message objects and, optionally, a conversation summary.
+
+    Returns once they are durable and raises if they could not be stored,
+    so the caller always knows which of the two happened. Without
+    write-behind they are added to the request's session and committed.
+    With WRITE_BEHIND they go to the group committer and this waits for the
+    batch holding them, so the ids in the response are durable and the
+    user's next request reads them. There is no timeout on that wait: the
+    committer resolves every batch within its interval, and giving up early
+    would leave rows that still commit after the request has failed. The
+    Message objects stay transient then; ids and timestamps are assigned
+    here.
+    """
+    if not ENABLED:
+        db.session.add_all(messages)
+        if context is not None:
+            context.save_summary()
+        db.session.commit()
+        return
+
+    # A new conversation must exist before its messages are inserted
+    db.session.commit()
+    rows = []
+    for message in messages:
+        message.id = message.id or str(uuid.uuid4())
+        message.timestamp = message.timestamp or datetime.utcnow()
+        message.credits_used = message.credits_used or 0
+        rows.append(({
+            'id': message.id,
+            'conversation_id': message.conversation_id,
+            'content': message.content,
+            'sender': message.sender,
+            'credits_used': message.credits_used,
+            'timestamp': message.timestamp
+        }, user_id))
+    summaries = []
+    if context is not None:
+        summaries.append({
+            'b_id': context.conversation_id,
+            'b_summary': context.summary,
+            'b_summarized_count': context.summarized_count
+        })
+    get_committer().submit({user_id}, rows, summaries=summaries).result()
+
+
+def read_your_writes(user_id):
+    """Wait for the user's queued usage records before reading them back"""
+    if ENABLED and _committer is not None:
+        _committer.wait_for(user_id)
+
+
+def write_behind_stats():
+    return _committer.stats() if ENABLED and _committer is not None else None
+
+
+@atexit.register
+def _flush_on_exit():
+    if _committer is not None and _committer._pid == os.getpid():
+        _committer.flush()
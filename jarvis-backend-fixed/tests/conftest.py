@@ -0,0 +1,82 @@
+"""
+Shared fixtures: one app on a throwaway SQLite database for the whole run.
+
+The app reads its settings from the environment when it is imported, so
+they are set here before anything under src/ is loaded. Tests isolate
+themselves by creating their own users rather than resetting the database.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='jarvis-tests-')
+
+os.environ.update(
+    DATABASE_URL='sqlite:///' + os.path.join(WORKDIR, 'jarvis.db'),
+    VECTOR_INDEX_ENABLED='false',
+    RATE_LIMIT_ENABLED='false',
+    WRITE_BEHIND='false',
+    JOBS_IN_WEB='false',
+    JOB_PROCESSES='0',
+    LLM_PROVIDER='fake',
+    WORKSPACE_SOURCE='fake',
+    LOG_LEVEL='WARNING'
+)
+for name in ('METRICS_DIR', 'METRICS_TOKEN', 'GEMINI_API_KEY'):
+    os.environ.pop(name, None)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)
+
+from wsgi import application  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """An app context for direct database access. Requests made while it is
+    pushed reuse it, so they share its session and g"""
+    with application.app_context():
+        yield application
+
+
+@pytest.fixture
+def client():
+    return application.test_client()
+
+
+@pytest.fixture
+def make_user(client):
+    """Sign in a new user; returns (id, email, headers) with 500 credits"""
+    def make():
+        email = f'{uuid.uuid4().hex[:12]}@example.com'
+        body = client.post('/api/auth/google', json={'email': email, 'name': 'Test'}).get_json()
+        return SimpleNamespace(
+            id=body['user']['id'], email=email, headers={'Authorization': f"Bearer {body['token']}"}
+        )
+    return make
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def provider():
+    """The process's fake provider; monkeypatch its methods to simulate failures"""
+    from services.llm import get_provider
+
+    return get_provider()
+
+
+@pytest.fixture
+def balance(client):
+    """balance(user): the user's credits, as the API reports them"""
+    def read(user):
+        return client.get('/api/user/credits', headers=user.headers).get_json()['credits']
+    return read
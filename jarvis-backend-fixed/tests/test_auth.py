@@ -0,0 +1,63 @@
+import time
+
+import jwt
+
+from extensions import db
+from models.user import User
+from services import auth
+from wsgi import application
+
+
+def profile_name(client, user):
+    return client.get('/api/user/profile', headers=user.headers).get_json()['user']['name']
+
+
+def rename_elsewhere(user_id, name):
+    # A direct UPDATE, like another worker's: no ORM event fires here. Not
+    # in the `app` fixture, whose session and g the requests would share
+    with application.app_context():
+        db.session.execute(User.__table__.update().where(User.__table__.c.id == user_id).values(name=name))
+        db.session.commit()
+
+
+def test_verified_token_is_cached(client, user, monkeypatch):
+    assert client.get('/api/user/profile', headers=user.headers).status_code == 200
+    calls = []
+    decode = jwt.decode
+    monkeypatch.setattr(auth.jwt, 'decode', lambda *args, **kwargs: calls.append(args) or decode(*args, **kwargs))
+    assert client.get('/api/user/profile', headers=user.headers).status_code == 200
+    assert calls == []
+
+
+def test_expired_token_is_not_served_from_cache(client, user):
+    token = jwt.encode({'user_id': user.id, 'exp': time.time() + 1}, auth.get_jwt_secret(), algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/user/profile', headers=headers).status_code == 200
+    time.sleep(1.1)
+    assert client.get('/api/user/profile', headers=headers).status_code == 401
+
+
+def test_invalid_token_is_rejected(client):
+    headers = {'Authorization': 'Bearer not-a-token'}
+    assert client.get('/api/user/profile', headers=headers).status_code == 401
+
+
+def test_cached_user_is_invalidated_by_an_orm_write(client, user):
+    assert profile_name(client, user) == 'Test'
+    rename_elsewhere(user.id, 'Raw')
+    # Served from the user cache, which has not seen the raw UPDATE
+    assert profile_name(client, user) == 'Test'
+
+    with application.app_context():
+        db.session.get(User, user.id).name = 'Renamed'
+        db.session.commit()
+    assert profile_name(client, user) == 'Renamed'
+
+
+def test_rolled_back_write_is_not_cached(client, user):
+    assert profile_name(client, user) == 'Test'
+    with application.app_context():
+        db.session.get(User, user.id).name = 'Never committed'
+        db.session.flush()
+        db.session.rollback()
+    assert profile_name(client, user) == 'Test'
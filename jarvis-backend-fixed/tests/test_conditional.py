@@ -0,0 +1,69 @@
+from extensions import db
+from models.user import User
+from wsgi import application
+
+users = User.__table__
+
+
+def conditional_get(client, user, path, etag):
+    return client.get(path, headers={**user.headers, 'If-None-Match': etag})
+
+
+def charge_elsewhere(user_id, amount):
+    """A charge committed by another worker: this process's user cache is not
+    told. Returns the committed balance."""
+    with application.app_context():
+        credits = db.session.execute(
+            users.update().where(users.c.id == user_id)
+            .values(credits=users.c.credits - amount, credits_version=users.c.credits_version + 1)
+            .returning(users.c.credits)
+        ).scalar_one()
+        db.session.commit()
+    return credits
+
+
+def test_unchanged_poll_is_a_304_without_body(client, user):
+    first = client.get('/api/user/credits', headers=user.headers)
+    assert first.status_code == 200 and first.headers['ETag'].startswith('W/')
+
+    again = conditional_get(client, user, '/api/user/credits', first.headers['ETag'])
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+
+def test_charge_changes_the_credits_etag(client, user):
+    etag = client.get('/api/user/credits', headers=user.headers).headers['ETag']
+    client.post('/api/ai/smart-compose', json={'prompt': 'etag after charge'}, headers=user.headers)
+
+    response = conditional_get(client, user, '/api/user/credits', etag)
+    assert response.status_code == 200
+    assert response.get_json()['credits'] == 497
+
+
+def test_credits_and_profile_see_charges_from_other_workers(client, user):
+    for path in ('/api/user/credits', '/api/user/profile'):
+        etag = client.get(path, headers=user.headers).headers['ETag']
+        committed = charge_elsewhere(user.id, 7)
+
+        response = conditional_get(client, user, path, etag)
+        assert response.status_code == 200
+        body = response.get_json()
+        credits = body['credits'] if 'credits' in body else body['user']['credits']
+        assert credits == committed
+
+
+def test_new_message_changes_the_conversation_etags(client, user):
+    chat = client.post('/api/ai/chat', json={'message': 'eerste bericht'}, headers=user.headers).get_json()
+    paths = ['/api/conversations', f"/api/conversations/{chat['conversation_id']}/messages"]
+    etags = [client.get(path, headers=user.headers).headers['ETag'] for path in paths]
+    assert [conditional_get(client, user, path, etag).status_code for path, etag in zip(paths, etags)] == [304, 304]
+
+    client.post('/api/ai/chat', json={'message': 'tweede', 'conversation_id': chat['conversation_id']},
+                headers=user.headers)
+    assert [conditional_get(client, user, path, etag).status_code for path, etag in zip(paths, etags)] == [200, 200]
+
+
+def test_etags_are_per_user(client, make_user):
+    first, second = make_user(), make_user()
+    etag = client.get('/api/conversations', headers=first.headers).headers['ETag']
+    assert conditional_get(client, second, '/api/conversations', etag).status_code == 200
@@ -0,0 +1,65 @@
+import threading
+
+from extensions import db
+from models.user import User
+from services.credits import charge_credits, get_usage, read_credits, refund_credits
+
+
+def set_credits(user_id, credits):
+    db.session.execute(User.__table__.update().where(User.__table__.c.id == user_id).values(credits=credits))
+    db.session.commit()
+
+
+def test_charge_returns_remaining_balance(app, user):
+    assert charge_credits(user.id, 3, 'chat') == 497
+    db.session.commit()
+    assert read_credits(user.id).credits == 497
+    assert get_usage(user.id)['usage_today'] == 3
+
+
+def test_charge_is_refused_without_enough_credits(app, user):
+    set_credits(user.id, 2)
+    assert charge_credits(user.id, 3, 'chat') is None
+    db.session.commit()
+    assert read_credits(user.id).credits == 2
+    assert get_usage(user.id)['usage_today'] == 0
+
+
+def test_refund_restores_balance_and_nets_usage(app, user):
+    charge_credits(user.id, 5, 'analyze_workspace')
+    refund_credits(user.id, 5, 'analyze_workspace')
+    db.session.commit()
+    assert read_credits(user.id).credits == 500
+    assert get_usage(user.id) == {'usage_today': 0, 'usage_this_month': 0}
+
+
+def test_rolled_back_charge_leaves_no_usage(app, user):
+    charge_credits(user.id, 4, 'chat')
+    db.session.rollback()
+    db.session.commit()
+    assert read_credits(user.id).credits == 500
+    assert get_usage(user.id)['usage_today'] == 0
+
+
+def test_concurrent_charges_never_go_below_zero(app, user):
+    set_credits(user.id, 50)
+    results = []
+    start = threading.Barrier(20)
+
+    def charge():
+        with app.app_context():
+            start.wait()
+            remaining = charge_credits(user.id, 10, 'chat')
+            db.session.commit()
+            results.append(remaining)
+
+    threads = [threading.Thread(target=charge) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    granted = sorted(remaining for remaining in results if remaining is not None)
+    assert granted == [0, 10, 20, 30, 40]
+    assert read_credits(user.id).credits == 0
+    assert get_usage(user.id)['usage_today'] == 50
@@ -0,0 +1,51 @@
+from extensions import db
+from models.conversation import Conversation
+from models.message import Message
+from services.fulltext import search_message_history
+
+
+def add_message(user_id, content):
+    conversation = Conversation(user_id=user_id, title='Zoeken')
+    db.session.add(conversation)
+    db.session.flush()
+    message = Message(conversation_id=conversation.id, content=content, sender='user', credits_used=0)
+    db.session.add(message)
+    db.session.commit()
+    return message
+
+
+def found(user_id, query):
+    results, _ = search_message_history(user_id, query)
+    return [result['message_id'] for result in results]
+
+
+def test_insert_trigger_indexes_new_messages(app, user):
+    message = add_message(user.id, "De kwartaalcijfers van Stark Industries zijn binnen")
+    assert found(user.id, 'kwartaalcijfers') == [message.id]
+    assert found(user.id, 'kwartaal*') == [message.id]
+
+
+def test_update_and_delete_triggers_keep_the_index_current(app, user):
+    message = add_message(user.id, "Vergadering over de reactor")
+    message.content = "Vergadering over het pak"
+    db.session.commit()
+    assert found(user.id, 'reactor') == []
+    assert found(user.id, 'pak') == [message.id]
+
+    db.session.delete(message)
+    db.session.commit()
+    assert found(user.id, 'pak') == []
+
+
+def test_search_is_scoped_to_the_user(app, make_user):
+    owner, other = make_user(), make_user()
+    message = add_message(owner.id, "Geheime plannen voor het weekend")
+    assert found(owner.id, 'geheime') == [message.id]
+    assert found(other.id, 'geheime') == []
+
+
+def test_highlight_is_escaped(client, user, app):
+    add_message(user.id, "Gebruik <script>alert(1)</script> nooit in een zoekopdracht")
+    results = client.get('/api/conversations/search?q=zoekopdracht', headers=user.headers).get_json()['results']
+    assert '<mark>zoekopdracht</mark>' in results[0]['highlight']
+    assert '<script>' not in results[0]['highlight']
@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+
+def chat(client, user, message, conversation_id=None):
+    body = {'message': message, 'conversation_id': conversation_id}
+    return client.post('/api/ai/chat', json=body, headers=user.headers).get_json()['conversation_id']
+
+
+def history(client, user):
+    conversations = client.get('/api/conversations?limit=100', headers=user.headers).get_json()['conversations']
+    return sorted(
+        (conversation['title'], tuple(
+            (message['sender'], message['content'])
+            for message in client.get(f"/api/conversations/{conversation['id']}/messages?limit=100",
+                                      headers=user.headers).get_json()['messages']
+        ))
+        for conversation in conversations
+    )
+
+
+@pytest.fixture
+def exported(client, make_user):
+    source = make_user()
+    first = chat(client, source, 'Wat staat er morgen op de agenda?')
+    chat(client, source, 'En overmorgen?', first)
+    chat(client, source, 'Schrijf een mail aan het team')
+    return source, client.get('/api/conversations/export?format=gzip', headers=source.headers).get_data()
+
+
+def test_export_import_round_trip(client, make_user, exported):
+    source, body = exported
+    target = make_user()
+    response = client.post('/api/conversations/import', data=body, headers=target.headers)
+    assert response.status_code == 200
+    assert response.get_json()['imported'] == {'conversations': 2, 'messages': 6, 'skipped': 0}
+    assert history(client, target) == history(client, source)
+
+
+def test_malformed_line_rejects_the_whole_upload(client, user):
+    body = b'{"type":"conversation","id":"c1","title":"t"}\n{"type":"message","conversation_id":"c2"}\n'
+    response = client.post('/api/conversations/import', data=body, headers=user.headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Line 2')
+    assert history(client, user) == []
+
+
+@pytest.mark.parametrize('limit', ['IMPORT_MAX_ROWS', 'IMPORT_MAX_BYTES'])
+def test_oversized_import_is_refused_whole(client, make_user, exported, monkeypatch, limit):
+    import routes.user
+
+    _, body = exported
+    monkeypatch.setattr(routes.user, limit, 5 if limit == 'IMPORT_MAX_ROWS' else len(body) - 1)
+    target = make_user()
+    response = client.post('/api/conversations/import', data=body, headers=target.headers)
+    assert response.status_code == 413
+    assert 'flask history import' in response.get_json()['error']
+    assert history(client, target) == []
+
+
+def test_chunked_upload_stops_at_the_byte_limit(client, user, monkeypatch):
+    import routes.user
+
+    class Body:
+        """A server input stream that only has read(), like gunicorn's"""
+
+        def __init__(self, data):
+            self.read = io.BytesIO(data).read
+
+    monkeypatch.setattr(routes.user, 'IMPORT_MAX_BYTES', 1000)
+    lines = b''.join(
+        b'{"type":"conversation","id":"c%d","title":"t"}\n' % n for n in range(200)
+    )
+    # Chunked: no Content-Length, the server marks where the body ends
+    response = client.post('/api/conversations/import', headers=user.headers, environ_overrides={
+        'wsgi.input': Body(lines), 'wsgi.input_terminated': True, 'CONTENT_LENGTH': ''
+    })
+    assert response.status_code == 413
+    assert history(client, user) == []
@@ -0,0 +1,96 @@
+import json
+import random
+
+import pytest
+
+from services.intents import IntentRouter, load_intents
+from services.jarvis import get_jarvis_response
+
+
+def legacy_response(message, user_name="meneer", rng=random):
+    """get_jarvis_response before the router: nested substring scans"""
+    name_triggers = ["noem me", "call me", "ik ben", "mijn naam is"]
+    special_names = ["dokter", "doctor", "mevrouw", "hendrik van aalsmeer tot zwolle"]
+    message_lower = message.lower()
+    for trigger in name_triggers:
+        if trigger in message_lower:
+            for name in special_names:
+                if name in message_lower:
+                    return f"Meneer, ik zal u {name} gebruiken, meneer."
+    responses = [
+        f"Natuurlijk {user_name}, ik voer dit direct uit ondanks mijn twijfels over de methode.",
+        f"Zeer wel {user_name}, hoewel ik me afvraag of dit de meest efficiënte aanpak is.",
+        f"Zoals u wenst {user_name}. Ik heb mijn bedenkingen, maar uw wil is wet.",
+        f"Uiteraard {user_name}. Ik zal dit uitvoeren, ondanks mijn reserveringen over de uitkomst.",
+        f"Zeker {user_name}, hoewel een meer systematische benadering wellicht beter zou zijn.",
+        f"Direct {user_name}. Ik betwijfel de logica, maar voer uw instructies trouw uit.",
+        f"Onmiddellijk {user_name}, ook al zou ik een alternatieve strategie aanbevelen.",
+        f"Jawel {user_name}, ik zal dit regelen ondanks mijn twijfels over de timing."
+    ]
+    if "email" in message_lower or "mail" in message_lower:
+        return f"Natuurlijk {user_name}, ik zal uw e-mails beheren. Hoewel uw inbox organisatie... interessant is."
+    if "agenda" in message_lower or "calendar" in message_lower or "afspraak" in message_lower:
+        return f"Zeker {user_name}, ik regel uw agenda. Uw tijdmanagement behoeft wel enige... optimalisatie."
+    if "document" in message_lower or "bestand" in message_lower:
+        return f"Uiteraard {user_name}, ik help met uw documenten. Uw bestandsstructuur is... creatief."
+    if "help" in message_lower or "hulp" in message_lower:
+        return f"Altijd tot uw dienst {user_name}. Wat kan ik voor u doen, ondanks mijn twijfels over uw prioriteiten?"
+    return rng.choice(responses)
+
+
+# Keywords, fragments of them and words that contain them, so overlapping
+# and partial matches are exercised
+PIECES = [
+    "noem me", "Call Me", "ik ben", "mijn naam is", "dokter", "DOCTOR", "mevrouw",
+    "hendrik van aalsmeer tot zwolle", "hendrik van", "e-mail", "email", "mailbox", "gmail",
+    "agenda", "calendar", "afspraakje", "document", "bestanden", "help", "helper", "hulpje",
+    "noem", "ik", "doc", "agend", "morgen", "graag", "het", "rapport", "!", "?"
+]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_router_matches_the_legacy_scans(seed):
+    rng = random.Random(seed)
+    for n in range(2000):
+        message = rng.choice(['', ' ']).join(rng.choice(PIECES) for _ in range(rng.randint(0, 8)))
+        assert get_jarvis_response(message, 'Tony', random.Random(n)) == \
+            legacy_response(message, 'Tony', random.Random(n)), message
+
+
+@pytest.mark.parametrize('message, expected', [
+    ("Noem me Dokter alsjeblieft", "Meneer, ik zal u dokter gebruiken, meneer."),
+    # A name request without a special name falls through to the next intent
+    ("Ik ben op zoek naar mijn mail", "Natuurlijk meneer, ik zal uw e-mails beheren."),
+    # Earlier intents win: email is checked before agenda
+    ("Zet de mail in mijn agenda", "Natuurlijk meneer, ik zal uw e-mails beheren."),
+])
+def test_intent_priority(message, expected):
+    assert get_jarvis_response(message).startswith(expected)
+
+
+def test_overlapping_keywords_are_all_found():
+    router = IntentRouter([
+        {"triggers": ["helpdesk"], "requires": ["desk"], "response": "a"},
+        {"triggers": ["help"], "response": "b"},
+    ])
+    assert router.keywords_in("HELPDESK") == {"helpdesk", "help", "desk"}
+    assert router.classify("helpdesk")[0]['response'] == 'a'
+    assert router.classify("helpen")[0]['response'] == 'b'
+    assert router.classify("niets") == (None, None)
+
+
+def test_load_intents_lowercases_keywords(tmp_path):
+    path = tmp_path / 'intents.json'
+    path.write_text(json.dumps({
+        "intents": [{"triggers": ["Weer"], "requires": ["Morgen"], "response": "Zonnig"}],
+        "fallback": ["..."]
+    }))
+    config = load_intents(path)
+    assert IntentRouter(config['intents']).classify("Het WEER van morgen")[1] == 'morgen'
+
+
+def test_load_intents_rejects_an_intent_without_response(tmp_path):
+    path = tmp_path / 'intents.json'
+    path.write_text(json.dumps({"intents": [{"name": "x", "triggers": ["a"]}], "fallback": []}))
+    with pytest.raises(ValueError):
+        load_intents(path)
@@ -0,0 +1,142 @@
+import json
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models.job import Job
+from services import jobs
+from services.credits import read_credits
+from services.llm import ProviderError
+
+STATS = {"email_stats": {"unread": 3}, "calendar_stats": {}, "productivity": {}}
+
+
+@pytest.fixture
+def runner(app):
+    """A runner that is never started: tests drive claim / finish / reclaim"""
+    return jobs.JobRunner(app, threads=1, processes=0)
+
+
+def queue(user, kind='analyze_workspace', payload=None):
+    job = jobs.enqueue(user.id, kind, payload or {'stats': STATS})
+    db.session.commit()
+    return job.id
+
+
+def finish(runner, job_id, result=None, error=None):
+    claimed = db.session.get(Job, job_id)
+    future = Future()
+    if error is None:
+        future.set_result(result)
+    else:
+        future.set_exception(error)
+    runner._finish(job_id, jobs.KINDS[claimed.kind], json.loads(claimed.payload), future)
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+
+def test_enqueue_reserves_the_credits(app, user):
+    job_id = queue(user)
+    assert read_credits(user.id).credits == 495
+    assert db.session.get(Job, job_id).credits_reserved == 5
+
+
+def test_enqueue_is_refused_without_credits(app, user):
+    db.session.execute(db.text("UPDATE users SET credits = 4 WHERE id = :id"), {'id': user.id})
+    db.session.commit()
+    assert jobs.enqueue(user.id, 'analyze_workspace', {'stats': STATS}) is None
+
+
+def test_a_job_is_claimed_exactly_once(app, user, runner):
+    job_id = queue(user)
+    other = jobs.JobRunner(app, threads=1, processes=0)
+    other.worker_id = 'other-host:1'
+
+    assert runner._claim(job_id) is not None
+    assert other._claim(job_id) is None
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.worker, job.attempts) == ('running', runner.worker_id, 1)
+
+
+def test_success_keeps_the_credits(app, user, runner):
+    job_id = queue(user)
+    runner._claim(job_id)
+    job = finish(runner, job_id, result={'analysis': STATS})
+    assert (job.status, job.credits_settled) == ('succeeded', 5)
+    assert read_credits(user.id).credits == 495
+
+
+@pytest.mark.parametrize('error', [ProviderError("down"), KeyError('candidates')])
+def test_failure_refunds_the_credits(app, user, runner, error):
+    job_id = queue(user)
+    runner._claim(job_id)
+    job = finish(runner, job_id, error=error)
+    assert (job.status, job.credits_settled) == ('failed', 0)
+    assert read_credits(user.id).credits == 500
+
+
+def test_only_the_owning_runner_settles(app, user, runner):
+    job_id = queue(user)
+    runner._claim(job_id)
+    stranger = jobs.JobRunner(app, threads=1, processes=0)
+    stranger.worker_id = 'other-host:2'
+    assert finish(stranger, job_id, error=ProviderError("down")).status == 'running'
+    assert read_credits(user.id).credits == 495
+
+
+def test_cancel_refunds_a_queued_job_only(app, client, user, runner):
+    queued_id = queue(user)
+    assert client.delete(f'/api/jobs/{queued_id}', headers=user.headers).get_json()['job']['status'] == 'cancelled'
+    assert read_credits(user.id).credits == 500
+
+    running_id = queue(user)
+    runner._claim(running_id)
+    assert client.delete(f'/api/jobs/{running_id}', headers=user.headers).status_code == 409
+    assert read_credits(user.id).credits == 495
+
+
+def age_heartbeat(job_id):
+    db.session.execute(
+        Job.__table__.update().where(Job.__table__.c.id == job_id)
+        .values(heartbeat_at=datetime.utcnow() - timedelta(seconds=jobs.STALE_AFTER + 1))
+    )
+    db.session.commit()
+
+
+def test_stale_job_is_requeued_then_failed_and_refunded(app, user, runner):
+    job_id = queue(user)
+    for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+        assert runner._claim(job_id) is not None
+        age_heartbeat(job_id)
+        runner._reclaim_stale()
+        db.session.expire_all()
+        job = db.session.get(Job, job_id)
+        if attempt < jobs.MAX_ATTEMPTS:
+            assert (job.status, job.worker) == ('queued', None)
+            assert read_credits(user.id).credits == 495
+
+    assert (job.status, job.error, job.credits_settled) == ('failed', "Worker lost", 0)
+    assert read_credits(user.id).credits == 500
+
+
+def test_live_heartbeat_is_not_reclaimed(app, user, runner):
+    job_id = queue(user)
+    runner._claim(job_id)
+    runner._reclaim_stale()
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == 'running'
+
+
+def test_async_request_returns_a_pollable_job(client, user):
+    response = client.post('/api/ai/summarize', json={'text': 'Een zin om samen te vatten. ' * 10},
+                           headers={**user.headers, 'Prefer': 'respond-async'})
+    assert response.status_code == 202
+    job = response.get_json()['job']
+    assert response.headers['Location'] == f"/api/jobs/{job['id']}"
+
+    polled = client.get(response.headers['Location'], headers=user.headers)
+    assert polled.get_json()['job']['status'] == 'queued'
+    again = client.get(response.headers['Location'], headers={**user.headers, 'If-None-Match': polled.headers['ETag']})
+    assert again.status_code == 304
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+import requests
+
+from services.llm import GeminiProvider, ProviderError
+
+
+def reply(body):
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body)
+    return response
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    provider = GeminiProvider('test-key', max_retries=0)
+    bodies = []
+
+    def post(path, body, stream=False):
+        provider._slots.acquire()
+        if not stream:
+            provider._slots.release()
+        return reply(bodies.pop(0))
+    monkeypatch.setattr(provider, '_post', post)
+    provider.bodies = bodies
+    return provider
+
+
+def test_generate_reads_candidate_text(gemini):
+    gemini.bodies.append(b'{"candidates": [{"content": {"parts": [{"text": "Goedemorgen"}]}}]}')
+    assert gemini.generate('hallo') == 'Goedemorgen'
+
+
+@pytest.mark.parametrize('body', [b'<html>Bad Gateway</html>', b''])
+def test_generate_rejects_a_non_json_reply(gemini, body):
+    gemini.bodies.append(body)
+    with pytest.raises(ProviderError):
+        gemini.generate('hallo')
+
+
+def test_stream_rejects_a_non_json_event(gemini):
+    gemini.bodies.append(b'data: {"candidates": [{"content": {"parts": [{"text": "Goed"}]}}]}\n\ndata: {oops\n\n')
+    tokens = gemini.stream('hallo')
+    assert next(tokens) == 'Goed'
+    with pytest.raises(ProviderError):
+        next(tokens)
+    # The slot is released even though the stream failed
+    assert gemini._slots.acquire(blocking=False)
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import text
+
+import src.main
+
+OPERATOR_PATHS = ['/metrics', '/api/diagnostics']
+
+
+@pytest.mark.parametrize('path', OPERATOR_PATHS)
+def test_operator_endpoints_are_open_without_a_token(client, path):
+    assert client.get(path).status_code == 200
+
+
+@pytest.mark.parametrize('path', OPERATOR_PATHS)
+def test_operator_endpoints_require_the_token_when_set(client, monkeypatch, path):
+    monkeypatch.setenv('METRICS_TOKEN', 's3cret')
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get(path, headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_metrics_count_requests_per_endpoint(client):
+    client.get('/api/health')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE jarvis_http_request_duration_seconds histogram' in body
+    assert 'jarvis_http_request_duration_seconds_count{endpoint="health_check"}' in body
+
+
+def test_health_reports_liveness_only(client):
+    response = client.get('/api/health')
+    assert response.status_code == 200
+    assert set(response.get_json()) == {'status', 'database', 'database_latency_ms', 'ai_service', 'timestamp'}
+
+
+def test_health_is_a_503_when_the_database_is_down(client, monkeypatch):
+    monkeypatch.setattr(src.main, 'text', lambda _: text('SELECT * FROM no_such_table'))
+    response = client.get('/api/health')
+    assert response.status_code == 503
+    assert response.get_json()['database'] == 'unavailable'
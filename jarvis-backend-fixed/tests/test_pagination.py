@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models.conversation import Conversation
+from models.message import Message
+from services.pagination import PaginationError, decode_cursor, encode_cursor
+
+
+def seed_messages(user_id, count, same_timestamp=False):
+    conversation = Conversation(user_id=user_id, title='Paging')
+    db.session.add(conversation)
+    db.session.flush()
+    started = datetime(2024, 1, 1, 9, 0)
+    db.session.add_all(
+        Message(
+            conversation_id=conversation.id, content=f'bericht {n:03d}', sender='user', credits_used=0,
+            timestamp=started if same_timestamp else started + timedelta(seconds=n)
+        )
+        for n in range(count)
+    )
+    db.session.commit()
+    return conversation.id
+
+
+@pytest.mark.parametrize('sort_value', [datetime(2024, 5, 17, 13, 45, 12, 123456), datetime(2024, 1, 1)])
+def test_cursor_round_trip(sort_value):
+    assert decode_cursor(encode_cursor(sort_value, 'abc|def')) == (sort_value, 'abc|def')
+
+
+@pytest.mark.parametrize('cursor', ['zzz', 'bm90LWEtY3Vyc29y', '!!!'])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(PaginationError):
+        decode_cursor(cursor)
+
+
+def test_malformed_cursor_is_a_400(client, user):
+    response = client.get('/api/conversations?before=zzz', headers=user.headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('same_timestamp', [False, True])
+def test_paging_backwards_visits_every_message_once(app, client, user, same_timestamp):
+    conversation_id = seed_messages(user.id, 23, same_timestamp)
+    url = f'/api/conversations/{conversation_id}/messages?limit=5'
+
+    seen, cursor = [], None
+    while True:
+        page = client.get(url + (f'&before={cursor}' if cursor else ''), headers=user.headers).get_json()
+        seen = [message['id'] for message in page['messages']] + seen
+        if not page['has_more']:
+            break
+        cursor = page['cursors']['before']
+
+    assert page['total'] == 23
+    assert len(seen) == len(set(seen)) == 23
+    if not same_timestamp:
+        contents = {row.id: row.content for row in Message.query.filter_by(conversation_id=conversation_id)}
+        assert [contents[message_id] for message_id in seen] == [f'bericht {n:03d}' for n in range(23)]
+
+
+def test_after_cursor_continues_where_before_left_off(app, client, user):
+    conversation_id = seed_messages(user.id, 12)
+    url = f'/api/conversations/{conversation_id}/messages'
+
+    oldest = client.get(f'{url}?limit=200', headers=user.headers).get_json()['messages']
+    newest = client.get(f'{url}?limit=4', headers=user.headers).get_json()
+    older = client.get(f"{url}?limit=4&before={newest['cursors']['before']}", headers=user.headers).get_json()
+    forward = client.get(f"{url}?limit=4&after={older['cursors']['after']}", headers=user.headers).get_json()
+
+    assert [m['id'] for m in older['messages']] == [m['id'] for m in oldest[4:8]]
+    assert [m['id'] for m in forward['messages']] == [m['id'] for m in newest['messages']]
+    assert forward['has_more'] is False
+
+
+def test_conversation_pages_are_newest_first_and_disjoint(app, client, user):
+    for n in range(7):
+        db.session.add(Conversation(user_id=user.id, title=f'Gesprek {n}',
+                                    updated_at=datetime(2024, 2, 1) + timedelta(minutes=n)))
+    db.session.commit()
+
+    first = client.get('/api/conversations?limit=4', headers=user.headers).get_json()
+    second = client.get(f"/api/conversations?limit=4&before={first['cursors']['before']}",
+                        headers=user.headers).get_json()
+    titles = [c['title'] for c in first['conversations'] + second['conversations']]
+    assert titles == [f'Gesprek {n}' for n in range(6, -1, -1)]
+    assert first['has_more'] is True and second['has_more'] is False
@@ -0,0 +1,77 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from services import rate_limit
+from services.rate_limit import MemoryBuckets, RateLimiter, SQLiteBuckets, client_ip
+
+# One token per second, a burst of 4
+LIMITS = [('user:a', 1.0, 4.0)]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets(request, tmp_path):
+    if request.param == 'memory':
+        return lambda: MemoryBuckets()
+    path = str(tmp_path / 'buckets.db')
+    return lambda: SQLiteBuckets(path)
+
+
+def test_bucket_refuses_past_the_burst_with_the_wait(buckets):
+    store = buckets()
+    assert store.take(LIMITS, 2) == 0
+    assert store.take(LIMITS, 2) == 0
+    assert store.take(LIMITS, 2) == pytest.approx(2.0, abs=0.1)
+
+
+def test_refused_request_spends_from_no_bucket(buckets):
+    store = buckets()
+    limits = LIMITS + [('ip:1.2.3.4', 1.0, 40.0)]
+    store.take([('user:a', 1.0, 4.0)], 4)
+    assert store.take(limits, 2) > 0
+    # The IP bucket is still full: 40 tokens can be spent at once
+    assert store.take([('ip:1.2.3.4', 1.0, 40.0)], 40) == 0
+
+
+def test_sqlite_buckets_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'buckets.db')
+    SQLiteBuckets(path).take(LIMITS, 4)
+    assert SQLiteBuckets(path).take(LIMITS, 1) > 0
+
+
+def test_broken_store_lets_requests_through():
+    class Broken:
+        name = 'broken'
+
+        def take(self, limits, cost):
+            raise sqlite3.OperationalError('database is locked')
+
+    limiter = RateLimiter(Broken())
+    assert limiter.check('a', '1.2.3.4', 'chat') == 0
+    assert limiter.errors == 1
+
+
+@pytest.mark.parametrize('trusted, forwarded, expected', [
+    (1, '9.9.9.9, 10.0.0.2', '10.0.0.2'),
+    (2, '9.9.9.9, 10.0.0.2', '9.9.9.9'),
+    (1, '', '10.0.0.1'),
+    (0, '9.9.9.9', '10.0.0.1'),
+])
+def test_client_ip_trusts_the_configured_hops(monkeypatch, trusted, forwarded, expected):
+    monkeypatch.setattr(rate_limit, 'TRUSTED_PROXIES', trusted)
+    request = SimpleNamespace(headers={'X-Forwarded-For': forwarded}, remote_addr='10.0.0.1')
+    assert client_ip(request) == expected
+
+
+def test_limited_request_is_refused_before_charging(client, user, balance, monkeypatch):
+    # 60 tokens a minute is one a second; chat costs 2
+    monkeypatch.setattr(rate_limit, 'limiter', RateLimiter(MemoryBuckets(), user_limit=(60, 4)))
+    for _ in range(2):
+        assert client.post('/api/ai/chat', json={'message': 'hallo'}, headers=user.headers).status_code == 200
+
+    response = client.post('/api/ai/chat', json={'message': 'hallo'}, headers=user.headers)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    assert response.get_json()['retry_after'] == 2
+    assert balance(user) == 496
@@ -0,0 +1,108 @@
+import pytest
+
+from extensions import db
+from models.user import User
+from services.llm import ProviderError
+from wsgi import application
+
+
+def test_failed_model_call_is_refunded(client, user, provider, balance, monkeypatch):
+    def fail(*args):
+        raise ProviderError("backend down")
+    monkeypatch.setattr(provider, 'compose', fail)
+
+    response = client.post('/api/ai/smart-compose', json={'prompt': 'provider error'}, headers=user.headers)
+    assert response.status_code == 503
+    assert balance(user) == 500
+
+
+def test_unexpected_error_in_model_call_is_refunded(client, user, provider, balance, monkeypatch):
+    def fail(*args):
+        raise KeyError('candidates')
+    monkeypatch.setattr(provider, 'compose', fail)
+
+    response = client.post('/api/ai/smart-compose', json={'prompt': 'parse error'}, headers=user.headers)
+    assert response.status_code == 500
+    assert balance(user) == 500
+
+
+def test_failed_summary_is_refunded(client, user, provider, balance, monkeypatch):
+    def fail(text):
+        raise ProviderError("backend down")
+    monkeypatch.setattr(provider, 'summarize', fail)
+
+    response = client.post('/api/ai/summarize', json={'text': 'Een lange tekst. ' * 20}, headers=user.headers)
+    assert response.status_code == 503
+    assert balance(user) == 500
+
+
+def test_unsaved_chat_turn_is_refunded(client, user, balance, monkeypatch):
+    import routes.ai
+
+    def fail(*args, **kwargs):
+        raise TimeoutError()
+    monkeypatch.setattr(routes.ai, 'save_messages', fail)
+
+    response = client.post('/api/ai/chat', json={'message': 'hallo'}, headers=user.headers)
+    assert response.status_code == 500
+    assert response.get_json()['saved'] is False
+    assert balance(user) == 500
+
+
+def test_chat_stream_disconnect_is_refunded(client, user, balance):
+    response = client.post('/api/ai/chat/stream', json={'message': 'hallo'}, headers=user.headers, buffered=False)
+    frames = b''
+    for frame in response.response:
+        frames += frame if isinstance(frame, bytes) else frame.encode()
+        if b'event: start' in frames:
+            break
+    response.close()
+    assert balance(user) == 500
+
+
+
+@pytest.mark.parametrize('failing', ['fold', 'save'])
+def test_failed_fold_after_done_is_not_reported(client, user, balance, monkeypatch, failing):
+    import routes.ai
+    from services.context import ConversationContext
+
+    def fail(*args, **kwargs):
+        raise RuntimeError()
+    if failing == 'fold':
+        monkeypatch.setattr(ConversationContext, 'fold', fail)
+    else:
+        monkeypatch.setattr(ConversationContext, 'fold', lambda self, provider: True)
+        calls = []
+        save = routes.ai.save_messages
+
+        def save_once(*args, **kwargs):
+            calls.append(args)
+            if len(calls) > 1:
+                fail()
+            return save(*args, **kwargs)
+        monkeypatch.setattr(routes.ai, 'save_messages', save_once)
+
+    response = client.post('/api/ai/chat/stream', json={'message': 'hallo'}, headers=user.headers)
+    frames = response.get_data(as_text=True)
+    assert 'event: done' in frames
+    assert 'event: error' not in frames
+    assert balance(user) == 498
+
+
+def test_free_cache_hit_reports_committed_balance(client, user, monkeypatch):
+    from services import response_cache
+
+    monkeypatch.setattr(response_cache, 'CHARGE_HITS', False)
+    body = {'prompt': 'cache hit balance'}
+    assert client.post('/api/ai/smart-compose', json=body, headers=user.headers).get_json()['remaining_credits'] == 497
+
+    # Caches the user row, then a charge by another worker that it misses
+    client.get('/api/user/profile', headers=user.headers)
+    with application.app_context():
+        db.session.execute(
+            User.__table__.update().where(User.__table__.c.id == user.id).values(credits=User.__table__.c.credits - 100)
+        )
+        db.session.commit()
+    hit = client.post('/api/ai/smart-compose', json=body, headers=user.headers).get_json()
+    assert hit['cached'] is True
+    assert hit['remaining_credits'] == 397
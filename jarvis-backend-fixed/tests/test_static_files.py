@@ -0,0 +1,81 @@
+import gzip
+import os
+
+import pytest
+
+import src.main
+from services import static_files
+from services.static_files import IMMUTABLE, REVALIDATE, StaticManifest, serves_app_shell
+
+BUNDLE = b'console.log("jarvis");\n' * 200
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'index.html').write_bytes(b'<!doctype html><div id="root"></div>')
+    (tmp_path / 'assets' / 'index-C_Hhj1O6.js').write_bytes(BUNDLE)
+    (tmp_path / 'assets' / 'logo.svg').write_bytes(b'<svg/>')
+    manifest = StaticManifest(str(tmp_path))
+    monkeypatch.setattr(src.main, 'static_files', manifest)
+    return tmp_path
+
+
+def test_manifest_reads_every_file_once(site):
+    manifest = src.main.static_files
+    assert sorted(manifest.files) == ['assets/index-C_Hhj1O6.js', 'assets/logo.svg', 'index.html']
+    # Later changes on disk are not seen: requests never touch the filesystem
+    (site / 'index.html').write_bytes(b'changed')
+    assert manifest.get('index.html').variants[None].startswith(b'<!doctype')
+
+
+def test_hashed_bundles_are_immutable_and_the_rest_revalidates(client, site):
+    assert client.get('/assets/index-C_Hhj1O6.js').headers['Cache-Control'] == IMMUTABLE
+    assert client.get('/assets/logo.svg').headers['Cache-Control'] == REVALIDATE
+    assert client.get('/').headers['Cache-Control'] == REVALIDATE
+
+
+def test_matching_etag_is_a_304(client, site):
+    etag = client.get('/').headers['ETag']
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+def test_gzip_variant_has_its_own_etag(client, site):
+    plain = client.get('/assets/index-C_Hhj1O6.js')
+    zipped = client.get('/assets/index-C_Hhj1O6.js', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert zipped.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(zipped.get_data()) == plain.get_data() == BUNDLE
+    assert zipped.headers['ETag'] != plain.headers['ETag']
+
+
+def test_stale_precompressed_sibling_is_ignored(tmp_path):
+    bundle = tmp_path / 'assets' / 'index-C_Hhj1O6.js'
+    bundle.parent.mkdir()
+    bundle.write_bytes(BUNDLE)
+    (tmp_path / 'assets' / 'index-C_Hhj1O6.js.br').write_bytes(b'old build')
+    os.utime(tmp_path / 'assets' / 'index-C_Hhj1O6.js.br', (0, 0))
+    assert 'br' not in StaticManifest(str(tmp_path)).get('assets/index-C_Hhj1O6.js').variants
+
+
+def test_large_files_are_streamed_from_disk(client, site, monkeypatch):
+    monkeypatch.setattr(static_files, 'INLINE_MAX_BYTES', 100)
+    monkeypatch.setattr(src.main, 'static_files', StaticManifest(str(site)))
+    assert src.main.static_files.get('assets/index-C_Hhj1O6.js').variants[None] is None
+    response = client.get('/assets/index-C_Hhj1O6.js')
+    assert response.get_data() == BUNDLE
+    assert response.headers['Cache-Control'] == IMMUTABLE
+
+
+@pytest.mark.parametrize('path, shell', [
+    ('settings/profile', True),
+    ('assets/index-old.js', False),
+    ('favicon.ico', False),
+    ('api/unknown', False),
+])
+def test_only_client_routes_get_the_app_shell(client, site, path, shell):
+    assert serves_app_shell(path) is shell
+    response = client.get(f'/{path}')
+    assert response.status_code == (200 if shell else 404)
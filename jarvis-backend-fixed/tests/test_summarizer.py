@@ -0,0 +1,68 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.summarizer import MapReduceSummarizer, chunk_text
+
+
+def paragraphs(count):
+    return [f"Alinea {n:03d} " + "woord " * 30 + "\n\n" for n in range(count)]
+
+
+def shuffled_identity(seed):
+    """A 'summary' that returns its input after a random delay, so calls
+    finish out of order and only the summarizer's bookkeeping keeps order"""
+    rng = random.Random(seed)
+
+    def summarize(text):
+        time.sleep(rng.random() / 500)
+        return text
+    return summarize
+
+
+def test_chunks_cover_the_text_in_order():
+    blocks = paragraphs(40)
+    chunks = list(chunk_text(iter(blocks), chunk_tokens=100))
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    assert ' '.join(chunks).split() == ''.join(blocks).split()
+
+
+@pytest.mark.parametrize('count, fan_in', [(1, 2), (7, 2), (40, 3), (65, 8)])
+def test_map_reduce_keeps_document_order(count, fan_in):
+    blocks = paragraphs(count)
+    pool = ThreadPoolExecutor(max_workers=8)
+    summarizer = MapReduceSummarizer(shuffled_identity(count), chunk_tokens=60, fan_in=fan_in, pool=pool)
+
+    for progress in summarizer.run(iter(blocks)):
+        pass
+
+    assert 'summary' in progress
+    assert progress['chunks_done'] == progress['chunks']
+    order = [word for word in progress['summary'].split() if word.isdigit()]
+    assert order == [f'{n:03d}' for n in range(count)]
+    pool.shutdown()
+
+
+def test_in_flight_calls_are_bounded():
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def summarize(text):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.001)
+        with lock:
+            active -= 1
+        return text[:20]
+
+    pool = ThreadPoolExecutor(max_workers=8)
+    for _ in MapReduceSummarizer(summarize, chunk_tokens=60, fan_in=4, max_pending=3, pool=pool).run(iter(paragraphs(50))):
+        pass
+    assert peak <= 3
+    pool.shutdown()
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from services import vector_index
+from services.embeddings import HashEmbedder
+from services.vector_index import FlatIndex, Indexer, create_index
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_search_returns_nearest_first_scoped_by_owner(tmp_path):
+    index = FlatIndex(str(tmp_path), dim=2)
+    index.add(['a', 'b', 'c'], ['u1', 'u1', 'u2'], np.stack([unit(1, 0), unit(1, 1), unit(1, 0.1)]))
+
+    assert [key for key, _ in index.search(unit(1, 0), 3)] == ['a', 'c', 'b']
+    hits = index.search(unit(1, 0), 3, owner='u1')
+    assert [key for key, _ in hits] == ['a', 'b']
+    assert hits[0][1] == pytest.approx(1.0)
+    assert index.search(unit(1, 0), 3, owner='nobody') == []
+
+
+def test_merging_keeps_every_row_and_bounds_segments(tmp_path):
+    index = FlatIndex(str(tmp_path), dim=2, max_segments=2)
+    for n in range(7):
+        index.add([f'k{n}'], ['u1'], np.stack([unit(1, n)]))
+
+    assert len(index._segment_names()) <= 2
+    assert len(index) == 7
+    assert sorted(key for key, _ in index.search(unit(1, 0), 10, owner='u1')) == [f'k{n}' for n in range(7)]
+
+
+def test_other_workers_see_new_segments(tmp_path):
+    reader = FlatIndex(str(tmp_path), dim=2)
+    assert reader.search(unit(1, 0), 1) == []
+    FlatIndex(str(tmp_path), dim=2).add(['a'], ['u1'], np.stack([unit(1, 0)]))
+    reader._refresh(force=True)
+    assert reader.search(unit(1, 0), 1, owner='u1')[0][0] == 'a'
+
+
+def test_create_index_defaults_to_flat(tmp_path):
+    assert isinstance(create_index(str(tmp_path)), FlatIndex)
+    assert isinstance(create_index(str(tmp_path), backend='auto'), FlatIndex)
+    with pytest.raises(RuntimeError):
+        create_index(str(tmp_path), backend='faiss')
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch):
+    indexer = Indexer(lambda: FlatIndex(str(tmp_path)), HashEmbedder(), flush_interval=0.01)
+    monkeypatch.setattr(vector_index, 'ENABLED', True)
+    monkeypatch.setattr(vector_index, 'indexer', indexer)
+    return indexer
+
+
+def test_committed_messages_are_searchable_by_their_owner(client, make_user, indexer):
+    owner, other = make_user(), make_user()
+    client.post('/api/ai/chat', json={'message': 'De kwartaalcijfers van de bakkerij'}, headers=owner.headers)
+    client.post('/api/ai/chat', json={'message': 'Boek een vlucht naar Lissabon'}, headers=owner.headers)
+    indexer.flush()
+    assert indexer.errors == 0
+
+    results = client.get('/api/ai/search?q=kwartaalcijfers', headers=owner.headers).get_json()['results']
+    assert results[0]['sender'] == 'user'
+    assert 'kwartaalcijfers' in results[0]['snippet']
+    assert client.get('/api/ai/search?q=kwartaalcijfers', headers=other.headers).get_json()['results'] == []
+
+
+def test_rolled_back_messages_are_not_indexed(app, user, indexer):
+    from extensions import db
+    from models.conversation import Conversation
+    from models.message import Message
+
+    conversation = Conversation(user_id=user.id, title='t')
+    db.session.add(conversation)
+    db.session.flush()
+    db.session.add(Message(conversation_id=conversation.id, content='nooit bewaard', sender='user'))
+    db.session.flush()
+    db.session.rollback()
+    assert indexer._queue is None
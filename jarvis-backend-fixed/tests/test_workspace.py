@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from extensions import db
+from models.job import Job
+from models.workspace import WorkspaceSnapshot
+from services import workspace
+from services.credits import read_credits
+from services.workspace_source import FakeWorkspace
+
+
+@pytest.fixture
+def source():
+    return FakeWorkspace(messages=400, events_per_day=3, history_limit=2000)
+
+
+def aggregates(user_id):
+    db.session.expire_all()
+    return db.session.get(WorkspaceSnapshot, user_id).load()
+
+
+def test_first_refresh_is_a_full_sync(app, user, source):
+    result = workspace.refresh(user.id, source=source)
+    assert result['mode'] == 'full'
+    assert aggregates(user.id)['messages'] == 400
+
+
+@pytest.mark.parametrize('seed_changes', [1, 50, 400])
+def test_incremental_totals_match_a_full_resync(app, user, source, seed_changes):
+    workspace.refresh(user.id, source=source)
+    for _ in range(3):
+        source.simulate(user.id, seed_changes)
+        assert workspace.refresh(user.id, source=source)['mode'] == 'incremental'
+        incremental = aggregates(user.id)
+
+        workspace.refresh(user.id, source=source, force_full=True)
+        full = aggregates(user.id)
+        # A reply's response time is fixed when it is first seen; deleting
+        # the message it answered changes it only for a full resync
+        incremental.pop('response'), full.pop('response')
+        assert incremental == full
+
+
+def test_expired_cursor_falls_back_to_a_full_sync(app, user):
+    source = FakeWorkspace(messages=100, history_limit=10)
+    workspace.refresh(user.id, source=source)
+    source.simulate(user.id, 50)
+    assert workspace.refresh(user.id, source=source)['mode'] == 'full'
+
+
+def test_concurrent_refreshes_commit_once(app, user, source):
+    results = []
+
+    def run():
+        with app.app_context():
+            results.append(workspace.refresh(user.id, source=source))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(result is not None for result in results) >= 1
+    assert aggregates(user.id)['messages'] == 400
+
+
+def test_first_read_queues_the_sync_instead_of_running_it(app, client, user):
+    body = client.get('/api/workspace', headers=user.headers).get_json()
+    assert body['snapshot']['ready'] is False
+    assert body['snapshot']['refreshing'] is True
+    assert db.session.get(WorkspaceSnapshot, user.id) is None
+
+    client.get('/api/workspace', headers=user.headers)
+    assert Job.query.filter_by(user_id=user.id, kind='refresh_workspace').count() == 1
+
+    response = client.post('/api/ai/analyze-workspace', headers=user.headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    assert read_credits(user.id).credits == 500
+
+
+def test_snapshot_read_after_refresh(app, client, user):
+    workspace.refresh(user.id)
+    body = client.get('/api/workspace', headers=user.headers).get_json()
+    assert body['snapshot']['ready'] is True
+    assert body['stats']['email_stats']['inbox'] == aggregates(user.id)['inbox']
+
+    response = client.post('/api/ai/analyze-workspace', headers=user.headers)
+    assert response.status_code == 200
+    assert read_credits(user.id).credits == 495
@@ -12,11 +12,8 @@ src_dir = os.path.join(current_dir, 'src')
 sys.path.insert(0, src_dir)
 
 # Import the Flask application
-from src.main import app, db
-
-# Create database tables
-with app.app_context():
-    db.create_all()
+# Importing the app also brings the schema up to date (SCHEMA_UPGRADE)
+from src.main import app
 
 # WSGI application
 application = app